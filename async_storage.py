@@ -0,0 +1,194 @@
+"""
+An asyncio facade over a storage, for serving the catalog from an asyncio service.
+
+AsyncStorage returns data instead of printing it and never prompts.
+Loading and saving the file run in a thread pool, so the event loop
+keeps serving other clients in the meantime:
+
+    storage = AsyncStorage(StorageJson("movies.json"))
+    await storage.warm_up()
+    movies = await storage.search("knight", limit=10)
+    await storage.update_movie("Titanic", 8.0)
+
+Reads work on the in-memory snapshot on the event loop thread. Before
+a read the file's signature is checked in the pool, and concurrent
+readers share one in-flight reload when the file changed. Writes are
+serialized by an asyncio.Lock: a write changes the snapshot on the loop
+and the snapshot is saved in the pool while holding the lock, so it is
+never changed while it is being saved. Writes that queue up during a
+save are coalesced into the next one.
+"""
+import asyncio
+import functools
+from concurrent.futures import ThreadPoolExecutor
+from flush_policy import Manual
+
+
+class AsyncStorage:
+    def __init__(self, storage, executor=None):
+        """
+        Args:
+            storage (IStorage): A StorageJson or StorageCsv. Its mutations
+                are only saved by this facade from now on.
+            executor (Executor): The pool for file I/O, by default a new
+                pool of 4 threads that close() shuts down.
+        """
+        self._storage = storage
+        self._own_executor = executor is None
+        self._executor = executor or ThreadPoolExecutor(4, thread_name_prefix="storage-io")
+        self._write_lock = asyncio.Lock()
+        self._refreshing = None
+        self._next_save = None
+        storage.set_flush_policy(Manual())
+
+    async def _run(self, function, *args):
+        loop = asyncio.get_running_loop()
+        return await loop.run_in_executor(self._executor, functools.partial(function, *args))
+
+    async def _refresh(self):
+        """
+        Reloads the snapshot in the pool if the file changed, sharing one
+        reload between all the readers waiting for it.
+        """
+        if self._refreshing is None:
+            self._refreshing = asyncio.ensure_future(self._reload_if_changed())
+            self._refreshing.add_done_callback(self._refresh_done)
+        await asyncio.shield(self._refreshing)
+
+    def _refresh_done(self, task):
+        self._refreshing = None
+
+    async def _reload_if_changed(self):
+        storage = self._storage
+        if storage._dirty:
+            return
+        signature = await self._run(storage._file_signature)
+        if storage._movies_data is not None and signature == storage._cache_signature:
+            return
+        movies_data = await self._run(storage.load_movies_data)
+        storage._replace_snapshot(movies_data, signature)
+
+    async def _write(self, mutation, *args):
+        """
+        Applies one mutation and returns once it was saved.
+
+        The writes waiting for the lock while a save runs are applied one
+        after another and then saved together by the next save.
+        """
+        async with self._write_lock:
+            await self._refresh()
+            result = mutation(*args)
+            if self._next_save is None:
+                self._next_save = asyncio.get_running_loop().create_future()
+                asyncio.ensure_future(self._save())
+            saved = self._next_save
+        await saved
+        return result
+
+    async def _save(self):
+        """
+        Saves the snapshot in the pool, holding the lock so no write
+        changes it in the meantime.
+        """
+        async with self._write_lock:
+            saved, self._next_save = self._next_save, None
+            try:
+                await self._run(self._storage.flush)
+            except Exception as error:
+                saved.set_exception(error)
+            else:
+                saved.set_result(None)
+
+    async def warm_up(self):
+        """
+        Loads the catalog and builds the search and rating indexes in the
+        pool, so the first search or sort doesn't block the event loop.
+        """
+        async with self._write_lock:
+            await self._refresh()
+            await self._run(self._storage.search, "", 1)
+            await self._run(self._storage.top_rated, 1)
+
+    async def movies(self):
+        """
+        Returns:
+            dict: A copy of the whole catalog.
+        """
+        await self._refresh()
+        return {title: dict(info) for title, info in self._storage.iter_movies()}
+
+    async def get_movie(self, title):
+        """
+        Returns:
+            dict: The movie_info of title, or None if it isn't in the catalog.
+        """
+        await self._refresh()
+        movie_info = self._storage.get_movies_data().get(title)
+        return dict(movie_info) if movie_info is not None else None
+
+    async def search(self, query, limit=None, mode="substring"):
+        await self._refresh()
+        return self._storage.search(query, limit, mode)
+
+    async def query(self, where=None, order_by=None, limit=None, fields=None, offset=0):
+        await self._refresh()
+        return self._storage.query(where, order_by, limit, fields, offset)
+
+    async def top_rated(self, n=None, offset=0):
+        await self._refresh()
+        return self._storage.top_rated(n, offset)
+
+    async def rating_stats(self):
+        await self._refresh()
+        return self._storage.rating_stats()
+
+    async def rating_distribution(self):
+        await self._refresh()
+        return self._storage.rating_distribution()
+
+    async def random_movie(self):
+        await self._refresh()
+        return self._storage.random_movie()
+
+    async def add_movie(self, title, year, rating, poster):
+        """
+        Returns:
+            bool: True if the movie was added, False if the title already exists.
+        """
+        return await self._write(self._storage.insert_movie, title, year, rating, poster)
+
+    async def add_movies(self, movies):
+        """
+        Adds many movies with a single save.
+
+        Returns:
+            int: The number of movies that were added.
+        """
+        def insert_all():
+            return sum(self._storage.insert_movie(*movie) for movie in movies)
+        return await self._write(insert_all)
+
+    async def delete_movie(self, title):
+        """
+        Deletes a movie without asking for confirmation.
+
+        Returns:
+            bool: True if the movie was deleted, False if it wasn't found.
+        """
+        return await self._write(self._storage.remove_movie, title)
+
+    async def update_movie(self, title, rating):
+        """
+        Returns:
+            bool: True if the movie was updated, False if it wasn't found.
+        """
+        return await self._write(self._storage.set_rating, title, rating)
+
+    async def close(self):
+        """
+        Saves anything pending and shuts down the pool if this facade created it.
+        """
+        async with self._write_lock:
+            await self._run(self._storage.flush)
+        if self._own_executor:
+            self._executor.shutdown()
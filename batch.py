@@ -0,0 +1,89 @@
+"""
+Non-interactive batch mode.
+
+Reads a JSONL stream of operations, applies them to a storage inside one
+transaction (one load, one save) and writes one JSONL result per operation.
+
+Every operation is a JSON object with an "op" field:
+
+    {"op": "add", "title": "Heat", "year": 1995, "rating": 8.3, "poster": "..."}
+    {"op": "update", "title": "Heat", "rating": 8.5}
+    {"op": "delete", "title": "Heat"}
+    {"op": "search", "query": "heat", "limit": 10, "mode": "substring"}
+    {"op": "query", "where": {"year": [1990, 1999]}, "order_by": "-rating", "limit": 20,
+     "fields": ["rating", "year"]}
+    {"op": "stats"}
+
+An optional "id" field is copied to the result. Results look like
+{"ok": true, ...}, or {"ok": false, "error": "..."} for invalid operations.
+"""
+import json
+
+# Movie records of a CompactCatalog are mappings, not dicts.
+_encoder = json.JSONEncoder(default=dict)
+
+
+def _apply(storage, request):
+    """
+    Applies one operation to storage.
+
+    Returns:
+        dict: The result of the operation.
+    """
+    op = request["op"]
+    if op == "add":
+        added = storage.insert_movie(request["title"], request["year"],
+                                     request["rating"], request.get("poster"))
+        return {"ok": added} if added else {"ok": False, "error": "already exists"}
+    if op == "update":
+        updated = storage.set_rating(request["title"], request["rating"])
+        return {"ok": updated} if updated else {"ok": False, "error": "not found"}
+    if op == "delete":
+        deleted = storage.remove_movie(request["title"])
+        return {"ok": deleted} if deleted else {"ok": False, "error": "not found"}
+    if op == "search":
+        movies = storage.search(request["query"], request.get("limit"),
+                                request.get("mode", "substring"))
+        return {"ok": True, "results": [dict(info, title=title) for title, info in movies]}
+    if op == "query":
+        movies = storage.query(request.get("where"), request.get("order_by"),
+                               request.get("limit"), request.get("fields"),
+                               request.get("offset", 0))
+        return {"ok": True, "results": [dict(info, title=title) for title, info in movies]}
+    if op == "stats":
+        return {"ok": True, "stats": storage.rating_stats()}
+    raise ValueError(f"unknown op: {op}")
+
+
+def run_batch(storage, requests, results):
+    """
+    Applies a stream of JSONL operations to storage and writes the results.
+
+    All the mutations happen inside storage.transaction(), so the storage
+    is saved once at the end instead of once per operation. An invalid
+    operation is reported in its result and doesn't stop the batch.
+
+    Args:
+        storage (IStorage): The storage to work on.
+        requests (iterable): JSONL lines, e.g. an open file or sys.stdin.
+        results (file): Where the JSONL results are written.
+
+    Returns:
+        int: The number of operations that were processed.
+    """
+    processed = 0
+    with storage.transaction():
+        for line in requests:
+            if not line.strip():
+                continue
+            request = {}
+            try:
+                request = json.loads(line)
+                result = _apply(storage, request)
+            except (ValueError, KeyError, TypeError) as error:
+                result = {"ok": False, "error": str(error)}
+            if isinstance(request, dict) and "id" in request:
+                result["id"] = request["id"]
+            results.write(_encoder.encode(result) + "\n")
+            processed += 1
+    return processed
@@ -0,0 +1,92 @@
+"""
+Load test of AsyncStorage under concurrent clients.
+
+Every client runs a mix of reads (search, top_rated, get_movie, stats)
+and rating updates against one AsyncStorage for a fixed time. The
+throughput and latency percentiles are reported per concurrency level.
+
+Usage:
+    python -m benchmarks.async_load [--movies 50000] [--clients 1 10 100]
+        [--seconds 3] [--write-ratio 0.05]
+"""
+import argparse
+import asyncio
+import os
+import random
+import sys
+import tempfile
+import time
+
+from async_storage import AsyncStorage
+from benchmarks.catalogs import WORDS, synthetic_movies, write_json_catalog
+from storage_json import StorageJson
+
+
+async def client(storage, titles, deadline, write_ratio, rng, latencies):
+    while time.perf_counter() < deadline:
+        start = time.perf_counter()
+        choice = rng.random()
+        if choice < write_ratio:
+            operation = "update"
+            await storage.update_movie(rng.choice(titles), round(rng.uniform(1, 10), 1))
+        elif choice < 0.4:
+            operation = "search"
+            await storage.search(rng.choice(WORDS), limit=20)
+        elif choice < 0.7:
+            operation = "get_movie"
+            await storage.get_movie(rng.choice(titles))
+        elif choice < 0.9:
+            operation = "top_rated"
+            await storage.top_rated(20, rng.randrange(100))
+        else:
+            operation = "rating_stats"
+            await storage.rating_stats()
+        latencies.setdefault(operation, []).append(time.perf_counter() - start)
+
+
+def percentile(ordered, percent):
+    return ordered[min(len(ordered) - 1, int(len(ordered) * percent / 100))]
+
+
+async def run_level(path, titles, clients, seconds, write_ratio):
+    storage = AsyncStorage(StorageJson(path))
+    await storage.warm_up()
+    latencies = {}
+    deadline = time.perf_counter() + seconds
+    await asyncio.gather(*(client(storage, titles, deadline, write_ratio,
+                                  random.Random(seed), latencies)
+                           for seed in range(clients)))
+    await storage.close()
+    return latencies
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--movies", type=int, default=50000, help="size of the catalog")
+    parser.add_argument("--clients", type=int, nargs="+", default=[1, 10, 100],
+                        help="concurrency levels to test")
+    parser.add_argument("--seconds", type=float, default=3.0, help="duration of every level")
+    parser.add_argument("--write-ratio", type=float, default=0.05,
+                        help="share of the requests that update a rating")
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as directory:
+        path = os.path.join(directory, "movies.json")
+        write_json_catalog(path, synthetic_movies(args.movies))
+        titles = list(StorageJson(path).get_movies_data())
+        print(f"{args.movies} movies, {args.write_ratio:.0%} writes, {args.seconds:g}s per level")
+        for clients in args.clients:
+            latencies = asyncio.run(run_level(path, titles, clients, args.seconds,
+                                              args.write_ratio))
+            total = sum(len(values) for values in latencies.values())
+            print(f"{clients} clients: {total / args.seconds:,.0f} requests/s")
+            for operation, values in sorted(latencies.items()):
+                values.sort()
+                print(f"  {operation:<13}{len(values):>8} requests   "
+                      f"p50 {percentile(values, 50) * 1000:8.2f} ms   "
+                      f"p99 {percentile(values, 99) * 1000:8.2f} ms")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,64 @@
+"""
+Synthetic catalogs for the benchmarks.
+
+The movies are generated lazily and written row by row, so even a
+10M title catalog never has to fit in memory to be created.
+"""
+import csv
+import json
+import random
+
+from storage_csv import FIELDNAMES
+
+WORDS = ("Dark", "Knight", "Return", "King", "Star", "War", "Love", "Night", "City",
+         "Lost", "Dream", "Secret", "Fire", "Ice", "Ghost", "River", "Last", "First",
+         "Man", "Woman", "Story", "Road", "Sun", "Moon", "Time", "Blood", "Heart",
+         "Game", "Shadow", "Empire")
+
+
+def synthetic_movies(movies, seed=0):
+    """
+    Yields (title, movie_info) tuples with random titles, ratings, years
+    and posters. Every title ends with its number, so titles are unique.
+    """
+    rng = random.Random(seed)
+    for i in range(movies):
+        words = " ".join(rng.choice(WORDS) for _ in range(rng.randint(1, 3)))
+        yield f"{words} {i}", {
+            "rating": round(rng.uniform(1, 10), 1),
+            "year": rng.randint(1920, 2024),
+            "poster": f"https://m.media-amazon.com/images/M/{rng.getrandbits(64):016x}.jpg"
+        }
+
+
+def synthetic_catalog(movies, seed=0):
+    """
+    Returns a synthetic catalog as a dict of dicts.
+    """
+    return dict(synthetic_movies(movies, seed))
+
+
+def write_json_catalog(file_path, movies):
+    """
+    Writes (title, movie_info) tuples to a JSON catalog, one entry at a time.
+    """
+    with open(file_path, "w") as file_obj:
+        separator = "{"
+        for title, movie_info in movies:
+            file_obj.write(separator + json.dumps(title) + ":" + json.dumps(movie_info))
+            separator = ","
+        file_obj.write("{}" if separator == "{" else "}")
+
+
+def write_csv_catalog(file_path, movies):
+    """
+    Writes (title, movie_info) tuples to a CSV catalog.
+    """
+    with open(file_path, "w", newline="") as file_obj:
+        writer = csv.writer(file_obj)
+        writer.writerow(FIELDNAMES)
+        writer.writerows([title, info["rating"], info["year"], info["poster"]]
+                         for title, info in movies)
+
+
+WRITERS = {"json": write_json_catalog, "csv": write_csv_catalog}
@@ -0,0 +1,117 @@
+"""
+Stress test of many processes writing to one catalog file.
+
+Every worker process opens its own storage on the same file and, in
+rounds, adds movies of its own and updates the ratings of movies that
+only it touches, each change saved on its own (or in transactions with
+--transactions). Afterwards the file must contain every worker's last
+change. Lost updates are listed and the exit status is 1.
+
+Usage:
+    python -m benchmarks.concurrency_stress [--backend json] [--workers 8]
+        [--rounds 50] [--journal] [--transactions]
+"""
+import argparse
+import os
+import sys
+import tempfile
+import time
+from multiprocessing import Pool
+
+from benchmarks.catalogs import synthetic_movies, write_csv_catalog, write_json_catalog
+from storage_csv import StorageCsv
+from storage_json import StorageJson
+from storage_sqlite import StorageSqlite
+
+INITIAL_MOVIES = 1000
+
+
+def open_storage(backend, path, journal):
+    if backend == "json":
+        return StorageJson(path, journal=journal, compact_threshold=20)
+    if backend == "csv":
+        return StorageCsv(path)
+    return StorageSqlite(path)
+
+
+def worker(args):
+    """
+    Adds and updates the movies of one worker.
+
+    Returns:
+        dict: title -> the rating this worker saved last.
+    """
+    backend, path, journal, transactions, worker_id, workers, rounds = args
+    storage = open_storage(backend, path, journal)
+    # The initial movies are split between the workers, so no two
+    # workers update the same movie.
+    own_titles = [title for i, (title, _) in enumerate(synthetic_movies(INITIAL_MOVIES))
+                  if i % workers == worker_id]
+    expected = {}
+    for round_number in range(rounds):
+        rating = float(round_number % 10)
+        title = f"Worker {worker_id} Movie {round_number}"
+        updated = own_titles[round_number % len(own_titles)]
+        if transactions:
+            with storage.transaction():
+                storage.insert_movie(title, 2000, rating, "N/A")
+                storage.set_rating(updated, rating)
+        else:
+            storage.insert_movie(title, 2000, rating, "N/A")
+            storage.set_rating(updated, rating)
+        expected[title] = rating
+        expected[updated] = rating
+    if hasattr(storage, "close"):
+        storage.close()
+    return expected
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--backend", choices=("json", "csv", "sqlite"), default="json")
+    parser.add_argument("--workers", type=int, default=8, help="number of processes")
+    parser.add_argument("--rounds", type=int, default=50, help="changes per process")
+    parser.add_argument("--journal", action="store_true",
+                        help="use the JSON journal log instead of full rewrites")
+    parser.add_argument("--transactions", action="store_true",
+                        help="group every add and update in a transaction")
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as directory:
+        path = os.path.join(directory, f"movies.{'db' if args.backend == 'sqlite' else args.backend}")
+        if args.backend == "json":
+            write_json_catalog(path, synthetic_movies(INITIAL_MOVIES))
+        elif args.backend == "csv":
+            write_csv_catalog(path, synthetic_movies(INITIAL_MOVIES))
+        else:
+            StorageSqlite(path).add_movies(
+                (title, info["year"], info["rating"], info["poster"])
+                for title, info in synthetic_movies(INITIAL_MOVIES))
+
+        jobs = [(args.backend, path, args.journal, args.transactions, worker_id,
+                 args.workers, args.rounds) for worker_id in range(args.workers)]
+        start = time.perf_counter()
+        with Pool(args.workers) as pool:
+            results = pool.map(worker, jobs)
+        elapsed = time.perf_counter() - start
+
+        movies_data = open_storage(args.backend, path, args.journal).get_movies_data()
+        lost = [(title, rating, movies_data.get(title, {}).get("rating"))
+                for expected in results for title, rating in expected.items()
+                if title not in movies_data or movies_data[title]["rating"] != rating]
+
+    changes = 2 * args.workers * args.rounds
+    print(f"{args.backend}{' (journal)' if args.journal else ''}: {args.workers} processes, "
+          f"{changes} changes in {elapsed:.2f}s ({changes / elapsed:,.0f}/s), "
+          f"{len(movies_data)} movies")
+    for title, rating, found in lost[:20]:
+        print(f"LOST: {title}: expected {rating}, found {found}")
+    if lost:
+        print(f"{len(lost)} lost updates")
+        return 1
+    print("no lost updates")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
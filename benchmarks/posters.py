@@ -0,0 +1,164 @@
+"""
+Throughput of fetching and validating posters against a local HTTP server.
+
+PosterServer stands in for the poster CDN: it serves generated images
+for /poster/<n>.jpg on 127.0.0.1 with kept-alive connections, an
+optional delay per request, and 404s for a share of the posters. A
+synthetic catalog pointing at it (with some truncated URLs, like the
+ones in movies.json) is validated, fetched into an empty cache and
+fetched again from the cache, at every concurrency level.
+
+Usage:
+    python -m benchmarks.posters [--posters 500] [--concurrency 1 8 32]
+        [--delay 0.01] [--broken 0.05] [--rate 200]
+"""
+import argparse
+import asyncio
+import os
+import sys
+import tempfile
+import threading
+import time
+import zlib
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+from benchmarks.catalogs import synthetic_movies, write_json_catalog
+from posters import PosterCache, PosterFetcher, validate_storage
+from storage_json import StorageJson
+
+
+class PosterServer:
+    """
+    A local HTTP server serving generated poster images, used as a
+    context manager:
+
+        with PosterServer(delay=0.01, broken=0.05) as server:
+            url = server.url(42)
+    """
+
+    def __init__(self, image_size=20000, delay=0.0, broken=0.0):
+        """
+        Args:
+            image_size (int): The bytes of every image.
+            delay (float): Seconds every request waits before answering.
+            broken (float): The share of the posters answered with 404.
+        """
+        self.requests = 0
+        self.connections = 0
+        server = self
+
+        class Handler(BaseHTTPRequestHandler):
+            protocol_version = "HTTP/1.1"
+            # The headers and the body are written separately, which
+            # stalls on delayed ACKs of kept-alive connections otherwise.
+            disable_nagle_algorithm = True
+
+            def setup(self):
+                super().setup()
+                server.connections += 1
+
+            def _answer(self, send_body):
+                server.requests += 1
+                if delay:
+                    time.sleep(delay)
+                name = os.path.basename(self.path)
+                number = name.split(".")[0]
+                if not number.isdigit() or zlib.crc32(number.encode()) % 1000 < broken * 1000:
+                    self.send_error(404)
+                    return
+                body = number.encode().ljust(image_size, b"\0")
+                self.send_response(200)
+                self.send_header("Content-Type", "image/jpeg")
+                self.send_header("Content-Length", str(len(body)))
+                self.end_headers()
+                if send_body:
+                    self.wfile.write(body)
+
+            def do_GET(self):
+                self._answer(True)
+
+            def do_HEAD(self):
+                self._answer(False)
+
+            def log_message(self, format, *args):
+                pass
+
+        self._server = ThreadingHTTPServer(("127.0.0.1", 0), Handler)
+        self._server.daemon_threads = True
+        self._thread = threading.Thread(target=self._server.serve_forever, daemon=True)
+
+    def url(self, number):
+        return f"http://127.0.0.1:{self._server.server_port}/poster/{number}.jpg"
+
+    def __enter__(self):
+        self._thread.start()
+        return self
+
+    def __exit__(self, *exc_info):
+        self._server.shutdown()
+        self._server.server_close()
+
+
+def poster_catalog(path, server, posters, truncated=0.02):
+    """
+    Writes a catalog whose posters point at server, a share of them
+    truncated with "…".
+    """
+    movies = []
+    for number, (title, movie_info) in enumerate(synthetic_movies(posters)):
+        url = server.url(number)
+        if number % int(1 / truncated) == 0:
+            url = url[:30] + "…"
+        movies.append((title, dict(movie_info, poster=url)))
+    write_json_catalog(path, movies)
+
+
+async def measure(fetcher, storage, phase):
+    start = time.perf_counter()
+    if phase == "validate":
+        results = list((await validate_storage(storage, fetcher)).values())
+    else:
+        urls = [movie_info['poster'] for _, movie_info in storage.iter_movies()]
+        results = await fetcher.fetch_all(urls)
+    elapsed = time.perf_counter() - start
+    counts = {}
+    for result in results:
+        counts[result["status"]] = counts.get(result["status"], 0) + 1
+    return elapsed, counts
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--posters", type=int, default=500, help="posters in the catalog")
+    parser.add_argument("--concurrency", type=int, nargs="+", default=[1, 8, 32],
+                        help="concurrency levels to test")
+    parser.add_argument("--delay", type=float, default=0.01, help="server delay per request")
+    parser.add_argument("--broken", type=float, default=0.05, help="share of 404 posters")
+    parser.add_argument("--rate", type=float, help="maximum requests per second")
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as directory, \
+            PosterServer(delay=args.delay, broken=args.broken) as server:
+        path = os.path.join(directory, "movies.json")
+        poster_catalog(path, server, args.posters)
+        storage = StorageJson(path)
+        print(f"{args.posters} posters, {args.delay * 1000:g} ms server delay, "
+              f"{args.broken:.0%} broken")
+        for concurrency in args.concurrency:
+            cache = PosterCache(os.path.join(directory, f"cache-{concurrency}"))
+            print(f"concurrency {concurrency}:")
+            for phase in ("validate", "fetch", "cached"):
+                fetcher = PosterFetcher(cache, concurrency, args.rate)
+                requests, connections = server.requests, server.connections
+                elapsed, counts = asyncio.run(measure(fetcher, storage, phase))
+                fetcher.close()
+                summary = ", ".join(f"{count} {status}" for status, count in sorted(counts.items()))
+                print(f"  {phase:<9}{args.posters / elapsed:10,.0f} posters/s   "
+                      f"{server.requests - requests:6} requests over "
+                      f"{server.connections - connections:4} connections   {summary}")
+            cache.save()
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,59 @@
+"""
+Load/save throughput of the StorageJson serializers.
+
+Writes a synthetic catalog with every available serializer and reports
+the file size and the best save and load times and throughput.
+
+Usage:
+    python -m benchmarks.serialization [--movies 100000] [--runs 3]
+"""
+import argparse
+import os
+import sys
+import tempfile
+import time
+
+from benchmarks.catalogs import synthetic_catalog
+from serializers import SERIALIZERS, msgpack, orjson
+from storage_json import StorageJson
+
+
+def best_time(function, runs):
+    best = float("inf")
+    for _ in range(runs):
+        start = time.perf_counter()
+        function()
+        best = min(best, time.perf_counter() - start)
+    return best
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--movies", type=int, default=100000, help="size of the catalog")
+    parser.add_argument("--runs", type=int, default=3, help="number of timed runs")
+    args = parser.parse_args()
+
+    catalog = synthetic_catalog(args.movies)
+    serializers = [("json (compact)", "json", False), ("json (pretty)", "json", True)]
+    serializers += [(name, name, False) for name in SERIALIZERS
+                    if name != "json" and (name != "msgpack" or msgpack is not None)]
+    print(f"{args.movies} movies, JSON backend: {'orjson' if orjson else 'json'}, "
+          f"best of {args.runs}")
+    print(f"{'format':<16}{'size MB':>10}{'save s':>10}{'load s':>10}{'save MB/s':>12}{'load MB/s':>12}")
+    with tempfile.TemporaryDirectory() as directory:
+        path = os.path.join(directory, "catalog")
+        for label, name, pretty in serializers:
+            # StorageJson opens an existing file, so start from an empty catalog.
+            with open(path, "wb") as file_obj:
+                file_obj.write(SERIALIZERS[name]().dumps({}))
+            storage = StorageJson(path, serializer=name, pretty=pretty)
+            save = best_time(lambda: storage.save_data(catalog), args.runs)
+            load = best_time(storage.load_movies_data, args.runs)
+            size = os.path.getsize(path) / 1e6
+            print(f"{label:<16}{size:>10.1f}{save:>10.3f}{load:>10.3f}"
+                  f"{size / save:>12.1f}{size / load:>12.1f}")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
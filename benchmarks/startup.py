@@ -0,0 +1,91 @@
+"""
+Startup benchmark for main.py.
+
+Imports main in a fresh interpreter with `python -X importtime` and
+reports how long the import takes and which modules are the slowest.
+It exits with status 1 when a heavy module (matplotlib, numpy) is
+imported at startup or the import takes longer than the budget, so it
+can guard against regressions in scripted runs.
+
+Usage:
+    python -m benchmarks.startup [--runs 5] [--budget-ms 150]
+"""
+import argparse
+import os
+import subprocess
+import sys
+import time
+
+REPO_ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+# Modules that must only be imported when a command needs them.
+FORBIDDEN_MODULES = ("matplotlib", "numpy")
+
+
+def import_times(module="main"):
+    """
+    Imports module in a fresh interpreter with -X importtime.
+
+    Returns:
+        dict: Module name -> (self time, cumulative time) in microseconds.
+    """
+    result = subprocess.run(
+        [sys.executable, "-X", "importtime", "-c", f"import {module}"],
+        cwd=REPO_ROOT, capture_output=True, text=True, check=True)
+    times = {}
+    for line in result.stderr.splitlines():
+        if not line.startswith("import time:") or "|" not in line:
+            continue
+        self_us, cumulative_us, name = line[len("import time:"):].split("|")
+        if not self_us.strip().isdigit():
+            continue
+        times[name.strip()] = (int(self_us), int(cumulative_us))
+    return times
+
+
+def wall_time(code, runs):
+    """
+    Returns the fastest wall clock time of running code in a fresh interpreter, in seconds.
+    """
+    best = float("inf")
+    for _ in range(runs):
+        start = time.perf_counter()
+        subprocess.run([sys.executable, "-c", code], cwd=REPO_ROOT, check=True)
+        best = min(best, time.perf_counter() - start)
+    return best
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--runs", type=int, default=5,
+                        help="number of interpreter launches to time")
+    parser.add_argument("--budget-ms", type=float, default=150.0,
+                        help="maximum cumulative import time of main")
+    args = parser.parse_args()
+
+    times = import_times()
+    main_ms = times["main"][1] / 1000
+    print(f"import main: {main_ms:.1f} ms (cumulative)")
+    print("slowest modules (self time):")
+    for name, (self_us, _) in sorted(times.items(), key=lambda item: -item[1][0])[:10]:
+        print(f"  {self_us / 1000:8.1f} ms  {name}")
+
+    baseline = wall_time("pass", args.runs)
+    startup = wall_time("import main", args.runs)
+    print(f"interpreter startup: {baseline * 1000:.1f} ms, "
+          f"with main: {startup * 1000:.1f} ms (best of {args.runs})")
+
+    failures = []
+    imported = [name for name in times
+                if name.split(".")[0] in FORBIDDEN_MODULES]
+    if imported:
+        failures.append(f"heavy modules imported at startup: {', '.join(sorted(imported))}")
+    if main_ms > args.budget_ms:
+        failures.append(f"import main took {main_ms:.1f} ms, budget is {args.budget_ms:.1f} ms")
+    for failure in failures:
+        print(f"FAIL: {failure}")
+    return 1 if failures else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
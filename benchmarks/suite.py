@@ -0,0 +1,286 @@
+"""
+Benchmark suite for the storage backends and the MovieApp commands.
+
+Generates synthetic JSON and CSV catalogs, then times loading, the read
+operations (search, sort, stats, histogram, random), the mutations (add,
+update, delete) and the MovieApp commands on them. Commands that prompt
+are fed scripted answers instead of reading stdin. Peak memory is
+measured with tracemalloc on an extra untimed run of every read operation.
+
+Results are written as JSON. Pass an earlier result file with --compare
+to list the operations that got slower; the exit status is 1 then.
+
+Usage:
+    python -m benchmarks.suite [--sizes 10000 100000] [--backends json csv]
+        [--runs 3] [--mutations 10] [--output results.json]
+        [--compare baseline.json] [--threshold 1.25]
+"""
+import argparse
+import contextlib
+import json
+import os
+import platform
+import sys
+import tempfile
+import time
+import tracemalloc
+from unittest import mock
+
+import rating_analytics
+from benchmarks.catalogs import WRITERS, synthetic_movies
+from movie_app import MovieApp
+from storage_csv import StorageCsv
+from storage_json import StorageJson
+
+try:
+    import resource
+except ImportError:
+    resource = None
+
+STORAGE_CLASSES = {"json": StorageJson, "csv": StorageCsv}
+
+
+def best_time(function, runs):
+    """
+    Returns the fastest of runs calls of function, in seconds.
+    """
+    best = float("inf")
+    for _ in range(runs):
+        start = time.perf_counter()
+        function()
+        best = min(best, time.perf_counter() - start)
+    return best
+
+
+def peak_memory(function):
+    """
+    Returns the peak of the memory allocated while function runs, in bytes.
+    """
+    tracemalloc.start()
+    try:
+        function()
+        return tracemalloc.get_traced_memory()[1]
+    finally:
+        tracemalloc.stop()
+
+
+def max_rss():
+    """
+    Returns the peak resident set size of the process in bytes, or None
+    where the resource module isn't available.
+    """
+    if resource is None:
+        return None
+    rss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # Linux reports kilobytes, macOS bytes.
+    return rss if sys.platform == "darwin" else rss * 1024
+
+
+@contextlib.contextmanager
+def scripted(*answers):
+    """
+    Answers the prompts of a MovieApp command with answers and discards
+    its output, so commands run without a terminal.
+    """
+    with open(os.devnull, "w") as devnull, \
+            mock.patch("builtins.input", side_effect=list(answers)), \
+            contextlib.redirect_stdout(devnull):
+        yield
+
+
+def app_command(app, command, *answers):
+    def run():
+        with scripted(*answers):
+            app.command(command)
+    return run
+
+
+def read_operations(storage, app, directory):
+    """
+    Returns (name, function) pairs of the operations that don't change the catalog.
+    """
+    histogram_file = os.path.join(directory, "histogram.csv")
+    return [
+        ("search (first, builds index)", lambda: storage.search("Knight 1", limit=20)),
+        ("search", lambda: storage.search("Shadow Moon", limit=20)),
+        ("search prefix", lambda: storage.search("Dark", limit=20, mode="prefix")),
+        ("top_rated", lambda: storage.top_rated(20)),
+        ("rating_stats", storage.rating_stats),
+        ("histogram", lambda: rating_analytics.histogram(storage.ratings_array())),
+        ("random_movie", storage.random_movie),
+        ("app: list", app_command(app, 1)),
+        ("app: stats", app_command(app, 5)),
+        ("app: random", app_command(app, 6)),
+        ("app: search", app_command(app, 7, "Knight")),
+        ("app: sorted", app_command(app, 8, "N")),
+        ("app: histogram", app_command(app, 9, histogram_file))
+    ]
+
+
+def mutation_operations(storage, app, mutations):
+    """
+    Returns (name, function) pairs of operations that each make mutations changes.
+
+    They run in order: what one adds, the next ones update and delete.
+    """
+    titles = [f"Benchmark Movie {i}" for i in range(mutations)]
+
+    def add():
+        for title in titles:
+            storage.insert_movie(title, 2000, 5.0, "N/A")
+
+    def update():
+        for title in titles:
+            storage.set_rating(title, 6.0)
+
+    def delete():
+        for title in titles:
+            storage.remove_movie(title)
+
+    def add_in_transaction():
+        with storage.transaction():
+            add()
+
+    def delete_in_transaction():
+        with storage.transaction():
+            delete()
+
+    def app_add():
+        for title in titles:
+            app_command(app, 2, title, "7.5", "2001", "N/A")()
+
+    def app_update():
+        for title in titles:
+            app_command(app, 4, title, "8.0")()
+
+    def app_delete():
+        for title in titles:
+            app_command(app, 3, title, "Y")()
+
+    return [
+        ("add", add), ("update", update), ("delete", delete),
+        ("add (transaction)", add_in_transaction),
+        ("delete (transaction)", delete_in_transaction),
+        ("app: add", app_add), ("app: update", app_update), ("app: delete", app_delete)
+    ]
+
+
+def benchmark_case(backend, movies, runs, mutations, directory):
+    """
+    Benchmarks one backend on one catalog size.
+
+    Returns:
+        list: One result dict per operation.
+    """
+    storage_class = STORAGE_CLASSES[backend]
+    path = os.path.join(directory, f"catalog_{movies}.{backend}")
+    start = time.perf_counter()
+    WRITERS[backend](path, synthetic_movies(movies))
+    results = [{"operation": "generate", "seconds": time.perf_counter() - start,
+                "peak_bytes": None}]
+
+    results.append({"operation": "load",
+                    "seconds": best_time(lambda: storage_class(path), runs),
+                    "peak_bytes": peak_memory(lambda: storage_class(path))})
+
+    storage = storage_class(path)
+    app = MovieApp(storage)
+    for name, operation in read_operations(storage, app, directory):
+        if "first" in name:
+            # Only the first search builds the index, so it runs once (timed under tracemalloc).
+            start = time.perf_counter()
+            peak = peak_memory(operation)
+            results.append({"operation": name, "seconds": time.perf_counter() - start,
+                            "peak_bytes": peak})
+            continue
+        results.append({"operation": name, "seconds": best_time(operation, runs),
+                        "peak_bytes": peak_memory(operation)})
+
+    if mutations:
+        for name, operation in mutation_operations(storage, app, mutations):
+            start = time.perf_counter()
+            operation()
+            results.append({"operation": name,
+                            "seconds": (time.perf_counter() - start) / mutations,
+                            "peak_bytes": None})
+
+    for result in results:
+        result.update(backend=backend, movies=movies)
+    results.append({"backend": backend, "movies": movies, "operation": "max_rss",
+                    "seconds": None, "peak_bytes": max_rss()})
+    os.remove(path)
+    return results
+
+
+def compare(results, baseline, threshold):
+    """
+    Returns the operations that are more than threshold times slower than in baseline.
+
+    Returns:
+        list: (backend, movies, operation, old seconds, new seconds) tuples.
+    """
+    old = {(r["backend"], r["movies"], r["operation"]): r["seconds"]
+           for r in baseline["results"] if r["seconds"]}
+    slower = []
+    for result in results:
+        key = (result["backend"], result["movies"], result["operation"])
+        if result["seconds"] and key in old and result["seconds"] > old[key] * threshold:
+            slower.append(key + (old[key], result["seconds"]))
+    return slower
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--sizes", type=int, nargs="+", default=[10000, 100000],
+                        help="catalog sizes, e.g. 10000 100000 1000000 10000000")
+    parser.add_argument("--backends", nargs="+", choices=sorted(STORAGE_CLASSES),
+                        default=sorted(STORAGE_CLASSES))
+    parser.add_argument("--runs", type=int, default=3,
+                        help="timed runs of every read operation (the best one counts)")
+    parser.add_argument("--mutations", type=int, default=10,
+                        help="number of adds/updates/deletes to time (0 to skip)")
+    parser.add_argument("--output", default="benchmark_results.json",
+                        help="where to write the results")
+    parser.add_argument("--compare", help="an earlier result file to compare against")
+    parser.add_argument("--threshold", type=float, default=1.25,
+                        help="slowdown factor that counts as a regression")
+    args = parser.parse_args()
+
+    results = []
+    with tempfile.TemporaryDirectory() as directory:
+        for movies in args.sizes:
+            for backend in args.backends:
+                case = benchmark_case(backend, movies, args.runs, args.mutations, directory)
+                results.extend(case)
+                for result in case:
+                    if result["seconds"] is None:
+                        continue
+                    peak = result["peak_bytes"]
+                    memory = f"{peak / 1e6:10.1f} MB" if peak is not None else ""
+                    print(f"{backend:5} {movies:>9} {result['operation']:<30}"
+                          f"{result['seconds'] * 1000:12.3f} ms{memory}")
+
+    report = {
+        "python": platform.python_version(),
+        "platform": platform.platform(),
+        "created": time.strftime("%Y-%m-%dT%H:%M:%S"),
+        "runs": args.runs,
+        "mutations": args.mutations,
+        "results": results
+    }
+    with open(args.output, "w") as file_obj:
+        json.dump(report, file_obj, indent=4)
+    print(f"Results written to {args.output}")
+
+    if args.compare:
+        with open(args.compare, "r") as file_obj:
+            slower = compare(results, json.load(file_obj), args.threshold)
+        for backend, movies, operation, old_seconds, new_seconds in slower:
+            print(f"SLOWER: {backend} {movies} {operation}: "
+                  f"{old_seconds * 1000:.3f} ms -> {new_seconds * 1000:.3f} ms")
+        return 1 if slower else 0
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,220 @@
+"""
+A read-optimized binary snapshot of a catalog, opened with mmap.
+
+Layout (little-endian):
+    header   magic, number of movies, number of hash buckets,
+             offset of the hash table, offset of the string heap
+    records  one fixed-width record per movie: rating, year, flags and
+             the offset and length of the title and poster in the heap
+    hash     open addressing table of row + 1 (0 marks an empty bucket),
+             indexed by the CRC-32 of the UTF-8 title
+    heap     the UTF-8 titles and posters
+
+Because the records have a fixed width, reading row i, picking a random
+movie or looking a title up only touches a few pages of the file, no
+matter how big the catalog is.
+
+Usage:
+    python binary_catalog.py movies.json movies.movcat
+"""
+import mmap
+import random
+import struct
+import sys
+import zlib
+from collections.abc import Mapping
+from file_utils import atomic_write
+
+MAGIC = b"MOVCAT01"
+HEADER = struct.Struct("<8sIIQQ")
+# rating, year, flags, title offset, title length, poster offset, poster length
+RECORD = struct.Struct("<dHHIIII")
+BUCKET = struct.Struct("<I")
+HAS_POSTER = 1
+
+
+def _bucket_count(movies):
+    """
+    Returns the number of hash buckets: a power of two at least twice
+    the number of movies, so probe sequences stay short.
+    """
+    buckets = 1
+    while buckets < 2 * movies:
+        buckets *= 2
+    return buckets
+
+
+def write_binary_catalog(file_path, movies):
+    """
+    Writes movies to file_path in the binary catalog format.
+
+    Args:
+        file_path (str): The snapshot file, replaced atomically.
+        movies (iterable): (title, movie_info) tuples, e.g. IStorage.iter_movies().
+
+    Returns:
+        int: The number of movies written.
+    """
+    records = bytearray()
+    heap = bytearray()
+    hashes = []
+    for title, movie_info in movies:
+        encoded_title = title.encode("utf-8")
+        title_offset = len(heap)
+        heap += encoded_title
+        poster = movie_info.get("poster")
+        flags, poster_offset, poster_length = 0, 0, 0
+        if poster is not None:
+            encoded_poster = poster.encode("utf-8")
+            flags, poster_offset, poster_length = HAS_POSTER, len(heap), len(encoded_poster)
+            heap += encoded_poster
+        records += RECORD.pack(movie_info["rating"], movie_info["year"], flags,
+                               title_offset, len(encoded_title), poster_offset, poster_length)
+        hashes.append(zlib.crc32(encoded_title))
+
+    count = len(hashes)
+    buckets = _bucket_count(count)
+    table = [0] * buckets
+    for row, title_hash in enumerate(hashes):
+        bucket = title_hash & (buckets - 1)
+        while table[bucket]:
+            bucket = (bucket + 1) & (buckets - 1)
+        table[bucket] = row + 1
+
+    hash_offset = HEADER.size + len(records)
+    heap_offset = hash_offset + buckets * BUCKET.size
+    with atomic_write(file_path, mode="wb") as file_obj:
+        file_obj.write(HEADER.pack(MAGIC, count, buckets, hash_offset, heap_offset))
+        file_obj.write(records)
+        file_obj.write(struct.pack(f"<{buckets}I", *table))
+        file_obj.write(heap)
+    return count
+
+
+class BinaryCatalog(Mapping):
+    """
+    A read-only title -> movie_info mapping over a memory-mapped binary catalog.
+
+    Only the pages that are read are loaded by the OS, so opening the
+    catalog is instant and a lookup costs a few page reads.
+    """
+
+    def __init__(self, file_path):
+        """
+        Raises:
+            ValueError: If the file is not a binary catalog.
+        """
+        with open(file_path, "rb") as file_obj:
+            self._mmap = mmap.mmap(file_obj.fileno(), 0, access=mmap.ACCESS_READ)
+        magic, self._count, self._buckets, self._hash_offset, self._heap_offset = \
+            HEADER.unpack_from(self._mmap, 0)
+        if magic != MAGIC:
+            self._mmap.close()
+            raise ValueError(f"{file_path} is not a binary movie catalog")
+
+    def close(self):
+        self._mmap.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
+
+    def _string(self, offset, length):
+        start = self._heap_offset + offset
+        return self._mmap[start:start + length].decode("utf-8")
+
+    def _record(self, row):
+        return RECORD.unpack_from(self._mmap, HEADER.size + row * RECORD.size)
+
+    def _title(self, row):
+        _, _, _, title_offset, title_length, _, _ = self._record(row)
+        return self._string(title_offset, title_length)
+
+    def row(self, row):
+        """
+        Returns the movie at position row.
+
+        Returns:
+            tuple: (title, movie_info).
+
+        Raises:
+            IndexError: If row is out of range.
+        """
+        if not 0 <= row < self._count:
+            raise IndexError("row out of range")
+        rating, year, flags, title_offset, title_length, poster_offset, poster_length = \
+            self._record(row)
+        movie_info = {"rating": rating, "year": year}
+        if flags & HAS_POSTER:
+            movie_info["poster"] = self._string(poster_offset, poster_length)
+        return self._string(title_offset, title_length), movie_info
+
+    def random_movie(self, rng=random):
+        """
+        Picks a random movie in constant time.
+
+        Returns:
+            tuple: (title, movie_info), or None for an empty catalog.
+        """
+        if not self._count:
+            return None
+        return self.row(rng.randrange(self._count))
+
+    def _find(self, title):
+        """
+        Returns the row of title, or None if it isn't in the catalog.
+        """
+        encoded = title.encode("utf-8")
+        mask = self._buckets - 1
+        bucket = zlib.crc32(encoded) & mask
+        while True:
+            (entry,) = BUCKET.unpack_from(self._mmap, self._hash_offset + bucket * BUCKET.size)
+            if not entry:
+                return None
+            _, _, _, title_offset, title_length, _, _ = self._record(entry - 1)
+            start = self._heap_offset + title_offset
+            if title_length == len(encoded) and self._mmap[start:start + title_length] == encoded:
+                return entry - 1
+            bucket = (bucket + 1) & mask
+
+    def __getitem__(self, title):
+        row = self._find(title)
+        if row is None:
+            raise KeyError(title)
+        return self.row(row)[1]
+
+    def __contains__(self, title):
+        return self._find(title) is not None
+
+    def __iter__(self):
+        return (self._title(row) for row in range(self._count))
+
+    def __len__(self):
+        return self._count
+
+    def items(self):
+        return (self.row(row) for row in range(self._count))
+
+    def __repr__(self):
+        return f"{type(self).__name__}({self._count} movies)"
+
+
+def main(argv=None):
+    from storage_factory import open_storage
+    argv = sys.argv[1:] if argv is None else argv
+    if len(argv) != 2:
+        print("Usage: python binary_catalog.py <catalog file> <snapshot file>", file=sys.stderr)
+        return 2
+    opened = open_storage(argv[0])
+    if opened is None:
+        print(f"Unknown catalog format: {argv[0]}", file=sys.stderr)
+        return 2
+    count = opened[1].export_snapshot(argv[1])
+    print(f"Wrote {count} movies to {argv[1]}")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
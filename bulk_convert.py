@@ -0,0 +1,288 @@
+"""
+Loads, validates and converts many catalog files in parallel.
+
+Every file is handled by its own worker process, so several catalogs
+are parsed at the same time on a multi-core machine. CSV and SQLite
+sources are read row by row and CSV and SQLite targets are written in
+batches, so converting between them never holds a whole catalog in
+memory. JSON can't be parsed incrementally with the json module, so
+JSON sources are loaded into memory one file at a time, and a JSON
+target is collected in memory and written once.
+
+Usage:
+    python bulk_convert.py --to csv movies.json john.json
+    python bulk_convert.py --to db --out-dir converted/ catalogs/
+    python bulk_convert.py --validate-only catalogs/
+"""
+import argparse
+import csv
+import json
+import os
+import sys
+import time
+from concurrent.futures import ProcessPoolExecutor, as_completed
+from itertools import islice
+from file_utils import atomic_write
+from storage_factory import STORAGE_TYPES, open_storage
+from storage_registry import MANIFEST as PROFILES_MANIFEST
+from storage_sharded import MANIFEST as SHARDS_MANIFEST
+
+# Number of movies handed to the target storage at a time.
+BATCH_SIZE = 10000
+TARGET_EXTENSIONS = {"json": ".json", "csv": ".csv", "db": ".db", "sqlite": ".sqlite"}
+# JSON files that live next to the catalogs but aren't catalogs themselves,
+# skipped when a directory is expanded.
+NOT_CATALOGS = {PROFILES_MANIFEST, SHARDS_MANIFEST, "catalog.json", "benchmark_results.json"}
+# The files SQLite keeps next to a database in WAL mode.
+SQLITE_SIDECARS = ("-wal", "-shm")
+
+
+def validate_movie(title, movie_info):
+    """
+    Checks one movie of a catalog.
+
+    Returns:
+        str: What is wrong with the movie, or None if it is valid.
+    """
+    if not isinstance(title, str) or not title.strip():
+        return "missing title"
+    if not isinstance(movie_info, dict):
+        return f"{title}: {movie_info!r} is not a movie record"
+    rating = movie_info.get("rating")
+    if isinstance(rating, bool) or not isinstance(rating, (int, float)):
+        return f"{title}: rating {rating!r} is not a number"
+    year = movie_info.get("year")
+    if isinstance(year, bool) or not isinstance(year, int):
+        return f"{title}: year {year!r} is not an integer"
+    poster = movie_info.get("poster")
+    if poster is not None and not isinstance(poster, str):
+        return f"{title}: poster {poster!r} is not a string"
+    return None
+
+
+def _valid_movies(movies, report):
+    """
+    Yields the valid movies as (title, year, rating, poster) tuples
+    and counts the valid and invalid ones in report.
+    """
+    for title, movie_info in movies:
+        problem = validate_movie(title, movie_info)
+        if problem is not None:
+            report["invalid"] += 1
+            if len(report["problems"]) < 5:
+                report["problems"].append(problem)
+            continue
+        report["movies"] += 1
+        yield title, movie_info["year"], movie_info["rating"], movie_info.get("poster")
+
+
+def _parse(convert, value):
+    """
+    Returns convert(value), or value itself if it doesn't parse.
+    """
+    try:
+        return convert(value)
+    except (TypeError, ValueError):
+        return value
+
+
+def _read_csv(file_path):
+    """
+    Reads a CSV catalog row by row like StorageCsv, but keeps a rating or
+    year that doesn't parse as the raw string (and a missing one as None),
+    so validate_movie reports the row instead of the whole file failing.
+
+    Yields:
+        tuple: (title, movie_info) for every row in the file.
+    """
+    with open(file_path, mode='r', newline='') as file_obj:
+        for row in csv.DictReader(file_obj):
+            yield row.get('title'), {'rating': _parse(float, row.get('rating')),
+                                     'year': _parse(int, row.get('year')),
+                                     'poster': row.get('poster')}
+
+
+def _open_streaming(file_path):
+    """
+    Opens a catalog without loading it, when the backend can.
+    """
+    if file_path.lower().endswith(".csv"):
+        return open_storage(file_path, streaming=True)[1]
+    return open_storage(file_path)[1]
+
+
+def _write_json(target, movies):
+    """
+    Writes the movies to a new JSON catalog with a single write.
+
+    Adding them in batches would rewrite the whole file for every batch.
+    Like add_movies, the first movie with a title wins.
+    """
+    movies_data = {}
+    for title, year, rating, poster in movies:
+        movies_data.setdefault(title, {"year": year, "rating": rating, "poster": poster})
+    with atomic_write(target) as file_obj:
+        json.dump(movies_data, file_obj)
+
+
+def convert_file(source, target=None):
+    """
+    Validates source and, if a target is given, copies its valid movies there.
+
+    Runs in a worker process, so it only takes and returns plain values.
+
+    Args:
+        source (str): The catalog to read.
+        target (str): The catalog to create, or None to only validate.
+
+    Returns:
+        dict: source, target, movies (valid), invalid, problems (the first
+        few), seconds and error (None on success).
+    """
+    report = {"source": source, "target": target, "movies": 0, "invalid": 0,
+              "problems": [], "seconds": 0.0, "error": None}
+    start = time.perf_counter()
+    storages = []
+    target_storage = None
+    try:
+        if source.lower().endswith(".csv"):
+            rows = _read_csv(source)
+        else:
+            source_storage = _open_streaming(source)
+            storages.append(source_storage)
+            rows = source_storage.iter_movies()
+        movies = _valid_movies(rows, report)
+        if target is None:
+            for _ in movies:
+                pass
+        elif os.path.exists(target):
+            raise FileExistsError(f"{target} already exists")
+        elif target.lower().endswith(".json"):
+            _write_json(target, movies)
+        else:
+            target_storage = _open_streaming(target)
+            storages.append(target_storage)
+            while True:
+                batch = list(islice(movies, BATCH_SIZE))
+                if not batch:
+                    break
+                target_storage.add_movies(batch)
+    except Exception as error:
+        report["error"] = f"{type(error).__name__}: {error}"
+    finally:
+        for storage in storages:
+            if hasattr(storage, "close"):
+                storage.close()
+    if report["error"] is not None and target_storage is not None:
+        # Don't leave a half written target (or its SQLite sidecars) behind.
+        for path in (target,) + tuple(target + suffix for suffix in SQLITE_SIDECARS):
+            if os.path.exists(path):
+                os.remove(path)
+    report["seconds"] = time.perf_counter() - start
+    return report
+
+
+def find_catalogs(paths):
+    """
+    Expands directories to the catalog files in them, leaving out the
+    manifests and other JSON files that aren't catalogs (NOT_CATALOGS).
+
+    Returns:
+        list: The catalog files, in a stable order.
+    """
+    files = []
+    for path in paths:
+        if os.path.isdir(path):
+            files.extend(sorted(os.path.join(path, name) for name in os.listdir(path)
+                                if os.path.splitext(name)[1].lower() in STORAGE_TYPES
+                                and name not in NOT_CATALOGS))
+        else:
+            files.append(path)
+    return files
+
+
+def target_path(source, target_format, out_dir=None):
+    """
+    Returns the file a source is converted to, e.g. movies.json -> movies.csv.
+    """
+    base = os.path.splitext(os.path.basename(source))[0] + TARGET_EXTENSIONS[target_format]
+    return os.path.join(out_dir if out_dir is not None else os.path.dirname(source), base)
+
+
+def convert_all(sources, target_format=None, out_dir=None, workers=None, out=sys.stdout):
+    """
+    Converts (or only validates) many catalogs with a process pool,
+    printing the progress and throughput as every file finishes.
+
+    Args:
+        sources (list): The catalog files.
+        target_format (str): "json", "csv", "db" or "sqlite", or None to only validate.
+        out_dir (str): Where to write the converted files (default: next to the source).
+        workers (int): The number of worker processes (default: one per CPU).
+
+    Returns:
+        list: The report of every file, see convert_file.
+    """
+    jobs = {}
+    sources_by_target = {}
+    for source in sources:
+        if os.path.splitext(source)[1].lower() not in STORAGE_TYPES:
+            print(f"Skipping {source}: unknown catalog format", file=out)
+            continue
+        target = None
+        if target_format is not None:
+            target = target_path(source, target_format, out_dir)
+            if os.path.splitext(target)[1].lower() == os.path.splitext(source)[1].lower():
+                print(f"Skipping {source}: already in {target_format} format", file=out)
+                continue
+            # e.g. movies.json and movies.csv would both become movies.db.
+            claimed = sources_by_target.setdefault(os.path.abspath(target), source)
+            if claimed != source:
+                print(f"Skipping {source}: {claimed} is also converted to {target}", file=out)
+                continue
+        jobs[source] = target
+    if out_dir is not None and target_format is not None:
+        os.makedirs(out_dir, exist_ok=True)
+
+    reports = []
+    start = time.perf_counter()
+    with ProcessPoolExecutor(max_workers=workers) as executor:
+        futures = [executor.submit(convert_file, source, target)
+                   for source, target in jobs.items()]
+        for done, future in enumerate(as_completed(futures), 1):
+            report = future.result()
+            reports.append(report)
+            action = f"-> {report['target']}" if report["target"] else "validated"
+            prefix = f"[{done}/{len(futures)}] {report['source']} {action}:"
+            if report["error"]:
+                print(f"{prefix} failed ({report['error']})", file=out)
+                continue
+            rate = report["movies"] / report["seconds"] if report["seconds"] else 0
+            print(f"{prefix} {report['movies']} movies, {report['invalid']} invalid, "
+                  f"{report['seconds']:.2f}s ({rate:,.0f} movies/s)", file=out)
+            for problem in report["problems"]:
+                print(f"    {problem}", file=out)
+    elapsed = time.perf_counter() - start
+    total = sum(report["movies"] for report in reports)
+    failed = sum(1 for report in reports if report["error"])
+    rate = total / elapsed if elapsed else 0
+    print(f"{len(reports)} files ({failed} failed), {total} movies in {elapsed:.2f}s "
+          f"({rate:,.0f} movies/s)", file=out)
+    return reports
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Validate and convert movie catalogs in parallel.")
+    parser.add_argument("paths", nargs="+", help="catalog files or directories")
+    target = parser.add_mutually_exclusive_group(required=True)
+    target.add_argument("--to", choices=sorted(TARGET_EXTENSIONS), help="the format to convert to")
+    target.add_argument("--validate-only", action="store_true", help="only load and validate")
+    parser.add_argument("--out-dir", help="where to write the converted catalogs")
+    parser.add_argument("--workers", type=int, help="number of worker processes")
+    args = parser.parse_args(argv)
+    reports = convert_all(find_catalogs(args.paths), args.to, args.out_dir, args.workers)
+    return 1 if any(report["error"] or report["invalid"] for report in reports) else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
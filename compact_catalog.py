@@ -0,0 +1,260 @@
+import sys
+from array import array
+from collections.abc import Mapping, MutableMapping
+
+# Deleted rows are only dropped from the columns once there are this many.
+MIN_TOMBSTONES_TO_COMPACT = 1024
+# Poster name length marking a movie without a poster.
+NO_POSTER = 0xFFFF
+
+
+def _split_poster(poster):
+    """
+    Splits a poster URL after its last '/' into (prefix, name).
+    """
+    cut = poster.rfind("/") + 1
+    return poster[:cut], poster[cut:]
+
+
+class MovieRecord(Mapping):
+    """
+    A dictionary-like view of one row of a CompactCatalog.
+
+    It reads rating, year and poster from the catalog's columns.
+    Only the rating can be assigned, which is what update_movie does.
+
+    The view belongs to a title, not a row: compacting renumbers the
+    rows, so the row is looked up again by title when the catalog's
+    generation moved or the row was deleted. Using the view of a movie
+    that was deleted raises KeyError.
+    """
+
+    __slots__ = ("_catalog", "_title", "_row", "_generation")
+
+    def __init__(self, catalog, title, row):
+        self._catalog = catalog
+        self._title = title
+        self._row = row
+        self._generation = catalog._generation
+
+    def _current_row(self):
+        catalog = self._catalog
+        if (self._generation != catalog._generation
+                or catalog._titles[self._row] is not self._title):
+            row = catalog._rows.get(self._title)
+            if row is None:
+                raise KeyError(f"{self._title} was deleted from the catalog")
+            self._row, self._title = row, catalog._titles[row]
+            self._generation = catalog._generation
+        return self._row
+
+    def __getitem__(self, key):
+        return self._catalog._value(self._current_row(), key)
+
+    def __setitem__(self, key, value):
+        if key != "rating":
+            raise TypeError(f"{key} can't be changed in a compact catalog")
+        self._catalog._ratings[self._current_row()] = value
+
+    def __iter__(self):
+        if self._catalog._poster_lengths[self._current_row()] == NO_POSTER:
+            return iter(("rating", "year"))
+        return iter(("rating", "year", "poster"))
+
+    def __len__(self):
+        return 2 if self._catalog._poster_lengths[self._current_row()] == NO_POSTER else 3
+
+    def __repr__(self):
+        return repr(dict(self))
+
+
+class CompactCatalog(MutableMapping):
+    """
+    A columnar, memory-compact replacement for the title -> movie_info dict.
+
+    Titles are kept in one list, ratings in an array of float32, years
+    in an array of unsigned 16-bit ints, and posters are split into a
+    shared URL prefix (stored once) and the file name, which is stored
+    as UTF-8 in one byte heap instead of a string object per movie.
+    A dict maps every title to its row. Looking a title up returns a
+    MovieRecord view instead of a dict per movie.
+
+    Deleted rows are marked and dropped in bulk later, so the catalog
+    keeps its insertion order like a dict does. Dropping them renumbers
+    the rows and bumps the generation, see MovieRecord. Ratings are stored as
+    float32 and read back rounded to 6 decimals.
+    """
+
+    def __init__(self, movies=()):
+        """
+        Args:
+            movies (iterable): (title, movie_info) tuples or a dict.
+        """
+        self._titles = []
+        self._ratings = array("f")
+        self._years = array("H")
+        self._poster_prefixes = []
+        self._prefix_ids = {}
+        self._poster_prefix_ids = array("I")
+        self._poster_offsets = array("I")
+        self._poster_lengths = array("H")
+        self._poster_heap = bytearray()
+        self._rows = {}
+        self._tombstones = 0
+        self._generation = 0
+        if isinstance(movies, Mapping):
+            movies = movies.items()
+        for title, movie_info in movies:
+            self[title] = movie_info
+
+    def _value(self, row, key):
+        if key == "rating":
+            return round(self._ratings[row], 6)
+        if key == "year":
+            return self._years[row]
+        if key == "poster" and self._poster_lengths[row] != NO_POSTER:
+            offset = self._poster_offsets[row]
+            name = self._poster_heap[offset:offset + self._poster_lengths[row]]
+            return self._poster_prefixes[self._poster_prefix_ids[row]] + name.decode("utf-8")
+        raise KeyError(key)
+
+    def _set_poster(self, row, poster):
+        """
+        Stores the poster of row. Overwriting a poster leaves the old
+        name in the heap until the next compaction.
+        """
+        offset = len(self._poster_heap)
+        if poster is None:
+            prefix_id, length = 0, NO_POSTER
+        else:
+            prefix, name = _split_poster(poster)
+            prefix_id = self._prefix_ids.get(prefix)
+            if prefix_id is None:
+                prefix_id = self._prefix_ids[prefix] = len(self._poster_prefixes)
+                self._poster_prefixes.append(sys.intern(prefix))
+            encoded = name.encode("utf-8")
+            if len(encoded) >= NO_POSTER:
+                # Keep very long names in the prefix table instead.
+                return self._set_poster_prefix_only(row, poster)
+            self._poster_heap += encoded
+            length = len(encoded)
+        if row == len(self._poster_offsets):
+            self._poster_prefix_ids.append(prefix_id)
+            self._poster_offsets.append(offset)
+            self._poster_lengths.append(length)
+        else:
+            self._poster_prefix_ids[row] = prefix_id
+            self._poster_offsets[row] = offset
+            self._poster_lengths[row] = length
+
+    def _set_poster_prefix_only(self, row, poster):
+        prefix_id = self._prefix_ids.get(poster)
+        if prefix_id is None:
+            prefix_id = self._prefix_ids[poster] = len(self._poster_prefixes)
+            self._poster_prefixes.append(poster)
+        if row == len(self._poster_offsets):
+            self._poster_prefix_ids.append(prefix_id)
+            self._poster_offsets.append(0)
+            self._poster_lengths.append(0)
+        else:
+            self._poster_prefix_ids[row] = prefix_id
+            self._poster_lengths[row] = 0
+
+    def __getitem__(self, title):
+        row = self._rows[title]
+        return MovieRecord(self, self._titles[row], row)
+
+    def __setitem__(self, title, movie_info):
+        row = self._rows.get(title)
+        if row is None:
+            row = len(self._titles)
+            self._rows[title] = row
+            self._titles.append(title)
+            self._ratings.append(movie_info["rating"])
+            self._years.append(movie_info["year"])
+        else:
+            self._ratings[row] = movie_info["rating"]
+            self._years[row] = movie_info["year"]
+        self._set_poster(row, movie_info.get("poster"))
+
+    def __delitem__(self, title):
+        row = self._rows.pop(title)
+        self._titles[row] = None
+        self._tombstones += 1
+        if self._tombstones >= MIN_TOMBSTONES_TO_COMPACT and \
+                self._tombstones * 2 >= len(self._titles):
+            self._compact()
+
+    def pop(self, title, *default):
+        """
+        Removes title and returns its movie_info as a plain dict.
+        """
+        if title not in self._rows:
+            if default:
+                return default[0]
+            raise KeyError(title)
+        movie_info = dict(self[title])
+        del self[title]
+        return movie_info
+
+    def __iter__(self):
+        return (title for title in self._titles if title is not None)
+
+    def __len__(self):
+        return len(self._rows)
+
+    def __contains__(self, title):
+        return title in self._rows
+
+    def __repr__(self):
+        return f"{type(self).__name__}({len(self)} movies)"
+
+    def _compact(self):
+        """
+        Drops the deleted rows from all the columns.
+        """
+        live_rows = [row for row, title in enumerate(self._titles) if title is not None]
+        offsets, lengths, heap = self._poster_offsets, self._poster_lengths, self._poster_heap
+        self._titles = [self._titles[row] for row in live_rows]
+        self._ratings = array("f", (self._ratings[row] for row in live_rows))
+        self._years = array("H", (self._years[row] for row in live_rows))
+        self._poster_prefix_ids = array("I", (self._poster_prefix_ids[row] for row in live_rows))
+        self._poster_offsets = array("I")
+        self._poster_lengths = array("H", (lengths[row] for row in live_rows))
+        self._poster_heap = bytearray()
+        for row in live_rows:
+            self._poster_offsets.append(len(self._poster_heap))
+            if lengths[row] != NO_POSTER:
+                self._poster_heap += heap[offsets[row]:offsets[row] + lengths[row]]
+        self._rows = {title: row for row, title in enumerate(self._titles)}
+        self._tombstones = 0
+        self._generation += 1
+
+    def random_item(self, rng):
+        """
+        Picks a random movie in constant expected time.
+
+        Deleted rows are skipped by drawing again. At most half of the
+        rows are deleted once there are enough to compact, so this takes
+        two draws on average.
+
+        Returns:
+            tuple: (title, MovieRecord).
+        """
+        while True:
+            row = rng.randrange(len(self._titles))
+            title = self._titles[row]
+            if title is not None:
+                return title, MovieRecord(self, title, row)
+
+    def ratings_array(self):
+        """
+        Returns a copy of the rating column without the deleted rows.
+
+        Returns:
+            array: The ratings as float32, in catalog order.
+        """
+        if not self._tombstones:
+            return array("f", self._ratings)
+        return array("f", (rating for rating, title in zip(self._ratings, self._titles)
+                           if title is not None))
@@ -0,0 +1,105 @@
+import os
+import tempfile
+from contextlib import contextmanager
+
+try:
+    import fcntl
+except ImportError:
+    # Not available on Windows, where file_lock doesn't lock.
+    fcntl = None
+
+
+@contextmanager
+def atomic_write(file_path, mode="w", newline=None):
+    """
+    Opens a temporary file next to file_path and atomically renames it
+    over file_path when the block finishes without an error.
+
+    A crash in the middle of a write leaves the previous file untouched,
+    because readers only ever see the old file or the complete new one.
+
+    Args:
+        file_path (str): The file that should be replaced.
+        mode (str): "w" for text or "wb" for binary output.
+        newline (str): Passed to open() for text mode (the CSV writer needs '').
+
+    Yields:
+        file object: The temporary file to write to.
+    """
+    directory = os.path.dirname(os.path.abspath(file_path))
+    file_descriptor, temp_path = tempfile.mkstemp(
+        dir=directory, prefix=".", suffix=".tmp")
+    try:
+        if "b" in mode:
+            file_obj = os.fdopen(file_descriptor, mode)
+        else:
+            file_obj = os.fdopen(file_descriptor, mode, newline=newline)
+        with file_obj:
+            yield file_obj
+            file_obj.flush()
+            os.fsync(file_obj.fileno())
+        if os.path.exists(file_path):
+            os.chmod(temp_path, os.stat(file_path).st_mode & 0o777)
+        else:
+            umask = os.umask(0)
+            os.umask(umask)
+            os.chmod(temp_path, 0o666 & ~umask)
+        os.replace(temp_path, file_path)
+    except BaseException:
+        if os.path.exists(temp_path):
+            os.remove(temp_path)
+        raise
+
+
+def append_lines(file_path, lines):
+    """
+    Appends lines to a log file and syncs them to disk before returning.
+
+    A crash in the middle of an append leaves a torn, unterminated last
+    line. It is cut off before appending, so the new lines don't continue
+    it. The lines themselves must not contain a newline.
+
+    Args:
+        file_path (str): The log file, created if needed.
+        lines (iterable): The lines to append, without newlines.
+
+    Returns:
+        int: The number of bytes appended.
+    """
+    data = "".join(line + "\n" for line in lines).encode()
+    with open(file_path, "a+b") as log_obj:
+        size = log_obj.seek(0, os.SEEK_END)
+        if size:
+            log_obj.seek(size - 1)
+            if log_obj.read(1) != b"\n":
+                log_obj.seek(0)
+                log_obj.truncate(log_obj.read().rfind(b"\n") + 1)
+        log_obj.write(data)
+        log_obj.flush()
+        os.fsync(log_obj.fileno())
+    return len(data)
+
+
+@contextmanager
+def file_lock(lock_path, shared=False):
+    """
+    Holds an advisory fcntl lock on lock_path, which is created if needed.
+
+    Many processes can hold a shared (reader) lock at the same time, an
+    exclusive (writer) lock waits until nobody else holds the lock.
+    The lock is taken on a separate file because atomic_write replaces
+    the data file, and a lock on the replaced file would protect nothing.
+
+    Args:
+        lock_path (str): The lock file, e.g. "movies.json.lock".
+        shared (bool): Take a reader lock instead of a writer lock.
+    """
+    if fcntl is None:
+        yield
+        return
+    with open(lock_path, "a") as lock_obj:
+        fcntl.flock(lock_obj.fileno(), fcntl.LOCK_SH if shared else fcntl.LOCK_EX)
+        try:
+            yield
+        finally:
+            fcntl.flock(lock_obj.fileno(), fcntl.LOCK_UN)
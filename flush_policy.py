@@ -0,0 +1,114 @@
+"""
+Flush policies decide when the mutations of a storage are written.
+
+Without a policy (the default) every mutation is saved right away.
+With one, mutations only change the in-memory snapshot and are
+coalesced into a single save:
+
+    storage.set_flush_policy(Manual())           # only on flush()
+    storage.set_flush_policy(EveryN(100))        # every 100 mutations
+    storage.set_flush_policy(Interval(5.0))      # every 5 seconds, in a thread
+    storage.set_flush_policy(None)               # back to saving right away
+
+`with storage.batch():` defers saving until the block ends with any policy.
+Storages with unsaved changes are flushed when the interpreter exits.
+"""
+import atexit
+import threading
+import weakref
+
+# Storages with a flush policy, flushed at exit.
+_storages = weakref.WeakSet()
+
+
+@atexit.register
+def flush_all():
+    """
+    Saves the changes every storage with a flush policy has deferred.
+    """
+    for storage in list(_storages):
+        storage.flush()
+
+
+class FlushPolicy:
+    """
+    The base class of the flush policies.
+
+    A storage calls mutated() after every mutation it deferred (holding
+    its lock) and flushed() after it saved them.
+    """
+
+    def attach(self, storage):
+        _storages.add(storage)
+
+    def mutated(self, storage):
+        pass
+
+    def flushed(self):
+        pass
+
+    def close(self):
+        pass
+
+
+class Manual(FlushPolicy):
+    """
+    Only flushes when flush() is called (or at exit).
+    """
+
+
+class EveryN(FlushPolicy):
+    """
+    Flushes once mutations changes were made.
+    """
+
+    def __init__(self, mutations):
+        if mutations < 1:
+            raise ValueError("mutations must be at least 1")
+        self.mutations = mutations
+        self._pending = 0
+
+    def mutated(self, storage):
+        self._pending += 1
+        if self._pending >= self.mutations:
+            storage.flush()
+
+    def flushed(self):
+        self._pending = 0
+
+
+class Interval(FlushPolicy):
+    """
+    Flushes the pending changes every seconds seconds from a daemon thread.
+
+    The thread skips a round while a transaction or batch is collecting
+    changes, and stops when the policy is replaced or the storage is
+    garbage collected.
+    """
+
+    def __init__(self, seconds):
+        if seconds <= 0:
+            raise ValueError("seconds must be positive")
+        self.seconds = seconds
+        self._stop = threading.Event()
+        self._thread = None
+
+    def attach(self, storage):
+        super().attach(storage)
+        self._thread = threading.Thread(
+            target=self._run, args=(weakref.ref(storage),),
+            name="storage-flush", daemon=True)
+        self._thread.start()
+
+    def _run(self, storage_ref):
+        while not self._stop.wait(self.seconds):
+            storage = storage_ref()
+            if storage is None:
+                return
+            storage._flush_idle()
+            del storage
+
+    def close(self):
+        self._stop.set()
+        if self._thread is not None and self._thread is not threading.current_thread():
+            self._thread.join()
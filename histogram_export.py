@@ -0,0 +1,170 @@
+"""
+Batch export of the rating histograms of many catalogs.
+
+export_all draws the histograms of many catalogs, e.g. every family
+profile, in worker processes, with a HistogramService each. It lives
+apart from histogram_service.py, which MovieApp imports on every
+start, so the app doesn't pay for the export's imports.
+
+Usage:
+    python histogram_export.py movies.json movies.csv --out-dir histograms/
+    python histogram_export.py --profiles . --format svg
+"""
+import argparse
+import os
+import sys
+import time
+from concurrent.futures import ProcessPoolExecutor, as_completed
+from histogram_service import HistogramService
+from rating_analytics import HISTOGRAM_BINS
+from shared_catalog import SharedCatalog
+from storage_factory import open_storage
+from storage_json import StorageJson
+from storage_registry import StorageRegistry
+
+
+def _open_catalog(source, name=None, catalog_path=None):
+    """
+    Opens a catalog file, or a family profile overlaying a shared catalog.
+    """
+    if catalog_path is not None:
+        return StorageJson(source, name, catalog=SharedCatalog(catalog_path))
+    opened = open_storage(source)
+    if opened is None:
+        raise ValueError("unknown catalog format")
+    return opened[1]
+
+
+def export_histogram_file(source, target, name=None, catalog_path=None, bins=HISTOGRAM_BINS):
+    """
+    Saves the histogram of one catalog. Runs in a worker process of export_all.
+
+    Returns:
+        dict: source, target, movies, seconds, and error (None on success).
+    """
+    report = {"source": source, "target": target, "movies": 0, "seconds": 0.0, "error": None}
+    start = time.perf_counter()
+    try:
+        storage = _open_catalog(source, name, catalog_path)
+        service = HistogramService(bins)
+        binned = service.binned(storage)
+        if binned is not None:
+            report["movies"] = int(sum(binned[0]))
+            service.save(storage, target)
+        else:
+            report["error"] = "no movies"
+        if hasattr(storage, "close"):
+            storage.close()
+    except Exception as error:
+        report["error"] = f"{type(error).__name__}: {error}"
+    report["seconds"] = time.perf_counter() - start
+    return report
+
+
+# Files next to a catalog that hold changes not folded into it yet: the
+# journal of StorageJson and SharedCatalog, and the SQLite write-ahead log.
+SIDECAR_SUFFIXES = (".log", "-wal")
+
+
+def _change_files(source):
+    """
+    Returns the files whose changes make up source: the catalog, its
+    sidecars, and every file of a sharded catalog's directory.
+    """
+    if os.path.isdir(source):
+        return [os.path.join(source, name) for name in os.listdir(source)]
+    return [source] + [source + suffix for suffix in SIDECAR_SUFFIXES]
+
+
+def _is_up_to_date(target, *sources):
+    """
+    Returns True if target was written after all of its sources last
+    changed, including changes still in their journals.
+    """
+    if not os.path.exists(target):
+        return False
+    written = os.path.getmtime(target)
+    return all(os.path.getmtime(path) <= written
+               for source in sources if source is not None
+               for path in _change_files(source) if os.path.exists(path))
+
+
+def export_all(jobs, out_dir=".", image_format="png", workers=None, bins=HISTOGRAM_BINS,
+               catalog_path=None, force=False, out=sys.stdout):
+    """
+    Saves the histograms of many catalogs with a process pool, printing
+    the progress as every file finishes.
+
+    A histogram newer than its catalog (and the shared catalog) is
+    skipped, unless force is set.
+
+    Args:
+        jobs (dict): Name -> catalog file, e.g. StorageRegistry.discover().
+            The histogram of every catalog is written to <name>_histogram.<format>.
+        out_dir (str): Where to write the histograms.
+        image_format (str): "png", "svg", "pdf", ... or "csv" / "json" for the bins.
+        workers (int): The number of worker processes (default: one per CPU).
+        catalog_path (str): The shared catalog the profiles are overlays of, if any.
+
+    Returns:
+        list: The report of every exported file, see export_histogram_file.
+    """
+    os.makedirs(out_dir, exist_ok=True)
+    reports = []
+    start = time.perf_counter()
+    with ProcessPoolExecutor(max_workers=workers) as executor:
+        futures = []
+        for name, source in jobs.items():
+            target = os.path.join(out_dir, f"{name.lower()}_histogram.{image_format}")
+            if not force and _is_up_to_date(target, source, catalog_path):
+                print(f"Skipping {source}: {target} is up to date", file=out)
+                continue
+            futures.append(executor.submit(export_histogram_file, source, target,
+                                           name, catalog_path, bins))
+        for done, future in enumerate(as_completed(futures), 1):
+            report = future.result()
+            reports.append(report)
+            prefix = f"[{done}/{len(futures)}] {report['source']} -> {report['target']}:"
+            if report["error"]:
+                print(f"{prefix} failed ({report['error']})", file=out)
+            else:
+                print(f"{prefix} {report['movies']} movies, {report['seconds']:.2f}s", file=out)
+    failed = sum(1 for report in reports if report["error"])
+    print(f"{len(reports)} histograms ({failed} failed) in {time.perf_counter() - start:.2f}s",
+          file=out)
+    return reports
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Export the rating histograms of many catalogs.")
+    sources = parser.add_mutually_exclusive_group(required=True)
+    sources.add_argument("paths", nargs="*", default=[], help="catalog files")
+    sources.add_argument("--profiles", metavar="DIR",
+                         help="export every family profile listed in DIR/profiles.json")
+    parser.add_argument("--out-dir", default=".", help="where to write the histograms")
+    parser.add_argument("--format", default="png",
+                        help="image format (png, svg, pdf, ...) or csv/json for the bins")
+    parser.add_argument("--bins", type=int, default=HISTOGRAM_BINS, help="number of bins")
+    parser.add_argument("--workers", type=int, help="number of worker processes")
+    parser.add_argument("--force", action="store_true", help="also redraw up to date histograms")
+    args = parser.parse_args(argv)
+    catalog_path = None
+    if args.profiles is not None:
+        jobs = StorageRegistry.discover(args.profiles)
+        if os.path.exists(os.path.join(args.profiles, "catalog.json")):
+            catalog_path = os.path.join(args.profiles, "catalog.json")
+    else:
+        jobs = {}
+        for path in args.paths:
+            name = os.path.splitext(os.path.basename(path))[0]
+            if name in jobs:
+                # movies.json and movies.csv -> movies and movies_csv
+                name = os.path.basename(path).replace(".", "_")
+            jobs[name] = path
+    reports = export_all(jobs, args.out_dir, args.format, args.workers, args.bins,
+                         catalog_path, args.force)
+    return 1 if any(report["error"] for report in reports) else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
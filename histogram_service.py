@@ -0,0 +1,105 @@
+"""
+Rating histograms that are only recomputed when the ratings change.
+
+HistogramService caches the binned counts and the rendered images of
+every storage under its catalog_version(), so asking again for the
+histogram of an unchanged catalog neither re-reads the ratings nor
+redraws the figure. The figures are drawn with the object-oriented
+matplotlib API (see plotting.py), so a service can be shared between
+threads.
+
+See histogram_export.py for exporting the histograms of many catalogs.
+"""
+import os
+import threading
+import weakref
+import plotting
+import rating_analytics
+from rating_analytics import HISTOGRAM_BINS
+
+# Histogram file extensions that are exported as bins instead of drawn.
+DATA_FORMATS = (".csv", ".json")
+
+
+class HistogramService:
+    """
+    Computes, renders and saves rating histograms, caching them per storage.
+
+    An entry is dropped when its catalog_version() changes, or when the
+    storage is garbage collected.
+    """
+
+    def __init__(self, bins=HISTOGRAM_BINS):
+        """
+        Args:
+            bins (int): The number of bins of every histogram.
+        """
+        self.bins = bins
+        self.hits = 0
+        self.misses = 0
+        self._cache = weakref.WeakKeyDictionary()
+        self._lock = threading.Lock()
+
+    def _entry(self, storage):
+        """
+        Returns the cache entry of storage, binning its ratings again if
+        the catalog changed since they were binned.
+        """
+        version = storage.catalog_version()
+        with self._lock:
+            entry = self._cache.get(storage)
+            if entry is not None and entry["version"] == version:
+                self.hits += 1
+                return entry
+            self.misses += 1
+        binned = rating_analytics.histogram(storage.ratings_array(), self.bins)
+        entry = {"version": version, "binned": binned, "images": {}}
+        with self._lock:
+            self._cache[storage] = entry
+        return entry
+
+    def binned(self, storage):
+        """
+        Returns:
+            tuple: (counts, edges) lists, or None when there are no ratings.
+        """
+        return self._entry(storage)["binned"]
+
+    def render(self, storage, image_format="png"):
+        """
+        Returns the histogram image of storage, drawing it only if the
+        catalog changed since it was last drawn in this format.
+
+        Returns:
+            bytes: The image, or None when there are no ratings.
+        """
+        entry = self._entry(storage)
+        if entry["binned"] is None:
+            return None
+        image = entry["images"].get(image_format)
+        if image is None:
+            image = plotting.render_histogram(*entry["binned"], image_format=image_format)
+            entry["images"][image_format] = image
+        return image
+
+    def save(self, storage, file_name):
+        """
+        Saves the histogram of storage to file_name. A .csv or .json file
+        name exports the bins as data instead of a plot.
+
+        Returns:
+            bool: False when there are no ratings, and nothing was written.
+        """
+        extension = os.path.splitext(file_name)[1].lower()
+        if extension in DATA_FORMATS:
+            binned = self.binned(storage)
+            if binned is None:
+                return False
+            rating_analytics.export_histogram(*binned, file_name)
+            return True
+        image = self.render(storage, extension[1:] or "png")
+        if image is None:
+            return False
+        with open(file_name, "wb") as file_obj:
+            file_obj.write(image)
+        return True
@@ -0,0 +1,208 @@
+"""
+Opt-in instrumentation of the MovieApp commands and the storage methods.
+
+Nothing is measured unless an Instrumentation is passed to MovieApp (or
+main.py runs with --metrics FILE). Without one the commands and storage
+methods run unwrapped, so the only cost left is one `is None` check per
+command and a few clock reads per load/save.
+
+With it, it records:
+    - a latency histogram per command and per public IStorage method,
+      except the ones returning an iterator or a context manager
+      (iter_movies, transaction, ...), whose calls return before the work
+      is done
+    - bytes read and written by load_movies_data, save_data and the journal
+    - the time spent on the disk separately from the time spent parsing
+      or serializing (for JSON; CSV parses while it reads, so it is
+      recorded as one "combined" phase)
+
+The data can be dumped as Prometheus text or as JSON. Commands slower
+than profile_slower_than are profiled with cProfile the next time they run.
+"""
+import functools
+import json
+import os
+import time
+from bisect import bisect_left
+from istorage import IStorage
+
+# Upper bounds of the latency histogram buckets, in seconds.
+LATENCY_BUCKETS = (0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1,
+                   0.25, 0.5, 1.0, 2.5, 5.0, 10.0, float("inf"))
+
+
+class LatencyHistogram:
+    """
+    Counts observations in the LATENCY_BUCKETS, like a Prometheus histogram.
+    """
+
+    __slots__ = ("counts", "count", "sum")
+
+    def __init__(self):
+        self.counts = [0] * len(LATENCY_BUCKETS)
+        self.count = 0
+        self.sum = 0.0
+
+    def observe(self, seconds):
+        self.counts[bisect_left(LATENCY_BUCKETS, seconds)] += 1
+        self.count += 1
+        self.sum += seconds
+
+    def cumulative(self):
+        """
+        Yields (upper bound, observations up to it), as Prometheus expects.
+        """
+        total = 0
+        for bound, count in zip(LATENCY_BUCKETS, self.counts):
+            total += count
+            yield bound, total
+
+
+class Instrumentation:
+    def __init__(self, profile_slower_than=None, profile_dir="."):
+        """
+        Args:
+            profile_slower_than (float): Profile the next run of a command
+                with cProfile once it took longer than this many seconds.
+            profile_dir (str): Where the .prof files are written.
+        """
+        self.profile_slower_than = profile_slower_than
+        self.profile_dir = profile_dir
+        self.commands = {}
+        self.storage_calls = {}
+        # (operation, backend) -> {"bytes": ..., "calls": ..., phase: seconds}
+        self.io = {}
+        self.profiles = []
+        self._profile_next = set()
+
+    def run_command(self, name, function, *args):
+        """
+        Runs one command, recording its latency, and profiles it if the
+        previous run of the same command was slow.
+        """
+        profiler = None
+        if name in self._profile_next:
+            # Imported here, so the profiler costs nothing until a command is slow.
+            import cProfile
+            self._profile_next.discard(name)
+            profiler = cProfile.Profile()
+            profiler.enable()
+        start = time.perf_counter()
+        try:
+            return function(*args)
+        finally:
+            elapsed = time.perf_counter() - start
+            if profiler is not None:
+                profiler.disable()
+                path = os.path.join(self.profile_dir,
+                                    f"profile-{name}-{len(self.profiles) + 1}.prof")
+                profiler.dump_stats(path)
+                self.profiles.append(path)
+            self.commands.setdefault(name, LatencyHistogram()).observe(elapsed)
+            if self.profile_slower_than is not None and elapsed > self.profile_slower_than:
+                self._profile_next.add(name)
+
+    def instrument_storage(self, storage):
+        """
+        Wraps every public IStorage method of storage to record its latency,
+        and makes the backend report its I/O to this instrumentation.
+
+        Methods returning an iterator or a context manager are left alone,
+        since timing the call would only time creating it.
+        """
+        import inspect
+        storage.instrumentation = self
+        for name in dir(IStorage):
+            function = getattr(IStorage, name)
+            if name.startswith("_") or not callable(function):
+                continue
+            if name.startswith("iter_") or inspect.isgeneratorfunction(inspect.unwrap(function)):
+                continue
+            method = getattr(storage, name)
+            setattr(storage, name, self._timed(name, method))
+        return storage
+
+    def _timed(self, name, method):
+        histogram = self.storage_calls.setdefault(name, LatencyHistogram())
+
+        @functools.wraps(method)
+        def timed(*args, **kwargs):
+            start = time.perf_counter()
+            try:
+                return method(*args, **kwargs)
+            finally:
+                histogram.observe(time.perf_counter() - start)
+        return timed
+
+    def record_io(self, operation, backend, nbytes, **phases):
+        """
+        Records one load or save.
+
+        Args:
+            operation (str): "load", "save" or "journal".
+            backend (str): The storage class name.
+            nbytes (int): The bytes read or written.
+            phases: Seconds per phase, e.g. disk=..., parse=... or serialize=...
+        """
+        totals = self.io.setdefault((operation, backend), {"bytes": 0, "calls": 0})
+        totals["bytes"] += nbytes
+        totals["calls"] += 1
+        for phase, seconds in phases.items():
+            totals[phase] = totals.get(phase, 0.0) + seconds
+
+    def to_dict(self):
+        def histogram_dict(histogram):
+            return {"count": histogram.count, "sum": histogram.sum,
+                    "buckets": {("+Inf" if bound == float("inf") else str(bound)): count
+                                for bound, count in histogram.cumulative()}}
+        return {
+            "commands": {name: histogram_dict(h) for name, h in self.commands.items()},
+            "storage_calls": {name: histogram_dict(h)
+                              for name, h in self.storage_calls.items() if h.count},
+            "io": [dict(operation=operation, backend=backend, **totals)
+                   for (operation, backend), totals in self.io.items()],
+            "profiles": list(self.profiles)
+        }
+
+    def prometheus_text(self):
+        """
+        Returns the metrics in the Prometheus text exposition format.
+        """
+        lines = []
+
+        def histogram_lines(metric, label, histograms):
+            lines.append(f"# TYPE {metric} histogram")
+            for name, histogram in sorted(histograms.items()):
+                if not histogram.count:
+                    continue
+                for bound, count in histogram.cumulative():
+                    le = "+Inf" if bound == float("inf") else repr(bound)
+                    lines.append(f'{metric}_bucket{{{label}="{name}",le="{le}"}} {count}')
+                lines.append(f'{metric}_sum{{{label}="{name}"}} {histogram.sum!r}')
+                lines.append(f'{metric}_count{{{label}="{name}"}} {histogram.count}')
+
+        histogram_lines("movie_app_command_seconds", "command", self.commands)
+        histogram_lines("movie_storage_call_seconds", "method", self.storage_calls)
+        lines.append("# TYPE movie_storage_io_bytes_total counter")
+        for (operation, backend), totals in sorted(self.io.items()):
+            lines.append(f'movie_storage_io_bytes_total{{operation="{operation}",'
+                         f'backend="{backend}"}} {totals["bytes"]}')
+        lines.append("# TYPE movie_storage_io_seconds_total counter")
+        for (operation, backend), totals in sorted(self.io.items()):
+            for phase, seconds in sorted(totals.items()):
+                if phase in ("bytes", "calls"):
+                    continue
+                lines.append(f'movie_storage_io_seconds_total{{operation="{operation}",'
+                             f'backend="{backend}",phase="{phase}"}} {seconds!r}')
+        return "\n".join(lines) + "\n"
+
+    def dump(self, file_path):
+        """
+        Writes the metrics to file_path: JSON for a .json file,
+        Prometheus text otherwise.
+        """
+        with open(file_path, "w") as file_obj:
+            if file_path.lower().endswith(".json"):
+                json.dump(self.to_dict(), file_obj, indent=4)
+            else:
+                file_obj.write(self.prometheus_text())
@@ -1,5 +1,76 @@
 from abc import ABC, abstractmethod
+from array import array
+from contextlib import contextmanager, nullcontext
+from itertools import islice
+from statistics import median
+import heapq
+import os
+import random
+import threading
+from binary_catalog import write_binary_catalog
+from compact_catalog import CompactCatalog
+from file_utils import file_lock
+from movie_query import parse_query, scan
+from rating_analytics import PERCENTILES
+from rating_stats import RatingStats
+from search_index import TitleIndex
+
+
+def apply_entry(movies_data, entry):
+    """
+    Applies one mutation entry, as passed to _after_mutation, to movies_data.
+
+    An update or delete of a title that isn't there is ignored, so
+    entries can be replayed on a catalog another process changed.
+    """
+    if entry["op"] == "add":
+        movies_data[entry["title"]] = entry["info"]
+    elif entry["op"] == "update":
+        if entry["title"] in movies_data:
+            movies_data[entry["title"]]["rating"] = entry["rating"]
+    elif entry["op"] == "poster":
+        if entry["title"] in movies_data:
+            _replace_poster(movies_data, entry["title"], entry["poster"])
+    elif entry["op"] == "delete":
+        movies_data.pop(entry["title"], None)
+
+
+def _replace_poster(movies_data, title, poster):
+    """
+    Replaces a movie's poster by storing a new movie_info, which works
+    for a CompactCatalog too (its rows only let the rating be changed).
+    """
+    movie_info = dict(movies_data[title])
+    movie_info['poster'] = poster
+    movies_data[title] = movie_info
+
+
 class IStorage(ABC):
+    # In-memory snapshot of the catalog and the file signature it was read at.
+    _movies_data = None
+    _cache_signature = None
+    _search_index = None
+    _rating_stats = None
+    # Set while a transaction() defers saving, and once it has unsaved changes.
+    _in_transaction = False
+    _dirty = False
+    # The flush policy deferring saves (see flush_policy.py), the nesting
+    # depth of batch() blocks, and the lock guarding the snapshot once a
+    # policy may flush it from another thread.
+    _flush_policy = None
+    _batch_depth = 0
+    _lock = None
+    # The mutations not saved yet, replayed if another process changed the
+    # file in the meantime, and how often this storage holds its file lock.
+    _pending_entries = None
+    _file_lock_depth = 0
+    # Counts the mutations and reloads, so catalog_version() also changes
+    # before a mutation is saved and after a rollback.
+    _mutations = 0
+    cache_hits = 0
+    cache_misses = 0
+    # Set by Instrumentation.instrument_storage, see instrumentation.py.
+    instrumentation = None
 
     @abstractmethod
     def list_movies(self):
@@ -52,8 +123,634 @@ class IStorage(ABC):
         """
         pass
 
+    def _file_signature(self):
+        """
+        Returns the (mtime, size, inode) of the storage file, or None if it
+        doesn't exist. Every atomic save creates a new inode, so a rewrite is
+        noticed even within the resolution of the mtime.
+        """
+        try:
+            stat = os.stat(self._file_path)
+        except FileNotFoundError:
+            return None
+        return stat.st_mtime_ns, stat.st_size, stat.st_ino
+
+    @contextmanager
+    def _file_lock(self, shared=False):
+        """
+        Holds the cross-process lock of the storage file (see file_lock).
+
+        Saves take it exclusively and loads shared, so no process reads
+        a catalog while another one is writing it. Nested calls while the
+        lock is held don't lock again.
+        """
+        if self._file_lock_depth:
+            self._file_lock_depth += 1
+            try:
+                yield
+            finally:
+                self._file_lock_depth -= 1
+            return
+        with file_lock(self._file_path + ".lock", shared):
+            self._file_lock_depth = 1
+            try:
+                yield
+            finally:
+                self._file_lock_depth = 0
+
+    def _remember_file_signature(self):
+        """
+        Marks the in-memory snapshot as being in sync with the storage file.
+
+        Backends call this after loading or saving, so their own writes
+        don't invalidate the snapshot.
+        """
+        self._cache_signature = self._file_signature()
+
+    def get_movies_data(self):
+        """
+        Returns the in-memory snapshot of the catalog.
+
+        The file is only re-read when its signature changed since the last
+        load or save, so edits made by another process are still picked up
+        while repeated commands don't re-parse the whole file. A snapshot
+        with unsaved changes is never replaced.
+
+        Returns:
+            dict: The movies as a dictionary of dictionaries.
+        """
+        if self._dirty:
+            self.cache_hits += 1
+            return self._movies_data
+        signature = self._file_signature()
+        if self._movies_data is None or signature != self._cache_signature:
+            self.cache_misses += 1
+            with self._file_lock(shared=True):
+                signature = self._file_signature()
+                self._replace_snapshot(self.load_movies_data(), signature)
+        else:
+            self.cache_hits += 1
+        return self._movies_data
+
+    def _replace_snapshot(self, movies_data, signature):
+        """
+        Installs a freshly loaded snapshot read at signature.
+        """
+        self._movies_data = movies_data
+        self._cache_signature = signature
+        self._mutations += 1
+        self._reset_indexes()
+
+    def catalog_version(self):
+        """
+        Returns a token that changes whenever the catalog changes, through
+        this storage (saved or not) or in the file, e.g. to key caches by.
+        """
+        return self._mutations, self._file_signature()
+
+    def cache_info(self):
+        """
+        Returns the hit and miss counters of get_movies_data.
+        """
+        return {"hits": self.cache_hits, "misses": self.cache_misses}
+
+    def ratings_array(self):
+        """
+        Returns all the ratings in one array, in catalog order.
+
+        A columnar catalog hands out a copy of its rating column,
+        other catalogs are read in a single pass.
+
+        Returns:
+            array: The ratings.
+        """
+        movies_data = self.get_movies_data()
+        if isinstance(movies_data, CompactCatalog):
+            return movies_data.ratings_array()
+        return array("d", (info['rating'] for info in movies_data.values()))
+
+    def iter_movies(self):
+        """
+        Iterates over the movies in the database.
+
+        Commands that only scan the catalog (list, search, stats) use this
+        instead of load_movies_data, so backends that can stream their
+        records don't have to build the whole dictionary first.
+
+        Yields:
+            tuple: (title, movie_info) for every movie.
+        """
+        return iter(self.get_movies_data().items())
+
+    def random_movie(self, rng=random):
+        """
+        Picks a random movie without copying the titles into a list.
+
+        A columnar catalog picks a random row in constant time, a dict
+        is walked up to the chosen position.
+
+        Returns:
+            tuple: (title, movie_info), or None when there are no movies.
+        """
+        movies_data = self.get_movies_data()
+        if not movies_data:
+            return None
+        if isinstance(movies_data, CompactCatalog):
+            return movies_data.random_item(rng)
+        title = next(islice(movies_data, rng.randrange(len(movies_data)), None))
+        return title, movies_data[title]
+
+    def export_snapshot(self, file_path):
+        """
+        Writes the catalog to a read-only binary snapshot, see binary_catalog.py.
+
+        Returns:
+            int: The number of movies written.
+        """
+        return write_binary_catalog(file_path, self.iter_movies())
+
+    def insert_movie(self, title, year, rating, poster):
+        """
+        Adds a movie without printing anything.
+
+        Returns:
+            bool: True if the movie was added, False if the title already exists.
+        """
+        with self._locked():
+            movies_data = self.get_movies_data()
+            if title in movies_data:
+                return False
+            movies_data[title] = {
+                'year': year,
+                'rating': rating,
+                'poster': poster
+            }
+            self._on_movie_added(title, movies_data[title])
+            self._after_mutation({"op": "add", "title": title, "info": movies_data[title]})
+            return True
+
+    def remove_movie(self, title):
+        """
+        Deletes a movie without asking for confirmation or printing anything.
+
+        Returns:
+            bool: True if the movie was deleted, False if it wasn't found.
+        """
+        with self._locked():
+            movies_data = self.get_movies_data()
+            if title not in movies_data:
+                return False
+            movie_info = movies_data.pop(title)
+            self._on_movie_removed(title, movie_info)
+            self._after_mutation({"op": "delete", "title": title})
+            return True
+
+    def set_rating(self, title, rating):
+        """
+        Updates a movie's rating without printing anything.
+
+        Returns:
+            bool: True if the movie was updated, False if it wasn't found.
+        """
+        with self._locked():
+            movies_data = self.get_movies_data()
+            if title not in movies_data:
+                return False
+            movies_data[title]['rating'] = rating
+            self._on_rating_changed(title, rating)
+            self._after_mutation({"op": "update", "title": title, "rating": rating})
+            return True
+
+    def set_poster(self, title, poster):
+        """
+        Replaces a movie's poster URL without printing anything,
+        e.g. to repair a truncated one (see posters.py).
+
+        Returns:
+            bool: True if the movie was updated, False if it wasn't found.
+        """
+        with self._locked():
+            movies_data = self.get_movies_data()
+            if title not in movies_data:
+                return False
+            _replace_poster(movies_data, title, poster)
+            self._after_mutation({"op": "poster", "title": title, "poster": poster})
+            return True
+
+    def add_movies(self, movies):
+        """
+        Adds many movies with a single save.
+
+        Args:
+            movies (iterable): (title, year, rating, poster) tuples.
+
+        Returns:
+            int: The number of movies that were added (existing titles are skipped).
+        """
+        added = 0
+        with self.transaction():
+            for title, year, rating, poster in movies:
+                added += self.insert_movie(title, year, rating, poster)
+        return added
+
+    def _persist(self, entry):
+        """
+        Persists a single mutation of the snapshot, described by entry.
+        By default the whole snapshot is saved, see _save_merged.
+        """
+        self._save_merged((entry,))
+
+    def _save_merged(self, entries):
+        """
+        Saves the snapshot without losing the changes of other processes.
+
+        Holding the exclusive file lock, the file is checked for changes
+        since it was loaded. If another process saved in the meantime, the
+        file is reloaded and entries (the mutations of this storage that
+        aren't saved yet) are applied on top before saving.
+        """
+        with self._file_lock():
+            signature = self._file_signature()
+            if signature != self._cache_signature:
+                movies_data = self.load_movies_data()
+                for entry in entries:
+                    apply_entry(movies_data, entry)
+                self._replace_snapshot(movies_data, signature)
+            self.save_data(self._movies_data)
+
+    def _after_mutation(self, entry):
+        """
+        Persists a mutation right away, or marks the storage dirty inside
+        a transaction or batch, or when a flush policy defers saving.
+        """
+        self._mutations += 1
+        collecting = self._in_transaction or self._batch_depth
+        if self._flush_policy is None and not collecting:
+            self._persist(entry)
+            return
+        self._dirty = True
+        if entry is not None:
+            if self._pending_entries is None:
+                self._pending_entries = []
+            self._pending_entries.append(entry)
+        if not collecting:
+            self._flush_policy.mutated(self)
+
+    def _locked(self):
+        """
+        Returns the lock guarding the snapshot, or a no-op context when
+        no flush policy can touch it from another thread.
+        """
+        return self._lock if self._lock is not None else nullcontext()
+
+    def _save_pending(self):
+        """
+        Writes the deferred changes. By default the whole snapshot is saved.
+        """
+        self._save_merged(self._pending_entries or ())
+
+    def flush(self):
+        """
+        Saves the changes deferred by a transaction, a batch or the flush policy.
+        """
+        with self._locked():
+            if self._dirty:
+                self._save_pending()
+                self._dirty = False
+                self._pending_entries = None
+                if self._flush_policy is not None:
+                    self._flush_policy.flushed()
+
+    def _flush_idle(self):
+        """
+        Flushes, unless a transaction or batch is still collecting changes.
+        Called by the Interval flush policy from its thread.
+        """
+        with self._locked():
+            if not self._in_transaction and not self._batch_depth:
+                self.flush()
+
+    def set_flush_policy(self, policy):
+        """
+        Sets when mutations are saved, see flush_policy.py.
+
+        The changes deferred so far are saved first.
+
+        Args:
+            policy (FlushPolicy): The new policy, or None to save every
+                mutation right away.
+        """
+        if self._flush_policy is not None:
+            self._flush_policy.close()
+        self.flush()
+        if policy is not None and self._lock is None:
+            self._lock = threading.RLock()
+        self._flush_policy = policy
+        if policy is not None:
+            policy.attach(self)
+
+    @contextmanager
+    def batch(self):
+        """
+        Defers saving until the block ends and then saves once.
+
+        Unlike transaction(), the changes are kept and saved even if the
+        block raises.
+
+        Yields:
+            IStorage: The storage itself.
+        """
+        self._batch_depth += 1
+        try:
+            yield self
+        finally:
+            self._batch_depth -= 1
+            if not self._batch_depth and not self._in_transaction:
+                self.flush()
+
+    def rollback(self):
+        """
+        Discards the unsaved changes by reloading the snapshot from the file.
+        """
+        with self._locked(), self._file_lock(shared=True):
+            self._dirty = False
+            self._pending_entries = None
+            self._replace_snapshot(self.load_movies_data(), self._file_signature())
+
+    @contextmanager
+    def transaction(self):
+        """
+        Groups many mutations into a single save.
+
+        Inside the block mutations only change the in-memory snapshot.
+        The storage is saved once when the block ends, or rolled back if
+        it raises. Nested transactions join the outer one.
+
+        Yields:
+            IStorage: The storage itself.
+        """
+        if self._in_transaction:
+            yield self
+            return
+        self._in_transaction = True
+        try:
+            yield self
+        except BaseException:
+            self._in_transaction = False
+            self.rollback()
+            raise
+        self._in_transaction = False
+        self.flush()
+
+    def _reset_indexes(self):
+        """
+        Drops the indexes derived from the snapshot after it was reloaded.
+        They are rebuilt lazily on their next use.
+        """
+        self._search_index = None
+        self._rating_stats = None
+
+    def _on_movie_added(self, title, movie_info):
+        """
+        Updates the derived indexes after a movie was added to the snapshot.
+        """
+        if self._search_index is not None:
+            self._search_index.add(title)
+        if self._rating_stats is not None:
+            self._rating_stats.add(title, movie_info['rating'], movie_info['year'])
+
+    def _on_movie_removed(self, title, movie_info):
+        """
+        Updates the derived indexes after a movie was removed from the snapshot.
+        """
+        if self._search_index is not None:
+            self._search_index.remove(title)
+        if self._rating_stats is not None:
+            self._rating_stats.remove(title)
+
+    def _on_rating_changed(self, title, rating):
+        """
+        Updates the derived indexes after a movie's rating changed in the snapshot.
+        """
+        if self._rating_stats is not None:
+            self._rating_stats.update(title, rating)
+
+    def search(self, query, limit=None, mode="substring"):
+        """
+        Finds movies by title using the trigram search index.
+
+        The index is built on first use and kept up to date by
+        add_movie/delete_movie afterwards.
+
+        Args:
+            query (str): The text to look for in the titles.
+            limit (int): The maximum number of results, or None for all.
+            mode (str): "substring" (catalog order), "prefix" (alphabetical
+                order) or "fuzzy" (ranked by similarity, best first).
+
+        Returns:
+            list: (title, movie_info) tuples.
+        """
+        movies_data = self.get_movies_data()
+        if self._search_index is None:
+            self._search_index = TitleIndex(movies_data)
+        if mode == "substring":
+            titles = self._search_index.substring(query, limit)
+        elif mode == "prefix":
+            titles = self._search_index.prefix(query, limit)
+        elif mode == "fuzzy":
+            titles = self._search_index.fuzzy(query, limit)
+        else:
+            raise ValueError(f"Unknown search mode: {mode}")
+        return [(title, movies_data[title]) for title in titles]
+
+    def _scan_search(self, query, limit=None):
+        """
+        Finds the movies whose title contains the query with a linear scan.
+
+        Returns:
+            list: (title, movie_info) tuples in catalog order.
+        """
+        query_lower = query.lower()
+        results = []
+        for title, info in self.iter_movies():
+            if query_lower in title.lower():
+                results.append((title, info))
+                if limit is not None and len(results) >= limit:
+                    break
+        return results
+
+    def iter_top_rated(self, offset=0):
+        """
+        Lazily yields the movies ordered by rating, best first.
+
+        The movies are read from the rating-ordered index that rating_stats
+        maintains, so nothing is sorted per call and callers can stop
+        after the page they need.
+
+        Yields:
+            tuple: (title, movie_info) tuples, skipping the first offset movies.
+        """
+        movies_data = self.get_movies_data()
+        for title in self._stats_index().top(offset=offset):
+            yield title, movies_data[title]
+
+    def top_rated(self, n=None, offset=0):
+        """
+        Returns a page of the movies ordered by rating, best first.
+
+        Ties keep their catalog order.
 
+        Args:
+            n (int): The number of movies to return, or None for all.
+            offset (int): The number of best movies to skip.
 
+        Returns:
+            list: (title, movie_info) tuples.
+        """
+        movies_data = self.get_movies_data()
+        return [(title, movies_data[title])
+                for title in self._stats_index().top(n, offset)]
+
+    def _scan_top_rated(self, n=None, offset=0):
+        """
+        Returns a page of the movies ordered by rating with a full scan.
 
+        A bounded heap keeps only offset + n movies in memory when n is given.
+        """
+        rating_key = lambda item: item[1]['rating']
+        if n is None:
+            return sorted(self.iter_movies(), key=rating_key, reverse=True)[offset:]
+        return heapq.nlargest(offset + n, self.iter_movies(), key=rating_key)[offset:]
 
+    def _stats_index(self):
+        """
+        Returns the incrementally maintained rating statistics, building them on first use.
+        """
+        movies_data = self.get_movies_data()
+        if self._rating_stats is None:
+            self._rating_stats = RatingStats(movies_data.items())
+        return self._rating_stats
 
+    def rating_stats(self):
+        """
+        Returns the rating statistics of the catalog.
+
+        The aggregates are kept up to date by add_movie, update_movie and
+        delete_movie, so only the first call scans the catalog.
+
+        Returns:
+            dict: count, average, median, best and worst ((title, rating)
+            tuples) and the titles tied for best and worst, or None when
+            the catalog is empty.
+        """
+        return self._stats_index().summary()
+
+    def rating_distribution(self, percents=PERCENTILES):
+        """
+        Returns the standard deviation and percentiles of the ratings.
+
+        They are read from the same incrementally maintained index as
+        rating_stats, so the catalog isn't scanned or sorted again.
+
+        Returns:
+            dict: std and the percents as "p25", "p75", ..., or None when
+            the catalog is empty.
+        """
+        return self._stats_index().distribution(percents)
+
+    def rating_stats_by_year(self):
+        """
+        Returns count, average, median, min and max rating per release year.
+        """
+        return self._stats_index().by_year()
+
+    def rating_stats_by_decade(self):
+        """
+        Returns count, average, median, min and max rating per decade.
+        """
+        return self._stats_index().by_decade()
+
+    def movies_between(self, first_year, last_year):
+        """
+        Returns the movies released from first_year to last_year (inclusive).
+
+        Returns:
+            list: (title, movie_info) tuples in catalog order.
+        """
+        return [(title, info) for title, info in self.iter_movies()
+                if first_year <= info['year'] <= last_year]
+
+    def query(self, where=None, order_by=None, limit=None, fields=None, offset=0):
+        """
+        Finds, orders and pages movies in one call, see movie_query.py.
+
+        Args:
+            where (dict): Conditions on "title", "year" and "rating".
+            order_by (str): "title", "rating" or "year", "-" in front for descending.
+            limit (int): The maximum number of results, or None for all.
+            fields (tuple): The movie_info fields returned, default all of them.
+            offset (int): The number of results to skip.
+
+        Returns:
+            list: (title, movie_info) tuples.
+
+        Raises:
+            ValueError: For an unknown field or a malformed condition.
+        """
+        conditions, order, fields = parse_query(where, order_by, fields)
+        return self._run_query(conditions, order, limit, offset, fields)
+
+    def _run_query(self, conditions, order, limit, offset, fields):
+        """
+        Runs a parsed query on the in-memory snapshot.
+
+        A title condition only checks the titles the trigram index finds,
+        and a query ordered by "-rating" walks the rating index best first,
+        stopping once offset + limit movies matched. Other queries are a
+        single scan with a bounded heap.
+        """
+        movies_data = self.get_movies_data()
+        if "title" in conditions:
+            if self._search_index is None:
+                self._search_index = TitleIndex(movies_data)
+            titles = self._search_index.substring(conditions["title"])
+            movies = ((title, movies_data[title]) for title in titles)
+        elif order == ("rating", True):
+            movies = ((title, movies_data[title]) for title in self._stats_index().top())
+            return scan(movies, conditions, None, limit, offset, fields)
+        else:
+            movies = self.iter_movies()
+        return scan(movies, conditions, order, limit, offset, fields)
+
+    def _scan_rating_stats(self):
+        """
+        Calculates the rating statistics of the catalog in a single pass.
+
+        Returns:
+            dict: The same keys as rating_stats, or None when the catalog
+            is empty.
+        """
+        ratings = []
+        for title, movie_info in self.iter_movies():
+            rating = movie_info["rating"]
+            if not ratings or rating > best_rating:
+                best_rating, best_ties = rating, [title]
+            elif rating == best_rating:
+                best_ties.append(title)
+            if not ratings or rating < worst_rating:
+                worst_rating, worst_ties = rating, [title]
+            elif rating == worst_rating:
+                worst_ties.append(title)
+            ratings.append(rating)
+        if not ratings:
+            return None
+        return {
+            "count": len(ratings),
+            "average": sum(ratings) / len(ratings),
+            "median": median(ratings),
+            "best": (best_ties[0], best_rating),
+            "worst": (worst_ties[0], worst_rating),
+            "best_ties": best_ties,
+            "worst_ties": worst_ties
+        }
@@ -1,7 +1,14 @@
+import atexit
+import os
 import sys
+from batch import run_batch
 from movie_app import MovieApp
 from storage_json import StorageJson
 from storage_csv import StorageCsv
+from storage_factory import open_storage
+from storage_registry import StorageRegistry
+from shared_catalog import SharedCatalog
+
 
 def main():
     """
@@ -11,22 +18,47 @@ def main():
         It allows users to choose between different storage options and family member storage.
         After selecting the storage, it creates a MovieApp object and runs the application.
 
+        `python main.py <storage file> --batch [operations.jsonl]` runs the JSONL operations
+        (read from stdin when no file is given) without any prompts, see batch.py.
+        `--metrics FILE` records command and storage latencies and writes them to
+        FILE (JSON for .json, Prometheus text otherwise) on exit, see instrumentation.py.
+
         Returns:
             None
         """
-    if len(sys.argv) == 2:
-        storage_file = sys.argv[1]
-        # Determine storage type from the file extension
-        storage_type = "JSON" if storage_file.lower().endswith(".json") else "CSV"
-        print(f"Using {storage_type} storage")
+    instrumentation = None
+    if "--metrics" in sys.argv[:-1]:
+        position = sys.argv.index("--metrics")
+        metrics_file = sys.argv[position + 1]
+        del sys.argv[position:position + 2]
+        # Only imported when asked for, so it costs nothing at startup otherwise.
+        from instrumentation import Instrumentation
+        instrumentation = Instrumentation()
+        atexit.register(instrumentation.dump, metrics_file)
 
-        if storage_type == "JSON":
-            storage = StorageJson(storage_file)
-        elif storage_type == "CSV":
-            storage = StorageCsv(storage_file)
+    if len(sys.argv) in (3, 4) and sys.argv[2] == "--batch":
+        opened = open_storage(sys.argv[1])
+        if opened is None:
+            print("Invalid file extension. Please use JSON, CSV or SQLite (.db/.sqlite) files.",
+                  file=sys.stderr)
+            sys.exit(2)
+        _, storage = opened
+        if len(sys.argv) == 4:
+            with open(sys.argv[3], "r") as requests:
+                run_batch(storage, requests, sys.stdout)
         else:
-            print("Invalid file extension. Please use JSON or CSV files.")
+            run_batch(storage, sys.stdin, sys.stdout)
+        return
+
+    if len(sys.argv) == 2:
+        # Determine storage type from the file extension
+        opened = open_storage(sys.argv[1])
+        if opened is None:
+            print("Invalid file extension. Please use JSON, CSV or SQLite (.db/.sqlite) files.")
             return
+
+        storage_type, storage = opened
+        print(f"Using {storage_type} storage")
     else:
         print("######## Movie Database ########")
         storage_option = int(input("Enter the number 1 to choose JSON and 2 for CSV file format: "))
@@ -36,17 +68,16 @@ def main():
             storage = StorageCsv('movies.csv')
         else:
             print("Invalid choice. Please enter 1 for JSON or 2 for CSV.")
-    family_storage = {
-        'John': StorageJson('john.json', 'John'),
-        'Sara': StorageJson('sara.json', 'Sara'),
-        'Jack': StorageJson('jack.json', 'Jack')
-    }
+    # Profiles are discovered now, but only the chosen one is loaded.
+    # Once they were migrated (see shared_catalog.py) they share catalog.json.
+    catalog = SharedCatalog('catalog.json') if os.path.exists('catalog.json') else None
+    family_storage = StorageRegistry(catalog=catalog)
 
     family_option = int(input("Enter the number 3 to work with family members' storage or 1 for Json and 2 for CSV default storage: "))
 
     if family_option ==3:
         print("Choose a Family member: ")
-        for index, (family_member, _) in enumerate(family_storage.items(), 1):
+        for index, family_member in enumerate(family_storage.names(), 1):
             print(f"{index}. {family_member}")
 
         choice = int(input("Enter the number of the family member: "))
@@ -55,14 +86,14 @@ def main():
         if choice < 1 or choice > len(family_storage):
             print("Invalid choice. Please choose a valid family member.")
         else:
-            selected_family_member = list(family_storage.keys())[choice - 1]
-            selected_file = family_storage[selected_family_member]
+            selected_family_member = family_storage.names()[choice - 1]
+            selected_file = family_storage.get(selected_family_member)
             storage = selected_file
             print(f'You are working on {selected_family_member} files.')
     else:
         print(f'Working with default Json/CSV storage.')
 
-    movie_app = MovieApp(storage)
+    movie_app = MovieApp(storage, instrumentation)
     movie_app.run()
 
 
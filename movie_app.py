@@ -1,9 +1,31 @@
-from statistics import median
-import random
-import matplotlib.pyplot as plt
+import os
+import rating_analytics
+from histogram_service import HistogramService
+
+# Number of movies _sorted_by_rating prints before asking to show more.
+PAGE_SIZE = 20
+# The names the commands are recorded under, see instrumentation.py.
+COMMAND_NAMES = {
+    0: "exit", 1: "list", 2: "add", 3: "delete", 4: "update", 5: "stats",
+    6: "random", 7: "search", 8: "sorted", 9: "histogram"
+}
+
+
 class MovieApp:
-    def __init__(self, storage):
+    def __init__(self, storage, instrumentation=None, histograms=None):
+        """
+        Args:
+            storage (IStorage): The movie storage.
+            instrumentation (Instrumentation): Record the latency of the
+                commands and storage calls, see instrumentation.py.
+            histograms (HistogramService): Caches the rating histograms,
+                e.g. shared between the apps of several profiles.
+        """
         self._storage = storage
+        self._instrumentation = instrumentation
+        self._histograms = histograms if histograms is not None else HistogramService()
+        if instrumentation is not None:
+            instrumentation.instrument_storage(storage)
 
     # def _command_list_movies(self):
     #     movies = self._storage.list_movies()
@@ -39,6 +61,13 @@ class MovieApp:
         Args:
             command (int): The user's choice of command (0-9).
         """
+        if self._instrumentation is None:
+            self._dispatch(command)
+        else:
+            self._instrumentation.run_command(
+                COMMAND_NAMES.get(command, str(command)), self._dispatch, command)
+
+    def _dispatch(self, command):
         if command == 1:
             self._storage.list_movies()
         elif command == 2:
@@ -133,16 +162,16 @@ class MovieApp:
             It shows the random movies from the movie db.
             """
 
-        movies_data = self._storage.load_movies_data()
+        movie = self._storage.random_movie()
 
-        if not movies_data:
+        if movie is None:
             print("No movies in the database.")
             return
 
-        rand_movie = random.choice(list(movies_data.keys()))
-        rand_rating = movies_data[rand_movie]['rating']
-        rand_year = movies_data[rand_movie]['year']
-        rand_poster = movies_data[rand_movie]['poster']  # Assuming the 'poster' key exists in your movie data
+        rand_movie, movie_info = movie
+        rand_rating = movie_info['rating']
+        rand_year = movie_info['year']
+        rand_poster = movie_info.get('poster')
 
         print(f'Random Movie: {rand_movie}\tRating: {rand_rating}\tYear: {rand_year}\tPoster: {rand_poster}')
 
@@ -160,64 +189,63 @@ class MovieApp:
                 None
             """
         movie_name = input("Enter the movie name to search from the movie database: ")
-        name_lower = movie_name.lower()
-        found = False
-        for movie_name, info in self._storage.load_movies_data().items():
-            if name_lower in movie_name.lower():
-                print(f"The name of the movie \"{movie_name}\" is: {info['rating']} "
-                      f"(Rating), {info['year']} (Year), {info['poster']} (poster)")
-
-                found = True
-        if not found:
+        results = self._storage.query(where={"title": movie_name})
+        for title, info in results:
+            print(f"The name of the movie \"{title}\" is: {info['rating']} "
+                  f"(Rating), {info['year']} (Year), {info['poster']} (poster)")
+        if not results:
             print(f"No movie has found for the name: {movie_name}")
 
 
     def _sorted_by_rating(self):
         """
            Display movies sorted by their ratings.
-           """
-        movies_info = self._storage.load_movies_data()
-        if not movies_info:
-            print("No movies in the database.")
-            return
 
-        movies_sorted_by_rating = sorted(movies_info.items(),
-                                         key=lambda item: item[1]['rating'], reverse=True)
-        if movies_sorted_by_rating:
-            print("Movies sorted by rating:")
-            for movie_name, movie_info in movies_sorted_by_rating:
+           The movies are fetched from the storage one page at a time,
+           and the user is asked before the next page is shown.
+           """
+        offset = 0
+        while True:
+            page = self._storage.query(order_by="-rating", limit=PAGE_SIZE, offset=offset)
+            if not page:
+                if offset == 0:
+                    print("No movies in the database.")
+                return
+
+            if offset == 0:
+                print("Movies sorted by rating:")
+            for movie_name, movie_info in page:
                 poster = movie_info.get('poster', 'Poster not available')
                 print(f"The name of the movie \"{movie_name}\" is: {movie_info['rating']}"
                       f"(Rating), {movie_info['year']} (Year),{poster}(Poster)")
+            offset += len(page)
+
+            if len(page) < PAGE_SIZE:
+                return
+            show_more = input("Show more movies? (Y/N): ")
+            if "Y" not in show_more.upper():
+                return
 
     def _create_rating_histogram(self):
         """
             Creates and saves a rating histogram for the movies in the database.
 
-            This method retrieves the ratings of all movies from the storage and generates a histogram to visualize
-            the distribution of movie ratings. The histogram is then saved to a file provided by the user.
+            The ratings are binned in one bulk call, and the bins and the drawn image are cached
+            until the ratings change, so saving the histogram of an unchanged catalog again doesn't
+            redraw it. The histogram is saved to a file provided by the user. A .csv or .json file
+            name exports the bins as data instead of a plot.
 
             Returns:
                 None
             """
 
-        movie_info = self._storage.load_movies_data()
-
-        if not movie_info:
-            print("No movies available in the movie database.")
-            return
-
-        ratings = [info['rating'] for info in movie_info.values()]
-
-        if ratings:
-            plt.hist(ratings, bins=10, edgecolor='black')
-            plt.xlabel('Rating')
-            plt.ylabel('Frequency')
-            plt.title('Rating Histogram')
+        if self._histograms.binned(self._storage):
             file_name = input("Enter the file name to save the histogram (e.g., histogram.png): ")
-            plt.savefig(file_name)
-            plt.close()
-            print(f"Histogram saved to {file_name}")
+            self._histograms.save(self._storage, file_name)
+            if os.path.splitext(file_name)[1].lower() in (".csv", ".json"):
+                print(f"Histogram data saved to {file_name}")
+            else:
+                print(f"Histogram saved to {file_name}")
         else:
             print("No movies available in the movie database.")
 
@@ -232,19 +260,21 @@ class MovieApp:
                 None
             """
 
-        movies_data = self._storage.load_movies_data()
-        ratings = [movie_info["rating"] for movie_info in movies_data.values()]
+        stats = self._storage.rating_stats()
+
+        if stats:
+            best_movie, best_rating = stats["best"]
+            worst_movie, worst_rating = stats["worst"]
 
-        if ratings:
-            average = sum(ratings) / len(ratings)
-            median_raiting = median(ratings)
-            best_movie = max(movies_data, key=lambda title: movies_data[title]["rating"])
-            worst_movie = min(movies_data, key=lambda title: movies_data[title]["rating"])
+            print(f"Average rating: {stats['average']:.2f}")
+            print(f"Median rating: {stats['median']:.2f}")
+            print(f"Best movie: {best_movie} ({best_rating:.2f})")
+            print(f"Worst movie: {worst_movie} ({worst_rating:.2f})")
 
-            print(f"Average rating: {average:.2f}")
-            print(f"Median rating: {median_raiting:.2f}")
-            print(f"Best movie: {best_movie} ({movies_data[best_movie]['rating']:.2f})")
-            print(f"Worst movie: {worst_movie} ({movies_data[worst_movie]['rating']:.2f})")
+            distribution = self._storage.rating_distribution()
+            print(f"Standard deviation: {distribution['std']:.2f}")
+            print(", ".join(f"{percent}th percentile: {distribution[f'p{percent}']:.2f}"
+                            for percent in rating_analytics.PERCENTILES))
         else:
             print("No movies available in the movie database.")
 
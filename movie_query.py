@@ -0,0 +1,156 @@
+"""
+The queries of IStorage.query, and the single pass scan that runs them
+on (title, movie_info) pairs when a backend has nothing better:
+
+    storage.query(where={"year": (1990, 1999)}, order_by="-rating",
+                  limit=20, fields=("rating", "year"))
+
+where maps fields to conditions that must all hold:
+    "title": text the title contains (case-insensitive)
+    "year", "rating": a value the field equals, or a (low, high) range
+        including both ends, where None leaves an end open
+
+order_by is "title", "rating" or "year", with a "-" in front to sort
+descending. Ties, and queries without order_by, keep the catalog order.
+fields are the movie_info keys returned, e.g. ("rating", "year") to
+skip the posters. The title is always returned.
+"""
+import heapq
+from itertools import islice
+
+FIELDS = ("rating", "year", "poster")
+ORDER_FIELDS = ("title", "rating", "year")
+RANGE_FIELDS = ("rating", "year")
+
+
+def _is_number(value):
+    return isinstance(value, (int, float)) and not isinstance(value, bool)
+
+
+def parse_query(where=None, order_by=None, fields=None):
+    """
+    Validates and normalizes the arguments of IStorage.query.
+
+    Returns:
+        tuple: (conditions, order, fields). conditions maps "title" to
+        the lowercased text and "year" / "rating" to (low, high) tuples,
+        order is (field, descending) or None, fields is a tuple.
+
+    Raises:
+        ValueError: For an unknown field or a malformed condition.
+    """
+    conditions = {}
+    for field, condition in (where or {}).items():
+        if field == "title":
+            if not isinstance(condition, str):
+                raise ValueError("The title condition must be a string")
+            conditions["title"] = condition.lower()
+        elif field in RANGE_FIELDS:
+            if isinstance(condition, (list, tuple)):
+                if len(condition) != 2:
+                    raise ValueError(f"The {field} range must be (low, high)")
+                if not all(bound is None or _is_number(bound) for bound in condition):
+                    raise ValueError(f"The {field} range bounds must be numbers or None")
+                conditions[field] = tuple(condition)
+            elif _is_number(condition):
+                conditions[field] = (condition, condition)
+            else:
+                raise ValueError(f"The {field} condition must be a number or a (low, high) range")
+        else:
+            raise ValueError(f"Unknown query field: {field}")
+    order = None
+    if order_by is not None:
+        field = order_by.lstrip("-")
+        if field not in ORDER_FIELDS:
+            raise ValueError(f"Unknown order field: {field}")
+        order = (field, order_by.startswith("-"))
+    if fields is None:
+        fields = FIELDS
+    for field in fields:
+        if field not in FIELDS:
+            raise ValueError(f"Unknown field: {field}")
+    return conditions, order, tuple(fields)
+
+
+def needed_fields(conditions, order, fields):
+    """
+    Returns the movie_info fields a query reads: the returned fields and
+    the fields it filters and sorts on.
+    """
+    needed = set(fields) | (set(conditions) - {"title"})
+    if order is not None and order[0] != "title":
+        needed.add(order[0])
+    return tuple(field for field in FIELDS if field in needed)
+
+
+def year_bounds(conditions):
+    """
+    Returns the (first, last) years a query can match, open ends as None.
+    """
+    return conditions.get("year", (None, None))
+
+
+def predicate(conditions):
+    """
+    Returns a function (title, movie_info) -> bool checking all the conditions.
+    """
+    checks = []
+    if "title" in conditions:
+        text = conditions["title"]
+        checks.append(lambda title, movie_info: text in title.lower())
+    for field in RANGE_FIELDS:
+        if field not in conditions:
+            continue
+        low, high = conditions[field]
+        if low is not None:
+            checks.append(lambda title, movie_info, field=field, low=low:
+                          movie_info[field] >= low)
+        if high is not None:
+            checks.append(lambda title, movie_info, field=field, high=high:
+                          movie_info[field] <= high)
+    if not checks:
+        return lambda title, movie_info: True
+    return lambda title, movie_info: all(check(title, movie_info) for check in checks)
+
+
+def order_key(order):
+    """
+    Returns the sort key of (title, movie_info) pairs for order.
+    Titles sort case-insensitively.
+    """
+    field = order[0]
+    if field == "title":
+        return lambda item: item[0].lower()
+    return lambda item: item[1][field]
+
+
+def project(movie_info, fields):
+    """
+    Copies the fields of movie_info, leaving out the ones it doesn't have.
+    """
+    return {field: movie_info[field] for field in fields if field in movie_info}
+
+
+def scan(movies, conditions, order=None, limit=None, offset=0, fields=FIELDS):
+    """
+    Runs a query over (title, movie_info) pairs in a single pass.
+
+    Without an order the scan stops after offset + limit matches. With
+    an order and a limit, a bounded heap keeps only offset + limit
+    movies instead of sorting all the matches.
+
+    Returns:
+        list: (title, movie_info) tuples, movie_info holding only fields.
+    """
+    keep = predicate(conditions)
+    matching = ((title, movie_info) for title, movie_info in movies if keep(title, movie_info))
+    stop = None if limit is None else offset + limit
+    if order is None:
+        selected = islice(matching, offset, stop)
+    elif stop is None:
+        selected = sorted(matching, key=order_key(order), reverse=order[1])[offset:]
+    elif order[1]:
+        selected = heapq.nlargest(stop, matching, key=order_key(order))[offset:]
+    else:
+        selected = heapq.nsmallest(stop, matching, key=order_key(order))[offset:]
+    return [(title, project(movie_info, fields)) for title, movie_info in selected]
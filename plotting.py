@@ -0,0 +1,61 @@
+"""
+Plotting helpers for MovieApp.
+
+matplotlib is only imported when a plot is actually drawn, so starting
+the app (and any scripted run that never plots) doesn't pay for it.
+"""
+import io
+
+
+def histogram_figure(counts, edges):
+    """
+    Draws a rating histogram from precomputed bins on a new Figure.
+
+    The figure has its own Agg canvas and never goes through pyplot, so
+    it isn't registered in pyplot's global state and figures can be
+    drawn in several threads at once.
+
+    Args:
+        counts (list): The number of ratings in every bin.
+        edges (list): The bin edges, one more than counts.
+
+    Returns:
+        Figure: The histogram.
+    """
+    from matplotlib.backends.backend_agg import FigureCanvasAgg
+    from matplotlib.figure import Figure
+    figure = Figure()
+    FigureCanvasAgg(figure)
+    axes = figure.add_subplot()
+    axes.hist(edges[:-1], bins=edges, weights=counts, edgecolor='black')
+    axes.set_xlabel('Rating')
+    axes.set_ylabel('Frequency')
+    axes.set_title('Rating Histogram')
+    return figure
+
+
+def render_histogram(counts, edges, image_format="png"):
+    """
+    Renders a rating histogram to image bytes, e.g. to cache or serve them.
+
+    Args:
+        image_format (str): Any format matplotlib can save, e.g. "png" or "svg".
+
+    Returns:
+        bytes: The image.
+    """
+    buffer = io.BytesIO()
+    histogram_figure(counts, edges).savefig(buffer, format=image_format)
+    return buffer.getvalue()
+
+
+def save_histogram(counts, edges, file_name):
+    """
+    Draws a rating histogram from precomputed bins and saves it to file_name.
+
+    Args:
+        counts (list): The number of ratings in every bin.
+        edges (list): The bin edges, one more than counts.
+        file_name (str): The image file to write, e.g. histogram.png.
+    """
+    histogram_figure(counts, edges).savefig(file_name)
@@ -0,0 +1,516 @@
+"""
+Poster images: an on-disk cache, concurrent fetching and URL validation.
+
+PosterCache keeps every downloaded image once under the SHA-256 of its
+content, with an index from poster URL to image (and from broken URLs
+to the reason they are broken):
+
+    posters/
+        index.json
+        objects/3f/3fa9...e1
+
+PosterFetcher downloads and validates posters from an asyncio event
+loop. The requests run with http.client in a thread pool, every thread
+reusing kept-alive connections per host, at most concurrency requests
+run at a time and at most rate requests are started per second. A
+poster that is cached is never requested again, and in offline mode
+posters are only served from the cache.
+
+validate_storage sends a HEAD request for every poster of a storage and
+records the URLs that are broken (truncated, malformed, 4xx, or not an
+image) in the cache index, so they aren't fetched again. The catalog
+keeps the URLs, since a truncated one can still be repaired by hand.
+Servers answering 5xx or not at all are reported but left alone, since
+they may only be down for now.
+
+Usage:
+    python posters.py movies.json --validate
+    python posters.py movies.json --fetch --cache-dir posters/ --concurrency 16 --rate 50
+    python posters.py --serve 8000 --cache-dir posters/
+"""
+import argparse
+import asyncio
+import hashlib
+import http.client
+import json
+import os
+import sys
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import parse_qs, urljoin, urlsplit
+from file_utils import atomic_write
+from storage_factory import open_storage
+
+USER_AGENT = "MovieApp-posters/1.0"
+MAX_REDIRECTS = 5
+REDIRECT_STATUSES = (301, 302, 303, 307, 308)
+# Poster values the catalogs use for "no poster", which aren't broken URLs.
+NO_POSTER = ("", "N/A", "Not Available")
+
+
+def url_problem(url):
+    """
+    Checks a poster URL without any network access.
+
+    Returns:
+        str: Why the URL can't be fetched (e.g. it was truncated with "…"),
+        or None if it looks fine.
+    """
+    if url is None or url.strip() in NO_POSTER:
+        return "missing"
+    if "…" in url or url.endswith("..."):
+        return "truncated"
+    try:
+        parts = urlsplit(url)
+    except ValueError:
+        return "malformed"
+    if parts.scheme not in ("http", "https") or not parts.netloc:
+        return "malformed"
+    try:
+        url.encode("ascii")
+    except UnicodeEncodeError:
+        return "malformed"
+    return None
+
+
+class PosterCache:
+    """
+    A content-addressed store of poster images.
+
+    Identical images behind different URLs are stored once. Changes to
+    the index are kept in memory until save() writes it atomically.
+    """
+
+    def __init__(self, directory="posters"):
+        self.directory = directory
+        self._index_path = os.path.join(directory, "index.json")
+        self._lock = threading.Lock()
+        self._index = {}
+        if os.path.exists(self._index_path):
+            with open(self._index_path, "r") as file_obj:
+                self._index = json.load(file_obj)
+
+    def _object_path(self, digest):
+        return os.path.join(self.directory, "objects", digest[:2], digest)
+
+    def path(self, url):
+        """
+        Returns the file the image of url is cached in, or None if it isn't cached.
+        """
+        entry = self._index.get(url)
+        if entry is None or "sha256" not in entry:
+            return None
+        path = self._object_path(entry["sha256"])
+        return path if os.path.exists(path) else None
+
+    def get(self, url):
+        """
+        Returns:
+            tuple: (image bytes, content type), or None if url isn't cached.
+        """
+        path = self.path(url)
+        if path is None:
+            return None
+        with open(path, "rb") as file_obj:
+            return file_obj.read(), self._index[url].get("content_type")
+
+    def put(self, url, content, content_type=None):
+        """
+        Stores the image of url and returns its SHA-256.
+        """
+        digest = hashlib.sha256(content).hexdigest()
+        path = self._object_path(digest)
+        if not os.path.exists(path):
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+            with atomic_write(path, "wb") as file_obj:
+                file_obj.write(content)
+        with self._lock:
+            self._index[url] = {"sha256": digest, "content_type": content_type,
+                                "size": len(content)}
+        return digest
+
+    def mark_broken(self, url, reason):
+        with self._lock:
+            self._index[url] = {"broken": reason, "checked": time.time()}
+
+    def clear_broken(self, url):
+        """
+        Forgets that url was found broken, e.g. once it answers again.
+        """
+        with self._lock:
+            entry = self._index.get(url)
+            if entry is not None and "broken" in entry:
+                del self._index[url]
+
+    def broken_reason(self, url):
+        """
+        Returns why url was found broken, or None if it wasn't.
+        """
+        entry = self._index.get(url)
+        return entry.get("broken") if entry is not None else None
+
+    def __contains__(self, url):
+        return self.path(url) is not None
+
+    def __len__(self):
+        return sum(1 for entry in self._index.values() if "sha256" in entry)
+
+    def save(self):
+        """
+        Writes the index, replacing the previous one atomically.
+        """
+        os.makedirs(self.directory, exist_ok=True)
+        with self._lock:
+            index = dict(self._index)
+        with atomic_write(self._index_path) as file_obj:
+            json.dump(index, file_obj, indent=4)
+
+
+class ConnectionPool:
+    """
+    Keeps idle kept-alive HTTP connections per (scheme, host) for reuse.
+
+    A connection is only used by one thread at a time: it is taken out
+    of the pool for a request and put back once the response was read.
+    """
+
+    def __init__(self, timeout=10.0):
+        self.timeout = timeout
+        self.opened = 0
+        self._idle = {}
+        self._lock = threading.Lock()
+
+    def _take(self, scheme, netloc):
+        with self._lock:
+            idle = self._idle.get((scheme, netloc))
+            if idle:
+                return idle.pop(), True
+            self.opened += 1
+        if scheme == "https":
+            return http.client.HTTPSConnection(netloc, timeout=self.timeout), False
+        return http.client.HTTPConnection(netloc, timeout=self.timeout), False
+
+    def _give_back(self, scheme, netloc, connection):
+        with self._lock:
+            self._idle.setdefault((scheme, netloc), []).append(connection)
+
+    def request(self, method, url):
+        """
+        Sends one request, following redirects.
+
+        A kept-alive connection the server closed in the meantime is
+        replaced and the request is sent once more.
+
+        Returns:
+            tuple: (status, headers, body, final url). The body is empty for HEAD.
+        """
+        for _ in range(MAX_REDIRECTS + 1):
+            parts = urlsplit(url)
+            target = parts.path or "/"
+            if parts.query:
+                target += "?" + parts.query
+            while True:
+                connection, reused = self._take(parts.scheme, parts.netloc)
+                try:
+                    connection.request(method, target, headers={"User-Agent": USER_AGENT})
+                    response = connection.getresponse()
+                    body = response.read()
+                except (http.client.RemoteDisconnected, ConnectionResetError, BrokenPipeError):
+                    connection.close()
+                    if reused:
+                        continue
+                    raise
+                except BaseException:
+                    connection.close()
+                    raise
+                break
+            if response.will_close:
+                connection.close()
+            else:
+                self._give_back(parts.scheme, parts.netloc, connection)
+            location = response.getheader("Location")
+            if response.status not in REDIRECT_STATUSES or not location:
+                return response.status, response.headers, body, url
+            url = urljoin(url, location)
+        raise http.client.HTTPException(f"more than {MAX_REDIRECTS} redirects")
+
+    def close(self):
+        with self._lock:
+            idle, self._idle = self._idle, {}
+        for connections in idle.values():
+            for connection in connections:
+                connection.close()
+
+
+class RateLimiter:
+    """
+    Spaces the starts of requests at least 1 / rate seconds apart.
+    Only used from the event loop thread, so it needs no lock.
+    """
+
+    def __init__(self, rate):
+        self.rate = rate
+        self._next = 0.0
+
+    async def wait(self):
+        loop = asyncio.get_running_loop()
+        now = loop.time()
+        slot = max(now, self._next)
+        self._next = slot + 1 / self.rate
+        if slot > now:
+            await asyncio.sleep(slot - now)
+
+
+class PosterFetcher:
+    def __init__(self, cache, concurrency=8, rate=None, timeout=10.0, offline=False):
+        """
+        Args:
+            cache (PosterCache): Where the downloaded posters are kept.
+            concurrency (int): The maximum number of requests in flight,
+                and the number of threads sending them.
+            rate (float): The maximum number of requests started per
+                second, or None for no limit.
+            timeout (float): Seconds to wait for a server.
+            offline (bool): Only serve posters from the cache, never
+                touching the network.
+        """
+        self.cache = cache
+        self.offline = offline
+        self.requests = 0
+        self._pool = ConnectionPool(timeout)
+        self._executor = ThreadPoolExecutor(concurrency, thread_name_prefix="posters")
+        self._slots = asyncio.Semaphore(concurrency)
+        self._limiter = RateLimiter(rate) if rate else None
+
+    async def _request(self, method, url):
+        async with self._slots:
+            if self._limiter is not None:
+                await self._limiter.wait()
+            self.requests += 1
+            loop = asyncio.get_running_loop()
+            return await loop.run_in_executor(self._executor, self._pool.request, method, url)
+
+    async def fetch(self, url):
+        """
+        Downloads the poster image of url into the cache, unless it is
+        cached already or was found broken (check() looks again).
+
+        Returns:
+            dict: url, status ("cached", "fetched", "broken", "error" or
+            "missing" when offline) and the detail of a failure.
+        """
+        if url in self.cache:
+            return {"url": url, "status": "cached", "detail": None}
+        reason = self.cache.broken_reason(url)
+        if reason is not None:
+            return {"url": url, "status": "broken", "detail": reason}
+        problem = url_problem(url)
+        if problem is not None:
+            if problem != "missing":
+                self.cache.mark_broken(url, problem)
+            return {"url": url, "status": "broken", "detail": problem}
+        if self.offline:
+            return {"url": url, "status": "missing", "detail": "not cached"}
+        try:
+            status, headers, body, _ = await self._request("GET", url)
+        except (OSError, http.client.HTTPException) as error:
+            return {"url": url, "status": "error", "detail": f"{type(error).__name__}: {error}"}
+        verdict = self._verdict(status, headers)
+        if verdict is not None:
+            if verdict[0] == "broken":
+                self.cache.mark_broken(url, verdict[1])
+            return {"url": url, "status": verdict[0], "detail": verdict[1]}
+        loop = asyncio.get_running_loop()
+        await loop.run_in_executor(self._executor, self.cache.put, url, body,
+                                   headers.get("Content-Type"))
+        return {"url": url, "status": "fetched", "detail": None}
+
+    async def check(self, url):
+        """
+        Validates url with a HEAD request, falling back to GET for
+        servers that don't allow HEAD. A cached poster is valid, and
+        a movie without a poster is "broken" with the detail "missing".
+        A valid answer clears an earlier broken mark, so fetch() tries
+        the URL again.
+
+        Returns:
+            dict: url, status ("ok", "broken" or "error") and the detail of a failure.
+        """
+        if url in self.cache:
+            return {"url": url, "status": "ok", "detail": "cached"}
+        problem = url_problem(url)
+        if problem is not None:
+            if problem != "missing":
+                self.cache.mark_broken(url, problem)
+            return {"url": url, "status": "broken", "detail": problem}
+        if self.offline:
+            reason = self.cache.broken_reason(url)
+            status = "broken" if reason is not None else "ok"
+            return {"url": url, "status": status, "detail": reason or "not checked"}
+        try:
+            status, headers, _, _ = await self._request("HEAD", url)
+            if status in (405, 501):
+                status, headers, _, _ = await self._request("GET", url)
+        except (OSError, http.client.HTTPException) as error:
+            return {"url": url, "status": "error", "detail": f"{type(error).__name__}: {error}"}
+        verdict = self._verdict(status, headers)
+        if verdict is None:
+            self.cache.clear_broken(url)
+            return {"url": url, "status": "ok", "detail": None}
+        if verdict[0] == "broken":
+            self.cache.mark_broken(url, verdict[1])
+        return {"url": url, "status": verdict[0], "detail": verdict[1]}
+
+    @staticmethod
+    def _verdict(status, headers):
+        """
+        Returns ("broken" or "error", detail) for a failed response, or None.
+        """
+        if status >= 500 or status == 429:
+            return "error", f"HTTP {status}"
+        if status >= 400:
+            return "broken", f"HTTP {status}"
+        content_type = headers.get("Content-Type", "")
+        if content_type and not content_type.startswith("image/"):
+            return "broken", f"not an image ({content_type})"
+        return None
+
+    async def fetch_all(self, urls):
+        """
+        Fetches many posters concurrently. Duplicate URLs are fetched once.
+
+        Returns:
+            list: The result of every distinct URL, see fetch.
+        """
+        return await asyncio.gather(*(self.fetch(url) for url in dict.fromkeys(urls)))
+
+    async def check_all(self, urls):
+        """
+        Validates many posters concurrently. Duplicate URLs are checked once.
+
+        Returns:
+            list: The result of every distinct URL, see check.
+        """
+        return await asyncio.gather(*(self.check(url) for url in dict.fromkeys(urls)))
+
+    def close(self):
+        self._executor.shutdown()
+        self._pool.close()
+
+
+async def validate_storage(storage, fetcher):
+    """
+    Validates the poster URL of every movie in storage.
+
+    The broken URLs are marked in the fetcher's cache index (see
+    PosterCache.mark_broken), the storage itself isn't changed.
+
+    Args:
+        storage (IStorage): The catalog to check.
+        fetcher (PosterFetcher): Sends the HEAD requests.
+
+    Returns:
+        dict: title -> result (see PosterFetcher.check) of every movie
+        whose poster isn't "ok". Movies without a poster aren't problems.
+    """
+    posters = {title: movie_info.get('poster') for title, movie_info in storage.iter_movies()}
+    results = {result["url"]: result
+               for result in await fetcher.check_all(posters.values())}
+    problems = {title: results[url] for title, url in posters.items()
+                if results[url]["status"] != "ok" and results[url]["detail"] != "missing"}
+    return problems
+
+
+def make_cache_handler(cache):
+    """
+    Returns a request handler serving cached posters: GET /poster?url=<poster url>.
+    """
+    class CachedPosterHandler(BaseHTTPRequestHandler):
+        def do_GET(self):
+            parts = urlsplit(self.path)
+            url = parse_qs(parts.query).get("url", [None])[0]
+            cached = cache.get(url) if parts.path == "/poster" and url else None
+            if cached is None:
+                self.send_error(404, "Poster not cached")
+                return
+            content, content_type = cached
+            self.send_response(200)
+            self.send_header("Content-Type", content_type or "application/octet-stream")
+            self.send_header("Content-Length", str(len(content)))
+            self.send_header("Cache-Control", "max-age=86400")
+            self.end_headers()
+            self.wfile.write(content)
+
+        def log_message(self, format, *args):
+            pass
+
+    return CachedPosterHandler
+
+
+def serve_cache(cache, port=8000, host="127.0.0.1"):
+    """
+    Serves the cached posters over HTTP until interrupted.
+    """
+    server = ThreadingHTTPServer((host, port), make_cache_handler(cache))
+    print(f"Serving {len(cache)} cached posters on http://{host}:{server.server_port}/poster?url=...")
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.server_close()
+
+
+async def _run(args, storage, cache):
+    fetcher = PosterFetcher(cache, args.concurrency, args.rate, args.timeout, args.offline)
+    try:
+        start = time.perf_counter()
+        if args.validate:
+            problems = await validate_storage(storage, fetcher)
+            for title, result in sorted(problems.items()):
+                print(f"{title}: {result['status']} ({result['detail']}) {result['url']}")
+            print(f"{len(problems)} posters with problems")
+        if args.fetch:
+            results = await fetcher.fetch_all(
+                movie_info.get('poster') for _, movie_info in storage.iter_movies())
+            counts = {}
+            for result in results:
+                counts[result["status"]] = counts.get(result["status"], 0) + 1
+            print(", ".join(f"{count} {status}" for status, count in sorted(counts.items())))
+        elapsed = time.perf_counter() - start
+        rate = fetcher.requests / elapsed if elapsed else 0
+        print(f"{fetcher.requests} requests in {elapsed:.2f}s ({rate:,.1f} posters/s)")
+    finally:
+        fetcher.close()
+        cache.save()
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Validate, fetch and serve poster images.")
+    parser.add_argument("storage", nargs="?", help="the catalog file")
+    parser.add_argument("--cache-dir", default="posters", help="where the posters are cached")
+    parser.add_argument("--validate", action="store_true", help="check the poster URLs")
+    parser.add_argument("--fetch", action="store_true", help="download the posters")
+    parser.add_argument("--offline", action="store_true", help="only use the cache")
+    parser.add_argument("--concurrency", type=int, default=8, help="requests in flight")
+    parser.add_argument("--rate", type=float, help="maximum requests per second")
+    parser.add_argument("--timeout", type=float, default=10.0, help="seconds per request")
+    parser.add_argument("--serve", type=int, metavar="PORT", help="serve the cached posters")
+    args = parser.parse_args(argv)
+    cache = PosterCache(args.cache_dir)
+    if args.serve is not None:
+        serve_cache(cache, args.serve)
+        return 0
+    if args.storage is None or not (args.validate or args.fetch):
+        parser.error("a catalog file and --validate and/or --fetch are required")
+    opened = open_storage(args.storage)
+    if opened is None:
+        parser.error("unknown catalog format")
+    asyncio.run(_run(args, opened[1], cache))
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,162 @@
+import csv
+import json
+import math
+import os
+from array import array
+from functools import lru_cache
+
+HISTOGRAM_BINS = 10
+PERCENTILES = (25, 75, 90)
+
+
+@lru_cache(maxsize=None)
+def _numpy():
+    """
+    Imports NumPy on first use, so importing this module stays cheap.
+
+    Returns:
+        module: numpy, or None when it isn't installed.
+    """
+    try:
+        import numpy
+    except ImportError:
+        return None
+    return numpy
+
+
+def _is_float32(ratings):
+    return isinstance(ratings, array) and ratings.typecode == "f"
+
+
+def _as_numpy(ratings):
+    """
+    Wraps an array of ratings without copying it.
+
+    float32 columns (see CompactCatalog) are widened and rounded to 6
+    decimals, so 8.8 doesn't come back as 8.800000190734863.
+    """
+    np = _numpy()
+    if isinstance(ratings, array):
+        values = np.frombuffer(ratings, dtype=ratings.typecode)
+    else:
+        values = np.asarray(ratings)
+    values = values.astype(np.float64)
+    if _is_float32(ratings):
+        values = values.round(6)
+    return values
+
+
+def _as_list(ratings):
+    """
+    Returns the ratings as Python floats, rounding float32 columns like _as_numpy.
+    """
+    if _is_float32(ratings):
+        return [round(rating, 6) for rating in ratings]
+    return ratings
+
+
+def _percentile(ordered, percent):
+    """
+    Returns a percentile of a sorted list with linear interpolation,
+    the way numpy.percentile does by default.
+    """
+    position = percent / 100 * (len(ordered) - 1)
+    lower = math.floor(position)
+    upper = min(lower + 1, len(ordered) - 1)
+    return ordered[lower] + (ordered[upper] - ordered[lower]) * (position - lower)
+
+
+def histogram(ratings, bins=HISTOGRAM_BINS):
+    """
+    Bins the ratings into equal width bins between the lowest and highest rating.
+
+    Uses numpy.histogram when NumPy is installed, and the same binning in
+    pure Python otherwise (the last bin includes the highest rating).
+
+    Args:
+        ratings (array): The ratings, e.g. from IStorage.ratings_array().
+        bins (int): The number of bins.
+
+    Returns:
+        tuple: (counts, edges) lists, with len(edges) == len(counts) + 1,
+        or None when there are no ratings.
+    """
+    if not len(ratings):
+        return None
+    np = _numpy()
+    if np is not None:
+        counts, edges = np.histogram(_as_numpy(ratings), bins=bins)
+        return counts.tolist(), edges.tolist()
+    ratings = _as_list(ratings)
+    low, high = min(ratings), max(ratings)
+    if low == high:
+        low, high = low - 0.5, high + 0.5
+    width = (high - low) / bins
+    edges = [low + i * width for i in range(bins)] + [high]
+    counts = [0] * bins
+    for rating in ratings:
+        counts[min(int((rating - low) / width), bins - 1)] += 1
+    return counts, edges
+
+
+def summary(ratings, percents=PERCENTILES):
+    """
+    Calculates distribution statistics of the ratings in bulk.
+
+    Returns:
+        dict: count, mean, median, std (population), min, max and the
+        percents as "p25", "p75", ..., or None when there are no ratings.
+    """
+    if not len(ratings):
+        return None
+    np = _numpy()
+    if np is not None:
+        values = _as_numpy(ratings)
+        result = {
+            "count": int(values.size),
+            "mean": float(values.mean()),
+            "median": float(np.median(values)),
+            "std": float(values.std()),
+            "min": float(values.min()),
+            "max": float(values.max())
+        }
+        for percent, value in zip(percents, np.percentile(values, percents)):
+            result[f"p{percent}"] = float(value)
+        return result
+    ordered = sorted(_as_list(ratings))
+    mean = math.fsum(ordered) / len(ordered)
+    result = {
+        "count": len(ordered),
+        "mean": mean,
+        "median": _percentile(ordered, 50),
+        "std": math.sqrt(math.fsum((rating - mean) ** 2 for rating in ordered) / len(ordered)),
+        "min": ordered[0],
+        "max": ordered[-1]
+    }
+    for percent in percents:
+        result[f"p{percent}"] = _percentile(ordered, percent)
+    return result
+
+
+def export_histogram(counts, edges, file_name):
+    """
+    Writes the histogram bins to a .csv or .json file, without matplotlib.
+
+    Every bin is written as its lower edge, upper edge and count.
+
+    Raises:
+        ValueError: If the file extension is neither .csv nor .json.
+    """
+    bins = [{"lower": lower, "upper": upper, "count": count}
+            for lower, upper, count in zip(edges, edges[1:], counts)]
+    extension = os.path.splitext(file_name)[1].lower()
+    if extension == ".json":
+        with open(file_name, "w") as file_obj:
+            json.dump(bins, file_obj, indent=4)
+    elif extension == ".csv":
+        with open(file_name, "w", newline="") as file_obj:
+            writer = csv.DictWriter(file_obj, fieldnames=["lower", "upper", "count"])
+            writer.writeheader()
+            writer.writerows(bins)
+    else:
+        raise ValueError(f"Unsupported histogram export format: {extension}")
@@ -0,0 +1,237 @@
+import math
+from bisect import bisect_left, insort
+from heapq import merge
+from sorted_index import SortedIndex
+
+
+def _median(ordered):
+    """
+    Returns the median of an already sorted list.
+    """
+    middle = len(ordered) // 2
+    if len(ordered) % 2:
+        return ordered[middle]
+    return (ordered[middle - 1] + ordered[middle]) / 2
+
+
+def _group_summary(ratings, total):
+    """
+    Summarises a sorted list of ratings whose sum is total.
+    """
+    return {
+        "count": len(ratings),
+        "average": total / len(ratings),
+        "median": _median(ratings),
+        "min": ratings[0],
+        "max": ratings[-1]
+    }
+
+
+def merge_groups(groups):
+    """
+    Summarises several (sorted ratings, sum) groups as one, e.g. the
+    years of a decade or the same year in several shards.
+    """
+    groups = list(groups)
+    return _group_summary(list(merge(*(ratings for ratings, _ in groups))),
+                          sum(total for _, total in groups))
+
+
+class RatingStats:
+    """
+    Rating aggregates that are maintained incrementally.
+
+    The movies are kept in a SortedIndex ordered by (-rating, position),
+    where position is the order the movie was added in. Iterating it
+    gives the movies best first, which top() pages through without
+    sorting. The best movie is the first entry, the worst is the first
+    entry of the last rating group, and the median is read by index.
+    Ties resolve to the movie that was added first, like max()/min() over
+    the catalog do. Every year keeps its own sorted list of ratings for
+    the per-year and per-decade breakdowns.
+    """
+
+    def __init__(self, movies=()):
+        """
+        Args:
+            movies (iterable): (title, movie_info) tuples in catalog order.
+        """
+        self._entries = {}
+        self._ordered = []
+        self._sum = 0.0
+        self._sum_squares = 0.0
+        self._years = {}
+        self._next_position = 0
+        for title, movie_info in movies:
+            self._insert(title, movie_info['rating'], movie_info['year'], sort=False)
+        self._ordered = SortedIndex(self._ordered)
+        for ratings, _ in self._years.values():
+            ratings.sort()
+
+    def __len__(self):
+        return len(self._ordered)
+
+    def _insert(self, title, rating, year, sort=True, position=None):
+        if position is None:
+            position = self._next_position
+            self._next_position += 1
+        self._entries[title] = (rating, year, position)
+        self._sum += rating
+        self._sum_squares += rating * rating
+        year_group = self._years.setdefault(year, [[], 0.0])
+        year_group[1] += rating
+        if sort:
+            self._ordered.add((-rating, position, title))
+            insort(year_group[0], rating)
+        else:
+            self._ordered.append((-rating, position, title))
+            year_group[0].append(rating)
+
+    def add(self, title, rating, year):
+        """
+        Adds a movie. A title that is already counted is replaced.
+        """
+        if title in self._entries:
+            self.remove(title)
+        self._insert(title, rating, year)
+
+    def remove(self, title):
+        """
+        Removes a movie. Unknown titles are ignored.
+
+        Returns:
+            tuple: The (rating, year, position) of the removed movie, or None.
+        """
+        entry = self._entries.pop(title, None)
+        if entry is None:
+            return None
+        rating, year, position = entry
+        self._ordered.remove((-rating, position, title))
+        year_group = self._years[year]
+        del year_group[0][bisect_left(year_group[0], rating)]
+        year_group[1] -= rating
+        if not year_group[0]:
+            del self._years[year]
+        self._sum = self._sum - rating if self._ordered else 0.0
+        self._sum_squares = self._sum_squares - rating * rating if self._ordered else 0.0
+        return entry
+
+    def update(self, title, rating):
+        """
+        Changes the rating of a movie, keeping its position for tie breaking.
+        """
+        entry = self.remove(title)
+        if entry is not None:
+            self._insert(title, rating, entry[1], position=entry[2])
+
+    def _ties(self, index):
+        """
+        Returns the titles that share the rating of the entry at index.
+        """
+        negative_rating = self._ordered[index][0]
+        start = self._ordered.bisect_left((negative_rating,))
+        end = self._ordered.bisect_right((negative_rating, float("inf")))
+        return [title for _, _, title in self._ordered.islice(start, end)]
+
+    def top(self, n=None, offset=0):
+        """
+        Lazily yields the titles best rated first, skipping offset titles.
+
+        Ties are ordered by the position the movies were added in.
+        """
+        stop = None if n is None else offset + n
+        for _, _, title in self._ordered.islice(offset, stop):
+            yield title
+
+    def summary(self):
+        """
+        Returns the rating statistics of all the movies.
+
+        Returns:
+            dict: count, average, median, best and worst ((title, rating)
+            tuples) and the titles tied for best and worst, or None when
+            there are no movies.
+        """
+        count = len(self._ordered)
+        if not count:
+            return None
+        middle = count // 2
+        if count % 2:
+            median = -self._ordered[middle][0]
+        else:
+            median = -(self._ordered[middle - 1][0] + self._ordered[middle][0]) / 2
+        best_rating = -self._ordered[0][0]
+        worst_rating = -self._ordered[-1][0]
+        best_ties = self._ties(0)
+        worst_ties = self._ties(count - 1)
+        return {
+            "count": count,
+            "average": self._sum / count,
+            "median": median,
+            "best": (best_ties[0], best_rating),
+            "worst": (worst_ties[0], worst_rating),
+            "best_ties": best_ties,
+            "worst_ties": worst_ties
+        }
+
+    def percentile(self, percent):
+        """
+        Returns a percentile of the ratings, read by index, with linear
+        interpolation like rating_analytics.summary.
+        """
+        count = len(self._ordered)
+        position = percent / 100 * (count - 1)
+        lower = math.floor(position)
+        upper = min(lower + 1, count - 1)
+        # The index is ordered best first, so the k-th lowest rating is
+        # count - 1 - k entries in.
+        low = -self._ordered[count - 1 - lower][0]
+        high = -self._ordered[count - 1 - upper][0]
+        return low + (high - low) * (position - lower)
+
+    def distribution(self, percents):
+        """
+        Returns the standard deviation (population) of the ratings, from
+        the running sums, and the percents as "p25", "p75", ...
+
+        Returns:
+            dict: std and the percentiles, or None when there are no movies.
+        """
+        count = len(self._ordered)
+        if not count:
+            return None
+        mean = self._sum / count
+        result = {"std": math.sqrt(max(self._sum_squares / count - mean * mean, 0.0))}
+        for percent in percents:
+            result[f"p{percent}"] = self.percentile(percent)
+        return result
+
+    def ratings(self):
+        """
+        Lazily yields the ratings, best first.
+        """
+        for negative_rating, _, _ in self._ordered:
+            yield -negative_rating
+
+    def year_groups(self):
+        """
+        Returns the sorted ratings and their sum per release year.
+        The lists are the live aggregates and must not be changed.
+        """
+        return {year: (ratings, total) for year, (ratings, total) in self._years.items()}
+
+    def by_year(self):
+        """
+        Returns count, average, median, min and max per release year.
+        """
+        return {year: _group_summary(ratings, total)
+                for year, (ratings, total) in sorted(self._years.items())}
+
+    def by_decade(self):
+        """
+        Returns count, average, median, min and max per decade (e.g. 1990).
+        """
+        decades = {}
+        for year, year_group in self._years.items():
+            decades.setdefault(year - year % 10, []).append(year_group)
+        return {decade: merge_groups(groups) for decade, groups in sorted(decades.items())}
@@ -0,0 +1,181 @@
+import heapq
+from array import array
+from bisect import bisect_left, insort
+from collections import Counter
+
+
+def trigrams(text):
+    """
+    Returns the set of 3 character substrings of text.
+    """
+    return {text[i:i + 3] for i in range(len(text) - 2)}
+
+
+def similarity(query, title):
+    """
+    Returns the score TitleIndex.fuzzy ranks title by: the Dice
+    coefficient of the lowercased trigram sets.
+    """
+    query_grams = trigrams(query.lower())
+    title_grams = trigrams(title.lower())
+    if not query_grams or not title_grams:
+        return 0.0
+    return 2 * len(query_grams & title_grams) / (len(query_grams) + len(title_grams))
+
+
+class TitleIndex:
+    """
+    A trigram inverted index over lowercased movie titles.
+
+    Every title gets an increasing row id, and every trigram maps to a
+    sorted array of the row ids of the titles containing it, so row
+    order is insertion order and a posting costs 4 bytes per title.
+    A substring query walks the smallest posting array of its trigrams
+    in order, checks the others with bisect, and stops once limit titles
+    matched. A sorted list of the lowercased titles answers prefix
+    queries with bisect. The index is updated incrementally with
+    add()/remove().
+    """
+
+    def __init__(self, titles=()):
+        self._postings = {}
+        self._rows = {}
+        # Indexed by row id, None once the title was removed.
+        self._titles = []
+        self._lowered = []
+        self._gram_counts = array("I")
+        self._sorted = []
+        for title in titles:
+            self._index(title)
+        self._sorted.sort()
+
+    def _index(self, title):
+        """
+        Adds title to the postings and appends it to the prefix list.
+        """
+        row = len(self._titles)
+        lowered = title.lower()
+        grams = trigrams(lowered)
+        self._rows[title] = row
+        self._titles.append(title)
+        self._lowered.append(lowered)
+        self._gram_counts.append(len(grams))
+        self._sorted.append((lowered, row))
+        postings = self._postings
+        for gram in grams:
+            if gram in postings:
+                postings[gram].append(row)
+            else:
+                postings[gram] = array("I", (row,))
+
+    def __len__(self):
+        return len(self._rows)
+
+    def __contains__(self, title):
+        return title in self._rows
+
+    def add(self, title):
+        """
+        Adds a title to the index. Titles that are already indexed are ignored.
+        """
+        if title in self._rows:
+            return
+        self._index(title)
+        # Move the new entry from the end of the list to its sorted position.
+        insort(self._sorted, self._sorted.pop())
+
+    def remove(self, title):
+        """
+        Removes a title from the index. Unknown titles are ignored.
+        """
+        row = self._rows.pop(title, None)
+        if row is None:
+            return
+        lowered = self._lowered[row]
+        self._titles[row] = None
+        self._lowered[row] = None
+        del self._sorted[bisect_left(self._sorted, (lowered, row))]
+        for gram in trigrams(lowered):
+            postings = self._postings[gram]
+            del postings[bisect_left(postings, row)]
+            if not postings:
+                del self._postings[gram]
+
+    @staticmethod
+    def _has(postings, row):
+        position = bisect_left(postings, row)
+        return position < len(postings) and postings[position] == row
+
+    def _first(self, rows, limit):
+        """
+        Returns the titles of rows (in insertion order), stopping after limit.
+        """
+        titles = []
+        for row in rows:
+            titles.append(self._titles[row])
+            if limit is not None and len(titles) >= limit:
+                break
+        return titles
+
+    def substring(self, query, limit=None):
+        """
+        Returns the titles containing query (case-insensitive) in insertion order.
+
+        Queries shorter than a trigram can't use the postings and fall
+        back to scanning the lowercased titles.
+        """
+        query = query.lower()
+        grams = trigrams(query)
+        if not grams:
+            return self._first((row for row, lowered in enumerate(self._lowered)
+                                if lowered is not None and query in lowered), limit)
+        postings = []
+        for gram in grams:
+            if gram not in self._postings:
+                return []
+            postings.append(self._postings[gram])
+        postings.sort(key=len)
+        smallest, others = postings[0], postings[1:]
+        candidates = (row for row in smallest
+                      if all(self._has(other, row) for other in others))
+        if len(query) > 3:
+            # Sharing all trigrams doesn't guarantee they are adjacent.
+            candidates = (row for row in candidates if query in self._lowered[row])
+        return self._first(candidates, limit)
+
+    def prefix(self, query, limit=None):
+        """
+        Returns the titles starting with query (case-insensitive) in alphabetical order.
+        """
+        query = query.lower()
+        titles = []
+        position = bisect_left(self._sorted, (query,))
+        while position < len(self._sorted) and self._sorted[position][0].startswith(query):
+            titles.append(self._titles[self._sorted[position][1]])
+            if limit is not None and len(titles) >= limit:
+                break
+            position += 1
+        return titles
+
+    def fuzzy(self, query, limit=10):
+        """
+        Returns the titles ranked by trigram similarity to query, best first.
+
+        The score is the Dice coefficient of the trigram sets, so typos
+        and reordered words still find the title. Only the best limit
+        titles are kept, with a bounded heap.
+        """
+        grams = trigrams(query.lower())
+        if not grams:
+            return self.substring(query, limit)
+        shared = Counter()
+        for gram in grams:
+            shared.update(self._postings.get(gram, ()))
+        gram_counts = self._gram_counts
+        scored = ((2 * common / (len(grams) + gram_counts[row]), -row)
+                  for row, common in shared.items())
+        if limit is None:
+            best = sorted(scored, reverse=True)
+        else:
+            best = heapq.nlargest(limit, scored)
+        return [self._titles[-negative_row] for _, negative_row in best]
@@ -0,0 +1,113 @@
+import json
+import pickle
+
+try:
+    import orjson
+except ImportError:
+    orjson = None
+
+try:
+    import msgpack
+except ImportError:
+    msgpack = None
+
+
+def _plain(data):
+    """
+    Returns data as a dict of dicts, converting a CompactCatalog
+    for the formats that can't fall back to dict() themselves.
+    """
+    if isinstance(data, dict) and all(isinstance(info, dict) for info in data.values()):
+        return data
+    return {title: dict(info) for title, info in data.items()}
+
+
+class JsonSerializer:
+    """
+    Reads and writes catalogs as JSON.
+
+    Uses orjson when it is installed and the json module otherwise.
+    The output is compact by default, pretty=True indents it for
+    people reading the file (at about twice the size and write time).
+    """
+
+    name = "json"
+
+    def __init__(self, pretty=False):
+        self.pretty = pretty
+
+    def dumps(self, data):
+        """
+        Returns data encoded as UTF-8 JSON bytes.
+        """
+        if orjson is not None:
+            return orjson.dumps(data, default=dict,
+                                option=orjson.OPT_INDENT_2 if self.pretty else 0)
+        if self.pretty:
+            return json.dumps(data, indent=4, default=dict).encode("utf-8")
+        return json.dumps(data, separators=(",", ":"), default=dict).encode("utf-8")
+
+    def loads(self, raw):
+        if orjson is not None:
+            return orjson.loads(raw)
+        return json.loads(raw)
+
+
+class PickleSerializer:
+    """
+    Reads and writes catalogs with pickle, which reloads faster than
+    any JSON parser. Only load pickle files you wrote yourself.
+    """
+
+    name = "pickle"
+
+    def dumps(self, data):
+        return pickle.dumps(_plain(data), protocol=pickle.HIGHEST_PROTOCOL)
+
+    def loads(self, raw):
+        return pickle.loads(raw)
+
+
+class MsgpackSerializer:
+    """
+    Reads and writes catalogs as MessagePack, a compact binary format
+    other languages can read too. Needs the msgpack package.
+    """
+
+    name = "msgpack"
+
+    def __init__(self):
+        if msgpack is None:
+            raise ImportError("the msgpack format needs the msgpack package")
+
+    def dumps(self, data):
+        return msgpack.packb(_plain(data))
+
+    def loads(self, raw):
+        return msgpack.unpackb(raw)
+
+
+SERIALIZERS = {
+    "json": JsonSerializer,
+    "pickle": PickleSerializer,
+    "msgpack": MsgpackSerializer
+}
+
+
+def get_serializer(serializer=None, pretty=False):
+    """
+    Returns a serializer for a name from SERIALIZERS, or serializer itself
+    when it already is a serializer. None means compact JSON.
+
+    Raises:
+        ValueError: If the name is unknown.
+    """
+    if serializer is None:
+        return JsonSerializer(pretty)
+    if not isinstance(serializer, str):
+        return serializer
+    if serializer not in SERIALIZERS:
+        raise ValueError(f"Unknown serializer: {serializer}")
+    if serializer == "json":
+        return JsonSerializer(pretty)
+    return SERIALIZERS[serializer]()
@@ -0,0 +1,270 @@
+import json
+import os
+import sys
+from file_utils import append_lines, atomic_write, file_lock
+
+# The movie fields that are shared by all the family members.
+METADATA_FIELDS = ('year', 'poster')
+
+
+class SharedCatalog:
+    """
+    Movie metadata shared by all the family members, plus an index of their ratings.
+
+    Every title's year and poster are stored once. A member's StorageJson
+    opened with this catalog only keeps {"rating": ...} per title in its
+    own file (plus any field where the member's copy differs from the
+    catalog). The catalog also indexes every member's rating per title,
+    so cross-profile questions like "who rated X" or the average rating
+    are answered without loading every member's file.
+
+    The catalog is a JSON file:
+        {"movies": {title: {"year": ..., "poster": ...}},
+         "ratings": {title: {member: rating}}}
+
+    Every member process saves into the same catalog, so changes are
+    never written from this process's copy. Under the catalog's file
+    lock the copy is reloaded if another process changed the catalog,
+    and only the titles that changed are appended to a log next to it:
+        {"title": ..., "metadata": {"year": ..., "poster": ...}}
+        {"title": ..., "member": ..., "rating": ...}  (None: removed)
+    The log is folded back into the JSON file once it reaches
+    compact_threshold entries.
+    """
+
+    def __init__(self, file_path="catalog.json", compact_threshold=1000):
+        self._file_path = file_path
+        self._compact_threshold = compact_threshold
+        self._movies = {}
+        self._ratings = {}
+        self._log_entries = 0
+        self._signature = None
+        with file_lock(self.lock_path, shared=True):
+            self._load()
+
+    @property
+    def file_path(self):
+        return self._file_path
+
+    @property
+    def log_path(self):
+        return self._file_path + ".log"
+
+    @property
+    def lock_path(self):
+        return self._file_path + ".lock"
+
+    def _file_signature(self):
+        """
+        Returns the (mtime, size, inode) of the catalog and of its log.
+        """
+        signature = []
+        for path in (self._file_path, self.log_path):
+            try:
+                stat = os.stat(path)
+                signature.append((stat.st_mtime_ns, stat.st_size, stat.st_ino))
+            except FileNotFoundError:
+                signature.append(None)
+        return tuple(signature)
+
+    def _load(self):
+        """
+        Reads the catalog and replays its log. A torn last line of the log
+        (e.g. the process died while appending) is ignored.
+        """
+        self._movies = {}
+        self._ratings = {}
+        self._log_entries = 0
+        if os.path.exists(self._file_path):
+            with open(self._file_path, "r") as file_obj:
+                catalog = json.load(file_obj)
+            self._movies = catalog.get("movies", {})
+            self._ratings = catalog.get("ratings", {})
+        if os.path.exists(self.log_path):
+            with open(self.log_path, "r") as log_obj:
+                for line in log_obj:
+                    try:
+                        entry = json.loads(line)
+                    except json.JSONDecodeError:
+                        break
+                    self._apply(entry)
+                    self._log_entries += 1
+        self._signature = self._file_signature()
+
+    def _refresh(self):
+        """
+        Reloads the catalog if another process changed it since it was read.
+        """
+        if self._file_signature() != self._signature:
+            with file_lock(self.lock_path, shared=True):
+                self._reload_if_changed()
+
+    def _reload_if_changed(self):
+        """
+        Like _refresh, for callers that already hold the file lock.
+        """
+        if self._file_signature() != self._signature:
+            self._load()
+
+    def _apply(self, entry):
+        """
+        Applies a log entry to the catalog.
+        """
+        title = entry["title"]
+        if "metadata" in entry:
+            self._movies[title] = entry["metadata"]
+        elif entry["rating"] is None:
+            members = self._ratings.get(title, {})
+            members.pop(entry["member"], None)
+            if not members:
+                self._ratings.pop(title, None)
+        else:
+            self._ratings.setdefault(title, {})[entry["member"]] = entry["rating"]
+
+    def save(self):
+        """
+        Saves the catalog atomically and removes the log, whose entries are
+        part of the saved catalog.
+        """
+        with file_lock(self.lock_path):
+            self._reload_if_changed()
+            self._save()
+
+    def _save(self):
+        """
+        Like save, for callers that already hold the file lock.
+        """
+        with atomic_write(self._file_path) as file_obj:
+            json.dump({"movies": self._movies, "ratings": self._ratings}, file_obj)
+        if os.path.exists(self.log_path):
+            os.remove(self.log_path)
+        self._log_entries = 0
+        self._signature = self._file_signature()
+
+    def metadata(self, title):
+        """
+        Returns the shared year and poster of a title, or None if it is unknown.
+        """
+        self._refresh()
+        return self._movies.get(title)
+
+    def join(self, overlay):
+        """
+        Combines a member's overlay with the shared metadata.
+
+        Args:
+            overlay (dict): title -> {"rating": ...} as stored in a member's file.
+                Entries that still hold the full record work as well.
+
+        Returns:
+            dict: title -> full movie_info, like a plain StorageJson loads.
+        """
+        self._refresh()
+        return {title: {**self._movies.get(title, {}), **entry}
+                for title, entry in overlay.items()}
+
+    def split(self, member, movies_data):
+        """
+        Moves the metadata of a member's catalog into the shared catalog
+        and records the member's ratings in the index.
+
+        Titles the catalog doesn't know yet take their metadata from the
+        member. Holding the catalog's file lock, the catalog is brought up
+        to date with the other members' changes, and only the titles whose
+        metadata or rating of member changed are saved, before the overlay
+        is returned.
+
+        Returns:
+            dict: The overlay to store in the member's file.
+        """
+        with file_lock(self.lock_path):
+            self._reload_if_changed()
+            overlay = {}
+            changes = []
+            for title, info in movies_data.items():
+                metadata = self._movies.get(title)
+                if metadata is None:
+                    metadata = {field: info[field] for field in METADATA_FIELDS if field in info}
+                    changes.append({"title": title, "metadata": metadata})
+                entry = {'rating': info['rating']}
+                for field in METADATA_FIELDS:
+                    if field in info and metadata.get(field) != info[field]:
+                        entry[field] = info[field]
+                overlay[title] = entry
+                if self._ratings.get(title, {}).get(member) != info['rating']:
+                    changes.append({"title": title, "member": member, "rating": info['rating']})
+            for title, members in self._ratings.items():
+                if member in members and title not in movies_data:
+                    changes.append({"title": title, "member": member, "rating": None})
+            self._write_changes(changes)
+        return overlay
+
+    def _write_changes(self, changes):
+        """
+        Applies changes to the catalog and appends them to the log, or
+        writes the whole catalog if it doesn't exist yet or once the log
+        would reach compact_threshold.
+        """
+        for entry in changes:
+            self._apply(entry)
+        if not changes:
+            return
+        if (not os.path.exists(self._file_path)
+                or self._log_entries + len(changes) >= self._compact_threshold):
+            self._save()
+            return
+        append_lines(self.log_path, (json.dumps(entry) for entry in changes))
+        self._log_entries += len(changes)
+        self._signature = self._file_signature()
+
+    def who_rated(self, title):
+        """
+        Returns member -> rating for every member who has the title.
+        """
+        self._refresh()
+        return dict(self._ratings.get(title, {}))
+
+    def average_rating(self, title):
+        """
+        Returns the average rating of a title across the members, or None if nobody rated it.
+        """
+        self._refresh()
+        ratings = self._ratings.get(title)
+        if not ratings:
+            return None
+        return sum(ratings.values()) / len(ratings)
+
+    def merged_view(self):
+        """
+        Returns every rated title with its metadata, average and per-member ratings.
+
+        Returns:
+            dict: title -> {"year", "poster", "average_rating", "ratings"}.
+        """
+        self._refresh()
+        return {title: {**self._movies.get(title, {}),
+                        "average_rating": sum(ratings.values()) / len(ratings),
+                        "ratings": dict(ratings)}
+                for title, ratings in self._ratings.items()}
+
+
+def migrate(catalog_path, profile_paths):
+    """
+    Converts full per-member JSON files into overlays of a shared catalog.
+
+    The member name is taken from the file name (john.json -> "John").
+    """
+    from storage_json import StorageJson
+    catalog = SharedCatalog(catalog_path)
+    for profile_path in profile_paths:
+        member = os.path.splitext(os.path.basename(profile_path))[0].capitalize()
+        storage = StorageJson(profile_path, member, catalog=catalog)
+        storage.save_data(storage.get_movies_data())
+        print(f"{profile_path}: {len(storage.get_movies_data())} movies moved to {catalog_path}")
+
+
+if __name__ == "__main__":
+    if len(sys.argv) < 3:
+        print("Usage: python shared_catalog.py catalog.json john.json [sara.json ...]")
+        sys.exit(2)
+    migrate(sys.argv[1], sys.argv[2:])
@@ -0,0 +1,124 @@
+from bisect import bisect_left, bisect_right, insort
+from itertools import islice
+
+
+class SortedIndex:
+    """
+    A sorted list split into blocks of bounded size.
+
+    Inserting into or removing from one big sorted list moves every
+    element after the position. Keeping the values in blocks of at most
+    2 * load values bounds that to a single block, while the maximum of
+    every block is used to find the right block with bisect.
+    """
+
+    def __init__(self, values=(), load=1000):
+        """
+        Args:
+            values (iterable): The initial values, in any order.
+            load (int): The target number of values per block.
+        """
+        self._load = load
+        values = sorted(values)
+        self._blocks = [values[i:i + load] for i in range(0, len(values), load)]
+        self._maxes = [block[-1] for block in self._blocks]
+        self._len = len(values)
+
+    def __len__(self):
+        return self._len
+
+    def __iter__(self):
+        for block in self._blocks:
+            yield from block
+
+    def add(self, value):
+        """
+        Inserts value at its sorted position.
+        """
+        self._len += 1
+        if not self._blocks:
+            self._blocks.append([value])
+            self._maxes.append(value)
+            return
+        position = bisect_left(self._maxes, value)
+        if position == len(self._maxes):
+            position -= 1
+            self._blocks[position].append(value)
+            self._maxes[position] = value
+        else:
+            insort(self._blocks[position], value)
+        if len(self._blocks[position]) > 2 * self._load:
+            block = self._blocks[position]
+            self._blocks[position:position + 1] = [block[:self._load], block[self._load:]]
+            self._maxes[position:position + 1] = [block[self._load - 1], block[-1]]
+
+    def remove(self, value):
+        """
+        Removes one occurrence of value.
+
+        Raises:
+            ValueError: If value is not in the index.
+        """
+        position = bisect_left(self._maxes, value)
+        if position < len(self._blocks):
+            block = self._blocks[position]
+            index = bisect_left(block, value)
+            if index < len(block) and block[index] == value:
+                del block[index]
+                self._len -= 1
+                if not block:
+                    del self._blocks[position]
+                    del self._maxes[position]
+                else:
+                    self._maxes[position] = block[-1]
+                return
+        raise ValueError(f"{value!r} is not in the index")
+
+    def _locate(self, index):
+        """
+        Converts a position in the whole index to (block number, position in block).
+        """
+        if index < 0:
+            index += self._len
+        if not 0 <= index < self._len:
+            raise IndexError("index out of range")
+        for block_number, block in enumerate(self._blocks):
+            if index < len(block):
+                return block_number, index
+            index -= len(block)
+
+    def __getitem__(self, index):
+        block_number, position = self._locate(index)
+        return self._blocks[block_number][position]
+
+    def _position(self, block_position, index_in_block):
+        return sum(len(block) for block in self._blocks[:block_position]) + index_in_block
+
+    def bisect_left(self, value):
+        """
+        Returns the position of the first value that is not less than value.
+        """
+        position = bisect_left(self._maxes, value)
+        if position == len(self._maxes):
+            return self._len
+        return self._position(position, bisect_left(self._blocks[position], value))
+
+    def bisect_right(self, value):
+        """
+        Returns the position after the last value that is not greater than value.
+        """
+        position = bisect_right(self._maxes, value)
+        if position == len(self._maxes):
+            return self._len
+        return self._position(position, bisect_right(self._blocks[position], value))
+
+    def islice(self, start=0, stop=None):
+        """
+        Lazily yields the values from position start up to (not including) stop.
+        """
+        if start >= self._len or (stop is not None and stop <= start):
+            return
+        block_number, position = self._locate(start)
+        values = (value for block in self._blocks[block_number:] for value in block)
+        yield from islice(values, position,
+                          None if stop is None else position + stop - start)
@@ -1,31 +1,233 @@
 import csv
-from istorage import IStorage
+import os
+import time
+from array import array
+from compact_catalog import CompactCatalog
+from file_utils import atomic_write
+from istorage import IStorage, apply_entry
+from movie_query import needed_fields, scan
+from rating_analytics import PERCENTILES, summary
+
+FIELDNAMES = ['title', 'rating', 'year', 'poster']
+
 
 class StorageCsv(IStorage):
-    def __init__(self, file_path):
+    def __init__(self, file_path, streaming=False, columnar=False):
+        """
+        Args:
+            file_path (str): The CSV file holding the movies.
+            streaming (bool): Don't load the whole file up front. Scans read
+                the file row by row and the catalog is only loaded into
+                memory when a command needs random access to it.
+            columnar (bool): Keep the catalog in a memory-compact
+                CompactCatalog instead of a dict of dicts.
+        """
         self._file_path = file_path
-        self._movies_data = self.load_movies_data()
+        self._columnar = columnar
+        with self._file_lock(shared=True):
+            self._movies_data = None if streaming else self.load_movies_data()
+            self._remember_file_signature()
 
     def load_movies_data(self):
         """
         Loads the CSV data from a file.
 
         Returns:
-            dict: The loaded CSV data as a dictionary of dictionaries.
+            dict: The loaded CSV data as a dictionary of dictionaries
+            (a CompactCatalog in columnar mode).
+        """
+        start = time.perf_counter()
+        if self._columnar:
+            movies_data = CompactCatalog(self._read_rows())
+        else:
+            movies_data = dict(self._read_rows())
+        if self.instrumentation is not None:
+            # csv parses while it reads, so disk and parse time can't be told apart.
+            self.instrumentation.record_io("load", type(self).__name__,
+                                           os.path.getsize(self._file_path),
+                                           combined=time.perf_counter() - start)
+        return movies_data
+
+    def _read_rows(self, fields=None):
+        """
+        Reads the CSV file row by row with a plain csv.reader.
+
+        The column positions are looked up once from the header, which
+        avoids the dict DictReader allocates for every row.
+
+        Args:
+            fields (tuple): Leave the poster out of movie_info unless it
+                is in fields (default: all the fields).
+
+        Yields:
+            tuple: (title, movie_info) for every row in the file.
         """
-        movies_data = {}
         with open(self._file_path, mode='r', newline='') as file_obj:
-            reader = csv.DictReader(file_obj)
+            reader = csv.reader(file_obj)
+            header = next(reader, None)
+            if header is None:
+                return
+            title_col = header.index('title')
+            rating_col = header.index('rating')
+            year_col = header.index('year')
+            poster_col = header.index('poster')
+            with_poster = fields is None or 'poster' in fields
             for row in reader:
-                movie_title = row['title']
+                if not row:
+                    continue
                 movie_info = {
-                    'rating': float(row['rating']),
-                    'year': int(row['year']),
-                    'poster': row['poster']
-
+                    'rating': float(row[rating_col]),
+                    'year': int(row[year_col])
                 }
-                movies_data[movie_title] = movie_info
-        return movies_data
+                if with_poster:
+                    movie_info['poster'] = row[poster_col]
+                yield row[title_col], movie_info
+
+    def iter_movies(self):
+        """
+        Iterates over the movies without building the whole catalog.
+
+        When the catalog is already in memory it is iterated directly,
+        otherwise the CSV file is streamed row by row.
+
+        Yields:
+            tuple: (title, movie_info) for every movie.
+        """
+        if self._movies_data is not None:
+            return iter(self.get_movies_data().items())
+        return self._read_rows()
+
+    def search(self, query, limit=None, mode="substring"):
+        """
+        Finds movies by title.
+
+        In streaming mode, before the catalog was loaded, substring
+        searches scan the file instead of loading it to build the index.
+        """
+        if self._movies_data is None and mode == "substring":
+            return self._scan_search(query, limit)
+        return super().search(query, limit, mode)
+
+    def top_rated(self, n=None, offset=0):
+        """
+        Returns a page of the movies ordered by rating, best first.
+
+        In streaming mode, before the catalog was loaded, the file is
+        scanned with a bounded heap instead.
+        """
+        if self._movies_data is None:
+            return self._scan_top_rated(n, offset)
+        return super().top_rated(n, offset)
+
+    def _run_query(self, conditions, order, limit, offset, fields):
+        """
+        Runs a query.
+
+        In streaming mode, before the catalog was loaded, the file is
+        scanned once instead: without an order the scan stops after
+        offset + limit matches, and the posters are only read when the
+        query returns them.
+        """
+        if self._movies_data is None:
+            rows = self._read_rows(needed_fields(conditions, order, fields))
+            return scan(rows, conditions, order, limit, offset, fields)
+        return super()._run_query(conditions, order, limit, offset, fields)
+
+    def ratings_array(self):
+        """
+        Returns all the ratings in one array.
+
+        In streaming mode, before the catalog was loaded, only the
+        ratings are collected from the file.
+        """
+        if self._movies_data is None:
+            return array("d", (info['rating'] for _, info in self._read_rows()))
+        return super().ratings_array()
+
+    def rating_stats(self):
+        """
+        Returns the rating statistics of the catalog.
+
+        In streaming mode, before the catalog was loaded, the file is
+        scanned once instead of being loaded to build the aggregates.
+        """
+        if self._movies_data is None:
+            return self._scan_rating_stats()
+        return super().rating_stats()
+
+    def rating_distribution(self, percents=PERCENTILES):
+        """
+        Returns the standard deviation and percentiles of the ratings.
+
+        In streaming mode, before the catalog was loaded, only the
+        ratings are read from the file and summarised in bulk.
+        """
+        if self._movies_data is None:
+            distribution = summary(self.ratings_array(), percents)
+            if distribution is None:
+                return None
+            return {key: distribution[key]
+                    for key in ["std"] + [f"p{percent}" for percent in percents]}
+        return super().rating_distribution(percents)
+
+    def add_movies(self, movies):
+        """
+        Appends many movies to the CSV file in one go.
+
+        The rows are appended to the end of the file instead of rewriting it.
+        Titles that are already in the loaded catalog (or repeated within
+        the batch) are skipped. In streaming mode the existing file is not
+        checked, and a title appended twice keeps its last row on load.
+        If another process changed the file since it was loaded, the
+        catalog is reloaded after appending, and the changes that aren't
+        saved yet are applied on top again.
+
+        Inside a transaction or batch, or with changes a flush policy
+        deferred, appending would write around them (and a rollback
+        couldn't take the rows back), so the movies are inserted one by
+        one into the snapshot instead, and saved with the other changes.
+
+        Args:
+            movies (iterable): (title, year, rating, poster) tuples.
+
+        Returns:
+            int: The number of movies that were added.
+        """
+        if self._in_transaction or self._batch_depth or self._dirty:
+            return sum(self.insert_movie(title, year, rating, poster)
+                       for title, year, rating, poster in movies)
+        with self._locked(), self._file_lock():
+            stale = self._file_signature() != self._cache_signature
+            write_header = not os.path.exists(self._file_path) or \
+                os.path.getsize(self._file_path) == 0
+            seen = set()
+            added = 0
+            with open(self._file_path, mode='a', newline='') as file_obj:
+                writer = csv.writer(file_obj)
+                if write_header:
+                    writer.writerow(FIELDNAMES)
+                for title, year, rating, poster in movies:
+                    if title in seen or (self._movies_data is not None
+                                         and title in self._movies_data):
+                        continue
+                    seen.add(title)
+                    writer.writerow([title, rating, year, poster])
+                    if self._movies_data is not None:
+                        self._movies_data[title] = {
+                            'year': year,
+                            'rating': rating,
+                            'poster': poster
+                        }
+                        self._on_movie_added(title, self._movies_data[title])
+                    added += 1
+            if stale and self._movies_data is not None:
+                movies_data = self.load_movies_data()
+                for entry in self._pending_entries or ():
+                    apply_entry(movies_data, entry)
+                self._replace_snapshot(movies_data, self._file_signature())
+            else:
+                self._remember_file_signature()
+        return added
 
     def save_data(self, data):
         """
@@ -34,12 +236,17 @@ class StorageCsv(IStorage):
         Args:
             data (dict): The data to be saved.
         """
-        with open(self._file_path, mode='w', newline='') as file_obj:
-            fieldnames = ['title', 'rating', 'year', 'poster']
-            writer = csv.DictWriter(file_obj, fieldnames=fieldnames)
-            writer.writeheader()
-            for movie, info in data.items():
-                writer.writerow({'title': movie, 'rating': info['rating'], 'year': info['year'], 'poster': info['poster']})
+        start = time.perf_counter()
+        with atomic_write(self._file_path, newline='') as file_obj:
+            writer = csv.writer(file_obj)
+            writer.writerow(FIELDNAMES)
+            writer.writerows([movie, info['rating'], info['year'], info['poster']]
+                             for movie, info in data.items())
+        if self.instrumentation is not None:
+            self.instrumentation.record_io("save", type(self).__name__,
+                                           os.path.getsize(self._file_path),
+                                           combined=time.perf_counter() - start)
+        self._remember_file_signature()
 
     def list_movies(self):
         """
@@ -51,14 +258,16 @@ class StorageCsv(IStorage):
           Returns:
           None
           """
-        if self._movies_data:
-            print("List of Movies")
-            for movie, info in self._movies_data.items():
-                print(f'Movie Title: {movie}')
-                print(f"Movie Rating: {info['rating']}")
-                print(f"Movie Year: {info['year']}")
-                print(f"Movie Poster: {info['poster']}")
-        else:
+        found = False
+        for movie, info in self.iter_movies():
+            if not found:
+                print("List of Movies")
+                found = True
+            print(f'Movie Title: {movie}')
+            print(f"Movie Rating: {info['rating']}")
+            print(f"Movie Year: {info['year']}")
+            print(f"Movie Poster: {info['poster']}")
+        if not found:
             print("No available movies in the database.")
 
     def add_movie(self, title, year, rating, poster):
@@ -77,13 +286,7 @@ class StorageCsv(IStorage):
             Returns:
             None
             """
-        if title not in self._movies_data:
-            self._movies_data[title] = {
-                'year': year,
-                'rating': rating,
-                'poster': poster
-            }
-            self.save_data(self._movies_data)
+        if self.insert_movie(title, year, rating, poster):
             print(f"{title} movie has added into the database")
         else:
             print(
@@ -98,12 +301,12 @@ class StorageCsv(IStorage):
             and saves it. The function doesn't need to validate the input.
             """
         movie = title
-        if movie in self._movies_data:
-            print(f"{movie} = {self._movies_data[movie]}")
+        movies_data = self.get_movies_data()
+        if movie in movies_data:
+            print(f"{movie} = {movies_data[movie]}")
             confirm = input(f"Do you want to delete {movie} from the movie database? (Y/N): ")
             if "Y" in confirm.upper():
-                del self._movies_data[movie]
-                self.save_data(self._movies_data)
+                self.remove_movie(movie)
                 print(f"{movie} is deleted from the movie db.")
             else:
                 print(f"{movie} was not deleted.")
@@ -112,8 +315,9 @@ class StorageCsv(IStorage):
 
     def show_single_movie_info(self, title):
 
-        if title in self._movies_data:
-            movie_info = self._movies_data[title]
+        movies_data = self.get_movies_data()
+        if title in movies_data:
+            movie_info = movies_data[title]
             print(f"{title}:")
             print(f"  Rating: {movie_info['rating']}")
             print(f"  Year: {movie_info['year']}")
@@ -128,9 +332,7 @@ class StorageCsv(IStorage):
             and saves it. The function doesn't need to validate the input.
             """
 
-        if title in self._movies_data:
-            self._movies_data[title]["rating"] = rating
-            self.save_data(self._movies_data)
+        if self.set_rating(title, rating):
             print(f"{title} updated with rating {rating}.")
         else:
             print(f"{title} was not found in the movie database.")
@@ -0,0 +1,33 @@
+import os
+from storage_json import StorageJson
+from storage_csv import StorageCsv
+from storage_sharded import MANIFEST, ShardedStorage
+from storage_sqlite import StorageSqlite
+
+STORAGE_TYPES = {
+    ".json": ("JSON", StorageJson),
+    ".csv": ("CSV", StorageCsv),
+    ".db": ("SQLite", StorageSqlite),
+    ".sqlite": ("SQLite", StorageSqlite)
+}
+
+
+def open_storage(storage_file, **options):
+    """
+    Opens a storage, choosing the backend from the file extension.
+    A directory holding a shards.json manifest opens as a ShardedStorage.
+
+    Args:
+        storage_file (str): The catalog file or shard directory.
+        options: Extra keyword arguments for the storage class.
+
+    Returns:
+        tuple: (storage type name, storage), or None for an unknown extension.
+    """
+    if os.path.isfile(os.path.join(storage_file, MANIFEST)):
+        return "Sharded", ShardedStorage(storage_file, **options)
+    extension = os.path.splitext(storage_file)[1].lower()
+    if extension not in STORAGE_TYPES:
+        return None
+    storage_type, storage_class = STORAGE_TYPES[extension]
+    return storage_type, storage_class(storage_file, **options)
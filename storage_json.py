@@ -1,13 +1,44 @@
-from istorage import IStorage
+from istorage import IStorage, apply_entry
+from compact_catalog import CompactCatalog
+from file_utils import append_lines, atomic_write
+from serializers import get_serializer
 import json
+import os
 import statistics
+import time
 
 
 class StorageJson(IStorage):
-    def __init__(self, file_path, family_member_name=None):
+    def __init__(self, file_path, family_member_name=None, journal=False,
+                 compact_threshold=1000, columnar=False, catalog=None,
+                 serializer=None, pretty=False):
+        """
+        Args:
+            file_path (str): The JSON file holding the movies.
+            family_member_name (str): The owner of the file, if any.
+            journal (bool): Append mutations to a sidecar log instead of
+                rewriting the whole JSON file on every change.
+            compact_threshold (int): Number of journal entries after which
+                the log is folded back into the JSON file.
+            columnar (bool): Keep the catalog in a memory-compact
+                CompactCatalog instead of a dict of dicts.
+            catalog (SharedCatalog): Keep the year and poster of the movies
+                in this shared catalog and only the ratings in file_path.
+            serializer (str): The file format, "json" (the default), or
+                "pickle" / "msgpack" for faster reloads, see serializers.py.
+            pretty (bool): Indent the JSON output instead of writing it compactly.
+        """
         self._file_path = file_path
-        self._movies_data = self.load_movies_data()
+        self._catalog = catalog
+        self._columnar = columnar
+        self._serializer = get_serializer(serializer, pretty)
+        self._journal = journal
+        self._compact_threshold = compact_threshold
+        self._journal_entries = 0
         self._family_member_name = family_member_name
+        with self._file_lock(shared=True):
+            self._movies_data = self.load_movies_data()
+            self._remember_file_signature()
 
     @property
     def file_path(self):
@@ -17,6 +48,10 @@ class StorageJson(IStorage):
     def file_path(self, value):
         self._file_path = value
 
+    @property
+    def journal_path(self):
+        return self._file_path + ".log"
+
     @property
     def family_member_name(self):
         return self._family_member_name
@@ -25,20 +60,146 @@ class StorageJson(IStorage):
     def family_member_name(self, value):
         self._family_member_name = value
 
+    @property
+    def member_name(self):
+        """
+        The name the ratings are indexed under in a shared catalog:
+        the family member's name, or the capitalized file name.
+        """
+        if self._family_member_name:
+            return self._family_member_name
+        return os.path.splitext(os.path.basename(self._file_path))[0].capitalize()
+
     def load_movies_data(self):
         """
-        Loads the JSON data from a file.
+        Loads the JSON data (or the serializer's format) from a file.
+
+        If a journal log exists next to the file, its entries are replayed
+        on top of the JSON data, so changes that were not compacted yet
+        are not lost. With a shared catalog the file only holds ratings,
+        which are joined with the catalog's metadata.
         """
-        with open(self._file_path, "r") as file_obj:
-            return json.load(file_obj)
+        start = time.perf_counter()
+        with open(self._file_path, "rb") as file_obj:
+            raw = file_obj.read()
+        read = time.perf_counter()
+        movies_data = self._serializer.loads(raw)
+        if self.instrumentation is not None:
+            self.instrumentation.record_io("load", type(self).__name__, len(raw),
+                                           disk=read - start, parse=time.perf_counter() - read)
+        if self._catalog is not None:
+            movies_data = self._catalog.join(movies_data)
+        self._journal_entries = self._replay_journal(movies_data)
+        if self._columnar:
+            return CompactCatalog(movies_data)
+        return movies_data
 
     def save_data(self, data):
         """
         Saves the data to a JSON file.
+
+        The file is written to a temporary file first and then renamed
+        over the old one, so a crash never leaves a half written catalog.
+        The journal log, whose entries are part of the saved data, is
+        removed afterwards. With a shared catalog the metadata goes to the
+        catalog and only the ratings are written to the file.
+        """
+        if self._catalog is not None:
+            data = self._catalog.split(self.member_name, data)
+        start = time.perf_counter()
+        encoded = self._serializer.dumps(data)
+        serialized = time.perf_counter()
+        with atomic_write(self._file_path, mode="wb") as file_obj:
+            file_obj.write(encoded)
+        if os.path.exists(self.journal_path):
+            os.remove(self.journal_path)
+        self._journal_entries = 0
+        if self.instrumentation is not None:
+            self.instrumentation.record_io("save", type(self).__name__, len(encoded),
+                                           serialize=serialized - start,
+                                           disk=time.perf_counter() - serialized)
+        self._remember_file_signature()
+
+    def _save_pending(self):
         """
-        movie_info_to_save = {movie: info for movie, info in data.items()}
-        with open(self._file_path, "w") as file_obj:
-            json.dump(movie_info_to_save, file_obj, indent=4)
+        Saves the deferred changes with one full write, which also folds
+        in any pending journal log.
+        """
+        self.compact()
+
+    def compact(self):
+        """
+        Folds the journal log back into the JSON file and removes the log.
+
+        Like every save, it merges in the changes other processes made
+        since the file was loaded, see IStorage._save_merged.
+        """
+        self._save_merged(self._pending_entries or ())
+
+    def _file_signature(self):
+        """
+        Returns the signature of the JSON file together with its journal log.
+        """
+        try:
+            journal_stat = os.stat(self.journal_path)
+            journal_signature = journal_stat.st_mtime_ns, journal_stat.st_size
+        except FileNotFoundError:
+            journal_signature = None
+        return super()._file_signature(), journal_signature
+
+    def _replay_journal(self, movies_data):
+        """
+        Applies the journal entries to movies_data.
+
+        A torn last line (e.g. the process died while appending) is
+        ignored, and cut off by the next append, see file_utils.append_lines.
+        Replaying is idempotent, so a crash between compacting the JSON
+        file and removing the log doesn't corrupt anything.
+
+        Returns:
+            int: The number of entries that were replayed.
+        """
+        if not os.path.exists(self.journal_path):
+            return 0
+        entries = 0
+        with open(self.journal_path, "r") as log_obj:
+            for line in log_obj:
+                try:
+                    entry = json.loads(line)
+                except json.JSONDecodeError:
+                    break
+                apply_entry(movies_data, entry)
+                entries += 1
+        return entries
+
+    def _persist(self, entry):
+        """
+        Persists a single mutation.
+
+        Without a journal the whole file is rewritten. With a journal the
+        entry is appended to the log and synced to disk before returning,
+        and the log is compacted once it reaches the compact threshold. If
+        another process changed the file or the log since they were loaded,
+        they are reloaded after appending.
+        """
+        if not self._journal:
+            super()._persist(entry)
+            return
+        start = time.perf_counter()
+        line = json.dumps(entry, default=dict)
+        with self._file_lock():
+            stale = self._file_signature() != self._cache_signature
+            appended = append_lines(self.journal_path, (line,))
+            if stale:
+                self._replace_snapshot(self.load_movies_data(), self._file_signature())
+            else:
+                self._remember_file_signature()
+        if self.instrumentation is not None:
+            self.instrumentation.record_io("journal", type(self).__name__, appended,
+                                           combined=time.perf_counter() - start)
+        self._journal_entries += 1
+        if self._journal_entries >= self._compact_threshold:
+            self.compact()
 
     def list_movies(self):
         """
@@ -51,9 +212,10 @@ class StorageJson(IStorage):
            None
            """
 
-        if self._movies_data:
+        movies_data = self.get_movies_data()
+        if movies_data:
             print("List of Movies")
-            for movie, info in self._movies_data.items():
+            for movie, info in movies_data.items():
                 print(f'Movie Title: {movie}')
                 print(f"Movie Rating: {info.get('rating', 'N/A')}")
                 print(f"Movie Year: {info.get('year', 'N/A')}")
@@ -65,13 +227,7 @@ class StorageJson(IStorage):
         """
         Adds a new movie to the database.
         """
-        if title not in self._movies_data:
-            self._movies_data[title] = {
-                'year': year,
-                'rating': rating,
-                'poster': poster
-            }
-            self.save_data(self._movies_data)
+        if self.insert_movie(title, year, rating, poster):
             print(f"{title} movie has added into the database")
         else:
             print(
@@ -85,12 +241,12 @@ class StorageJson(IStorage):
             and saves it. The function doesn't need to validate the input.
             """
         movie = title
-        if movie in self._movies_data:
-            print(f"{movie} = {self._movies_data[movie]}")
+        movies_data = self.get_movies_data()
+        if movie in movies_data:
+            print(f"{movie} = {movies_data[movie]}")
             confirm = input(f"Do you want to delete {movie} from the movie database? (Y/N): ")
             if "Y" in confirm.upper():
-                del self._movies_data[movie]
-                self.save_data(self._movies_data)
+                self.remove_movie(movie)
                 print(f"{movie} is deleted from the movie db.")
             else:
                 print(f"{movie} was not deleted.")
@@ -101,9 +257,9 @@ class StorageJson(IStorage):
         """
         It shows single movie information from the movie database.
         """
-
-        if title in self._movies_data:
-            movie_info = self._movies_data[title]
+        movies_data = self.get_movies_data()
+        if title in movies_data:
+            movie_info = movies_data[title]
             print(f"{title}:")
             print(f"  Rating: {movie_info['rating']}")
             print(f"  Year: {movie_info['year']}")
@@ -114,9 +270,7 @@ class StorageJson(IStorage):
         """
         Updates a movie's rating in the movies database.
         """
-        if title in self._movies_data:
-            self._movies_data[title]['rating'] = rating
-            self.save_data(self._movies_data)
+        if self.set_rating(title, rating):
             print(f"{title} movie rating have updated in the movie database.")
 
         else:
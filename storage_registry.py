@@ -0,0 +1,147 @@
+import json
+import os
+import sys
+from array import array
+from collections import OrderedDict
+from storage_json import StorageJson
+
+# Lists the profiles of a directory: {"John": "john.json", ...}, file
+# paths relative to the directory. Other JSON files next to the profiles
+# (the default catalog, exported histograms, metrics) aren't profiles.
+MANIFEST = "profiles.json"
+
+
+def _deep_sizeof(obj, seen=None):
+    """
+    Estimates the memory used by obj and everything it references, in bytes.
+
+    Shared objects (e.g. the same title string in a dict and a list) are
+    only counted once.
+    """
+    if seen is None:
+        seen = set()
+    if id(obj) in seen:
+        return 0
+    seen.add(id(obj))
+    size = sys.getsizeof(obj)
+    if isinstance(obj, (str, bytes, bytearray, array, int, float)):
+        return size
+    if isinstance(obj, dict):
+        for key, value in obj.items():
+            size += _deep_sizeof(key, seen) + _deep_sizeof(value, seen)
+    elif isinstance(obj, (list, tuple, set, frozenset)):
+        for item in obj:
+            size += _deep_sizeof(item, seen)
+    elif hasattr(obj, "__dict__"):
+        size += _deep_sizeof(vars(obj), seen)
+    return size
+
+
+class StorageRegistry:
+    """
+    Opens family member storages on demand and keeps a bounded number loaded.
+
+    The profiles are listed in the profiles.json manifest of a directory,
+    but nothing is parsed until a profile is first used. At most capacity
+    storages stay open. The least recently used one is flushed (saving
+    changes deferred by a transaction) and dropped when another one has
+    to be opened.
+    """
+
+    def __init__(self, directory=".", profiles=None, capacity=8,
+                 storage_class=StorageJson, catalog=None):
+        """
+        Args:
+            directory (str): The directory holding the profiles.json manifest.
+            profiles (dict): Explicit profile name -> file path mapping,
+                used instead of the manifest.
+            capacity (int): The maximum number of storages kept open.
+            storage_class (type): The storage used to open a profile file.
+            catalog (SharedCatalog): The shared catalog the profiles are
+                overlays of, if they were migrated to one.
+        """
+        if capacity < 1:
+            raise ValueError("capacity must be at least 1")
+        self._capacity = capacity
+        self._storage_class = storage_class
+        self._catalog = catalog
+        self._profiles = dict(profiles) if profiles is not None \
+            else self.discover(directory)
+        self._open = OrderedDict()
+
+    @staticmethod
+    def discover(directory="."):
+        """
+        Reads the profiles listed in the profiles.json manifest of directory.
+
+        Returns:
+            dict: Profile name -> file path, in the order of the manifest.
+                Empty if directory has no manifest.
+        """
+        manifest_path = os.path.join(directory, MANIFEST)
+        if not os.path.exists(manifest_path):
+            return {}
+        with open(manifest_path, "r") as file_obj:
+            manifest = json.load(file_obj)
+        return {name: os.path.join(directory, file_name)
+                for name, file_name in manifest.items()}
+
+    def names(self):
+        """
+        Returns the names of all the known profiles.
+        """
+        return list(self._profiles)
+
+    def __len__(self):
+        return len(self._profiles)
+
+    def __contains__(self, name):
+        return name in self._profiles
+
+    def is_loaded(self, name):
+        return name in self._open
+
+    def get(self, name):
+        """
+        Returns the storage of a profile, opening it on first access.
+
+        Raises:
+            KeyError: If there is no such profile.
+        """
+        if name in self._open:
+            self._open.move_to_end(name)
+            return self._open[name]
+        if self._catalog is not None:
+            storage = self._storage_class(self._profiles[name], name, catalog=self._catalog)
+        else:
+            storage = self._storage_class(self._profiles[name], name)
+        self._open[name] = storage
+        while len(self._open) > self._capacity:
+            self.evict(next(iter(self._open)))
+        return storage
+
+    def evict(self, name):
+        """
+        Flushes and closes the storage of a loaded profile.
+        """
+        storage = self._open.pop(name)
+        storage.flush()
+        if hasattr(storage, "close"):
+            storage.close()
+
+    def flush_all(self):
+        """
+        Flushes every loaded storage, e.g. before the program exits.
+        """
+        for storage in self._open.values():
+            storage.flush()
+
+    def memory_report(self):
+        """
+        Estimates the memory used by the catalog of every loaded profile.
+
+        Returns:
+            dict: Profile name -> estimated bytes, most recently used last.
+        """
+        return {name: _deep_sizeof(storage.get_movies_data())
+                for name, storage in self._open.items()}
@@ -0,0 +1,489 @@
+import heapq
+import json
+import math
+import os
+import random
+import zlib
+from array import array
+from bisect import bisect_right
+from collections.abc import Mapping
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import ExitStack, contextmanager
+from itertools import chain, islice
+from istorage import IStorage
+from movie_query import order_key, project, year_bounds
+from rating_analytics import PERCENTILES
+from rating_stats import merge_groups
+from search_index import similarity
+from storage_csv import FIELDNAMES, StorageCsv
+from storage_json import StorageJson
+
+MANIFEST = "shards.json"
+SHARD_FORMATS = {"json": StorageJson, "csv": StorageCsv}
+
+
+def _create_empty_shard(file_path, shard_format):
+    with open(file_path, "w", newline="") as file_obj:
+        file_obj.write("{}" if shard_format == "json" else ",".join(FIELDNAMES) + "\r\n")
+
+
+class ShardedView(Mapping):
+    """
+    A read-only title -> movie_info view over all the shards, for the
+    code that expects get_movies_data() to return one mapping.
+    """
+
+    def __init__(self, storage):
+        self._storage = storage
+
+    def __getitem__(self, title):
+        shard = self._storage._shard_containing(title)
+        if shard is None:
+            raise KeyError(title)
+        return shard.get_movies_data()[title]
+
+    def __contains__(self, title):
+        return self._storage._shard_containing(title) is not None
+
+    def __iter__(self):
+        return chain.from_iterable(shard.get_movies_data() for shard in self._storage.shards)
+
+    def __len__(self):
+        return sum(len(shard.get_movies_data()) for shard in self._storage.shards)
+
+
+class ShardedStorage(IStorage):
+    """
+    A catalog spread over several StorageJson or StorageCsv shard files.
+
+    Movies are partitioned by a hash of the title, or by release year
+    ranges. A mutation only rewrites the shard of its movie. The shards
+    are loaded in parallel, scans (search, sort, stats) fan out over a
+    thread pool and their results are merged, and year range queries
+    only read the shards whose years overlap the range.
+
+    The layout is kept in shards.json in the shard directory, so the
+    catalog is reopened with the same partitioning. Transactions are
+    applied per shard: every shard rolls back or saves on its own.
+    """
+
+    def __init__(self, directory, shards=8, partition="hash", year_bounds=None,
+                 shard_format="json", workers=None):
+        """
+        Opens the sharded catalog in directory, creating it if needed.
+
+        Args:
+            directory (str): The directory of the shard files.
+            shards (int): The number of shards of a new hash partitioned catalog.
+            partition (str): "hash" (by title) or "year" (by year_bounds).
+            year_bounds (list): The first year of every shard but the first,
+                e.g. [1970, 2000] for ..1969, 1970..1999 and 2000.. shards.
+            shard_format (str): "json" or "csv".
+            workers (int): Threads for loading and scanning the shards.
+
+        Raises:
+            ValueError: For an unknown partition or format, or year
+                partitioning without year_bounds.
+        """
+        self._file_path = directory
+        manifest_path = os.path.join(directory, MANIFEST)
+        if os.path.exists(manifest_path):
+            with open(manifest_path, "r") as file_obj:
+                manifest = json.load(file_obj)
+        else:
+            if partition not in ("hash", "year"):
+                raise ValueError(f"Unknown partition: {partition}")
+            if shard_format not in SHARD_FORMATS:
+                raise ValueError(f"Unknown shard format: {shard_format}")
+            if partition == "year":
+                if not year_bounds:
+                    raise ValueError("Year partitioning needs year_bounds")
+                shards = len(year_bounds) + 1
+            manifest = {"partition": partition, "shards": shards, "format": shard_format,
+                        "year_bounds": sorted(year_bounds) if partition == "year" else None}
+            os.makedirs(directory, exist_ok=True)
+            for number in range(shards):
+                _create_empty_shard(self._shard_path(directory, number, shard_format),
+                                    shard_format)
+            with open(manifest_path, "w") as file_obj:
+                json.dump(manifest, file_obj, indent=4)
+        self._partition = manifest["partition"]
+        self._year_bounds = manifest["year_bounds"]
+        self._format = manifest["format"]
+        self._executor = ThreadPoolExecutor(workers, thread_name_prefix="shard")
+        storage_class = SHARD_FORMATS[self._format]
+        self.shards = list(self._executor.map(
+            lambda number: storage_class(self._shard_path(directory, number, self._format)),
+            range(manifest["shards"])))
+
+    @staticmethod
+    def _shard_path(directory, number, shard_format):
+        return os.path.join(directory, f"shard-{number:03d}.{shard_format}")
+
+    @property
+    def file_path(self):
+        return self._file_path
+
+    def _map(self, function, shards=None):
+        """
+        Calls function on every shard in the thread pool.
+
+        Returns:
+            list: The results, in shard order.
+        """
+        return list(self._executor.map(function, self.shards if shards is None else shards))
+
+    def _shard_for(self, title, year):
+        """
+        Returns the shard a new movie belongs in.
+        """
+        if self._partition == "hash":
+            return self.shards[zlib.crc32(title.encode("utf-8")) % len(self.shards)]
+        return self.shards[bisect_right(self._year_bounds, year)]
+
+    def _shard_containing(self, title):
+        """
+        Returns the shard holding title, or None if no shard does.
+        """
+        if self._partition == "hash":
+            shard = self.shards[zlib.crc32(title.encode("utf-8")) % len(self.shards)]
+            return shard if title in shard.get_movies_data() else None
+        for shard in self.shards:
+            if title in shard.get_movies_data():
+                return shard
+        return None
+
+    def _shards_between(self, first_year, last_year):
+        """
+        Returns the shards that can hold movies from first_year to last_year.
+        """
+        if self._partition == "hash":
+            return self.shards
+        first = bisect_right(self._year_bounds, first_year)
+        last = bisect_right(self._year_bounds, last_year)
+        return self.shards[first:last + 1]
+
+    def close(self):
+        """
+        Saves pending changes and stops the thread pool.
+        """
+        for shard in self.shards:
+            shard.flush()
+        self._executor.shutdown()
+
+    def _file_signature(self):
+        return tuple(shard._file_signature() for shard in self.shards)
+
+    def catalog_version(self):
+        return tuple(shard.catalog_version() for shard in self.shards)
+
+    def load_movies_data(self):
+        return ShardedView(self)
+
+    def get_movies_data(self):
+        """
+        Returns a read-only view over the shards. Every shard keeps its
+        own snapshot and reloads it when its file changes.
+        """
+        return ShardedView(self)
+
+    def save_data(self, data):
+        """
+        Distributes data over the shards and saves every shard.
+        """
+        parts = [{} for _ in self.shards]
+        for title, info in data.items():
+            parts[self.shards.index(self._shard_for(title, info['year']))][title] = info
+        self._map(lambda shard: shard.save_data(parts[self.shards.index(shard)]))
+
+    def iter_movies(self):
+        return chain.from_iterable(shard.iter_movies() for shard in self.shards)
+
+    def ratings_array(self):
+        ratings = array("d")
+        for shard_ratings in self._map(lambda shard: shard.ratings_array()):
+            ratings.extend(shard_ratings)
+        return ratings
+
+    def random_movie(self, rng=random):
+        """
+        Picks a shard weighted by its size, then a movie in it.
+        """
+        sizes = [len(shard.get_movies_data()) for shard in self.shards]
+        if not sum(sizes):
+            return None
+        shard = rng.choices(self.shards, weights=sizes)[0]
+        return shard.random_movie(rng)
+
+    def insert_movie(self, title, year, rating, poster):
+        """
+        Adds a movie to its shard, rewriting only that shard.
+        """
+        if self._partition == "year" and self._shard_containing(title) is not None:
+            return False
+        return self._shard_for(title, year).insert_movie(title, year, rating, poster)
+
+    def remove_movie(self, title):
+        shard = self._shard_containing(title)
+        return shard is not None and shard.remove_movie(title)
+
+    def set_rating(self, title, rating):
+        shard = self._shard_containing(title)
+        return shard is not None and shard.set_rating(title, rating)
+
+    def set_poster(self, title, poster):
+        shard = self._shard_containing(title)
+        return shard is not None and shard.set_poster(title, poster)
+
+    def add_movies(self, movies):
+        """
+        Adds many movies, saving every shard once.
+        """
+        with self.transaction():
+            return sum(self.insert_movie(title, year, rating, poster)
+                       for title, year, rating, poster in movies)
+
+    def flush(self):
+        self._map(lambda shard: shard.flush())
+
+    def rollback(self):
+        for shard in self.shards:
+            shard.rollback()
+
+    def set_flush_policy(self, policy_factory):
+        """
+        Sets a flush policy on every shard.
+
+        Args:
+            policy_factory (callable): Returns a new FlushPolicy per shard
+                (e.g. lambda: EveryN(100)), or None to save right away.
+        """
+        for shard in self.shards:
+            shard.set_flush_policy(policy_factory() if policy_factory is not None else None)
+
+    @contextmanager
+    def transaction(self):
+        """
+        Opens a transaction on every shard. Only the shards that changed
+        are saved, and if the block raises every shard rolls back.
+        """
+        with ExitStack() as stack:
+            for shard in self.shards:
+                stack.enter_context(shard.transaction())
+            yield self
+
+    @contextmanager
+    def batch(self):
+        with ExitStack() as stack:
+            for shard in self.shards:
+                stack.enter_context(shard.batch())
+            yield self
+
+    def search(self, query, limit=None, mode="substring"):
+        """
+        Searches every shard in parallel and merges the results.
+
+        Substring results come in shard order, prefix results in
+        alphabetical order and fuzzy results by similarity.
+        """
+        results = self._map(lambda shard: shard.search(query, limit, mode))
+        if mode == "prefix":
+            merged = heapq.merge(*results, key=lambda item: item[0].lower())
+        elif mode == "fuzzy":
+            merged = sorted(chain.from_iterable(results),
+                            key=lambda item: -similarity(query, item[0]))
+        else:
+            merged = chain.from_iterable(results)
+        return list(islice(merged, limit))
+
+    def iter_top_rated(self, offset=0):
+        merged = heapq.merge(*(shard.iter_top_rated() for shard in self.shards),
+                             key=lambda item: -item[1]['rating'])
+        return islice(merged, offset, None)
+
+    def top_rated(self, n=None, offset=0):
+        """
+        Takes the best offset + n movies of every shard in parallel and merges them.
+        """
+        stop = None if n is None else offset + n
+        pages = self._map(lambda shard: shard.top_rated(stop))
+        merged = heapq.merge(*pages, key=lambda item: -item[1]['rating'])
+        return list(islice(merged, offset, stop))
+
+    def rating_stats(self):
+        """
+        Combines the rating statistics of the shards.
+
+        The median is found by merging the shards' sorted ratings up to
+        the middle, so no shard is sorted again.
+        """
+        summaries = self._map(lambda shard: shard.rating_stats())
+        live = [(shard, summary) for shard, summary in zip(self.shards, summaries) if summary]
+        if not live:
+            return None
+        count = sum(summary["count"] for _, summary in live)
+        best_rating = max(summary["best"][1] for _, summary in live)
+        worst_rating = min(summary["worst"][1] for _, summary in live)
+        best_ties = [title for _, summary in live if summary["best"][1] == best_rating
+                     for title in summary["best_ties"]]
+        worst_ties = [title for _, summary in live if summary["worst"][1] == worst_rating
+                      for title in summary["worst_ties"]]
+        ratings = heapq.merge(*(shard._stats_index().ratings() for shard, _ in live),
+                              reverse=True)
+        middle = list(islice(ratings, (count - 1) // 2, count // 2 + 1))
+        return {
+            "count": count,
+            "average": sum(summary["average"] * summary["count"] for _, summary in live) / count,
+            "median": sum(middle) / len(middle),
+            "best": (best_ties[0], best_rating),
+            "worst": (worst_ties[0], worst_rating),
+            "best_ties": best_ties,
+            "worst_ties": worst_ties
+        }
+
+    def rating_distribution(self, percents=PERCENTILES):
+        """
+        Combines the standard deviations of the shards, and finds the
+        percentiles by merging the shards' sorted ratings, like the median.
+        """
+        parts = self._map(lambda shard: (shard.rating_stats(),
+                                         shard.rating_distribution(percents)))
+        live = [(summary, distribution) for summary, distribution in parts if summary]
+        if not live:
+            return None
+        count = sum(summary["count"] for summary, _ in live)
+        mean = sum(summary["average"] * summary["count"] for summary, _ in live) / count
+        mean_squares = sum((distribution["std"] ** 2 + summary["average"] ** 2) * summary["count"]
+                           for summary, distribution in live) / count
+        result = {"std": math.sqrt(max(mean_squares - mean * mean, 0.0))}
+        ratings = list(heapq.merge(*(shard._stats_index().ratings() for shard in self.shards),
+                                   reverse=True))
+        for percent in percents:
+            position = percent / 100 * (count - 1)
+            lower = math.floor(position)
+            upper = min(lower + 1, count - 1)
+            # The ratings are best first, so the k-th lowest is count - 1 - k in.
+            low, high = ratings[count - 1 - lower], ratings[count - 1 - upper]
+            result[f"p{percent}"] = low + (high - low) * (position - lower)
+        return result
+
+    def _year_groups(self, shards=None):
+        """
+        Collects the (sorted ratings, sum) groups of every year over the shards.
+        """
+        groups = {}
+        for shard_groups in self._map(lambda shard: shard._stats_index().year_groups(), shards):
+            for year, group in shard_groups.items():
+                groups.setdefault(year, []).append(group)
+        return groups
+
+    def rating_stats_by_year(self):
+        return {year: merge_groups(groups)
+                for year, groups in sorted(self._year_groups().items())}
+
+    def rating_stats_by_decade(self):
+        decades = {}
+        for year, groups in self._year_groups().items():
+            decades.setdefault(year - year % 10, []).extend(groups)
+        return {decade: merge_groups(groups) for decade, groups in sorted(decades.items())}
+
+    def movies_between(self, first_year, last_year):
+        """
+        Returns the movies released from first_year to last_year (inclusive),
+        only reading the shards that can hold them when partitioned by year.
+        """
+        shards = self._shards_between(first_year, last_year)
+        results = self._map(lambda shard: shard.movies_between(first_year, last_year), shards)
+        return list(chain.from_iterable(results))
+
+    def _run_query(self, conditions, order, limit, offset, fields):
+        """
+        Runs a query on the shards in parallel and merges the results.
+
+        When partitioned by year, only the shards whose years overlap a
+        year condition are queried. Every shard returns at most
+        offset + limit movies, already in order, so they are merged
+        without sorting again.
+        """
+        first_year, last_year = year_bounds(conditions)
+        shards = self._shards_between(
+            first_year if first_year is not None else -math.inf,
+            last_year if last_year is not None else math.inf)
+        stop = None if limit is None else offset + limit
+        # The merge needs the field the shards sorted by.
+        shard_fields = fields
+        if order is not None and order[0] != "title" and order[0] not in fields:
+            shard_fields = fields + (order[0],)
+        pages = self._map(
+            lambda shard: shard._run_query(conditions, order, stop, 0, shard_fields), shards)
+        if order is None:
+            merged = chain.from_iterable(pages)
+        else:
+            merged = heapq.merge(*pages, key=order_key(order), reverse=order[1])
+        return [(title, project(movie_info, fields))
+                for title, movie_info in islice(merged, offset, stop)]
+
+    def list_movies(self):
+        """
+        Lists the movies of all the shards along with their ratings, release years, and posters.
+        """
+        found = False
+        for movie, info in self.iter_movies():
+            if not found:
+                print("List of Movies")
+                found = True
+            print(f'Movie Title: {movie}')
+            print(f"Movie Rating: {info.get('rating', 'N/A')}")
+            print(f"Movie Year: {info.get('year', 'N/A')}")
+            print(f"Movie Poster: {info.get('poster', 'N/A')}")
+        if not found:
+            print("No available movies in the database.")
+
+    def add_movie(self, title, year, rating, poster):
+        """
+        Adds a new movie to the database.
+        """
+        if self.insert_movie(title, year, rating, poster):
+            print(f"{title} movie has added into the database")
+        else:
+            print(
+                f"A movie with title: {title}, rating: {rating}, and year: "
+                f"{year} already exists in the movies database.")
+
+    def delete_movie(self, title):
+        """
+        Deletes a movie from the movies database after asking for confirmation.
+        """
+        shard = self._shard_containing(title)
+        if shard is None:
+            print(f'{title} was not found in the movie database')
+            return
+        print(f"{title} = {shard.get_movies_data()[title]}")
+        confirm = input(f"Do you want to delete {title} from the movie database? (Y/N): ")
+        if "Y" in confirm.upper():
+            shard.remove_movie(title)
+            print(f"{title} is deleted from the movie db.")
+        else:
+            print(f"{title} was not deleted.")
+
+    def show_single_movie_info(self, title):
+        """
+        It shows single movie information from the movie database.
+        """
+        shard = self._shard_containing(title)
+        if shard is None:
+            print(f"{title} was not found in the movie database.")
+            return
+        movie_info = shard.get_movies_data()[title]
+        print(f"{title}:")
+        print(f"  Rating: {movie_info['rating']}")
+        print(f"  Year: {movie_info['year']}")
+
+    def update_movie(self, title, rating):
+        """
+        Updates a movie's rating in the movies database.
+        """
+        if self.set_rating(title, rating):
+            print(f"{title} movie rating have updated in the movie database.")
+        else:
+            print(f"{title} was not found in the movie database.")
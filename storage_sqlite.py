@@ -0,0 +1,429 @@
+import math
+import random
+import sqlite3
+from array import array
+from contextlib import nullcontext
+from istorage import IStorage
+from rating_analytics import PERCENTILES
+
+
+class StorageSqlite(IStorage):
+    def __init__(self, file_path):
+        """
+        Opens (and creates, if needed) the SQLite movie database.
+
+        Args:
+            file_path (str): The .db/.sqlite file holding the movies.
+        """
+        self._file_path = file_path
+        # A flush policy may commit from its own thread, under the storage lock.
+        self._connection = sqlite3.connect(file_path, check_same_thread=False)
+        self._connection.execute("PRAGMA journal_mode=WAL")
+        self._connection.execute("PRAGMA synchronous=NORMAL")
+        self._create_schema()
+
+    @property
+    def file_path(self):
+        return self._file_path
+
+    def _create_schema(self):
+        """
+        Creates the movies table and its title, rating and year indexes.
+        """
+        with self._connection:
+            self._connection.execute("""
+                CREATE TABLE IF NOT EXISTS movies (
+                    title TEXT PRIMARY KEY,
+                    rating REAL NOT NULL,
+                    year INTEGER NOT NULL,
+                    poster TEXT
+                )""")
+            self._connection.execute(
+                "CREATE INDEX IF NOT EXISTS idx_movies_title_nocase "
+                "ON movies (title COLLATE NOCASE)")
+            self._connection.execute(
+                "CREATE INDEX IF NOT EXISTS idx_movies_rating ON movies (rating)")
+            self._connection.execute(
+                "CREATE INDEX IF NOT EXISTS idx_movies_year ON movies (year)")
+
+    def _file_signature(self):
+        """
+        Returns a signature that changes with every committed write.
+
+        In WAL mode the database file's mtime doesn't move on commit, so
+        data_version (bumped by other connections) and total_changes
+        (bumped by this one) are used instead.
+        """
+        data_version = self._connection.execute("PRAGMA data_version").fetchone()[0]
+        return data_version, self._connection.total_changes
+
+    def _file_lock(self, shared=False):
+        """
+        SQLite locks the database itself, so no lock file is used.
+        """
+        return nullcontext()
+
+    def close(self):
+        """
+        Closes the database connection.
+        """
+        self._connection.close()
+
+    def get_movies_data(self):
+        """
+        Returns the in-memory snapshot of the database.
+
+        Unlike the file backends, writes go to the database right away and
+        only the commit is deferred, so a dirty storage has no unsaved
+        snapshot to protect. The snapshot is reloaded whenever the
+        signature moved, including after this connection's own writes.
+        """
+        signature = self._file_signature()
+        if self._movies_data is None or signature != self._cache_signature:
+            self.cache_misses += 1
+            self._replace_snapshot(self.load_movies_data(), signature)
+        else:
+            self.cache_hits += 1
+        return self._movies_data
+
+    def load_movies_data(self):
+        """
+        Loads all the movies from the database.
+
+        Returns:
+            dict: The movies as a dictionary of dictionaries.
+        """
+        return dict(self.iter_movies())
+
+    def save_data(self, data):
+        """
+        Replaces the content of the database with data in one transaction.
+
+        Args:
+            data (dict): The data to be saved.
+        """
+        with self._connection:
+            self._connection.execute("DELETE FROM movies")
+            self._connection.executemany(
+                "INSERT INTO movies (title, rating, year, poster) VALUES (?, ?, ?, ?)",
+                ((movie, info['rating'], info['year'], info.get('poster'))
+                 for movie, info in data.items()))
+
+    def _rows_to_movies(self, rows):
+        """
+        Converts (title, rating, year, poster) rows to (title, movie_info) tuples.
+        """
+        return [(title, {'rating': rating, 'year': year, 'poster': poster})
+                for title, rating, year, poster in rows]
+
+    def _get_movie(self, title):
+        row = self._connection.execute(
+            "SELECT rating, year, poster FROM movies WHERE title = ?", (title,)).fetchone()
+        if row is None:
+            return None
+        return {'rating': row[0], 'year': row[1], 'poster': row[2]}
+
+    def random_movie(self, rng=random):
+        """
+        Picks a random movie with one query, skipping to a random position
+        in the table instead of loading it.
+        """
+        (count,) = self._connection.execute("SELECT COUNT(*) FROM movies").fetchone()
+        if not count:
+            return None
+        title, rating, year, poster = self._connection.execute(
+            "SELECT title, rating, year, poster FROM movies LIMIT 1 OFFSET ?",
+            (rng.randrange(count),)).fetchone()
+        return title, {'rating': rating, 'year': year, 'poster': poster}
+
+    def ratings_array(self):
+        """
+        Returns all the ratings in one array, read with a single query.
+        """
+        rows = self._connection.execute("SELECT rating FROM movies ORDER BY rowid")
+        return array("d", (rating for rating, in rows))
+
+    def iter_movies(self):
+        """
+        Iterates over the movies straight from a database cursor.
+
+        Yields:
+            tuple: (title, movie_info) for every movie.
+        """
+        cursor = self._connection.execute(
+            "SELECT title, rating, year, poster FROM movies ORDER BY rowid")
+        for title, rating, year, poster in cursor:
+            yield title, {'rating': rating, 'year': year, 'poster': poster}
+
+    def list_movies(self):
+        """
+           Lists the movies in the database along with their ratings, release years, and posters.
+
+           Returns:
+           None
+           """
+        found = False
+        for movie, info in self.iter_movies():
+            if not found:
+                print("List of Movies")
+                found = True
+            print(f'Movie Title: {movie}')
+            print(f"Movie Rating: {info['rating']}")
+            print(f"Movie Year: {info['year']}")
+            print(f"Movie Poster: {info['poster']}")
+        if not found:
+            print("No available movies in the database.")
+
+    def add_movie(self, title, year, rating, poster):
+        """
+        Adds a new movie to the database.
+        """
+        if self.insert_movie(title, year, rating, poster):
+            print(f"{title} movie has added into the database")
+        else:
+            print(
+                f"A movie with title: {title}, rating: {rating}, and year: " \
+                f"{year} already exists in the movies database.")
+
+    def delete_movie(self, title):
+        """
+            Deletes a movie from the movies database.
+            Only the matching row is deleted, the rest of the database is untouched.
+            """
+        movie = title
+        movie_info = self._get_movie(movie)
+        if movie_info is not None:
+            print(f"{movie} = {movie_info}")
+            confirm = input(f"Do you want to delete {movie} from the movie database? (Y/N): ")
+            if "Y" in confirm.upper():
+                self.remove_movie(movie)
+                print(f"{movie} is deleted from the movie db.")
+            else:
+                print(f"{movie} was not deleted.")
+        else:
+            print(f'{movie} was not found in the movie database')
+
+    def show_single_movie_info(self, title):
+        """
+        It shows single movie information from the movie database.
+        """
+        movie_info = self._get_movie(title)
+        if movie_info is not None:
+            print(f"{title}:")
+            print(f"  Rating: {movie_info['rating']}")
+            print(f"  Year: {movie_info['year']}")
+            print(f"  Poster: {movie_info['poster']}")
+        else:
+            print(f"{title} was not found in the movie database.")
+
+    def update_movie(self, title, rating):
+        """
+        Updates a movie's rating with a single-row UPDATE.
+        """
+        if self.set_rating(title, rating):
+            print(f"{title} movie rating have updated in the movie database.")
+        else:
+            print(f"{title} was not found in the movie database.")
+
+    def _write(self, sql, parameters):
+        """
+        Runs a single-row write and commits it, unless a transaction is open.
+
+        Returns:
+            bool: True if a row was changed.
+        """
+        with self._locked():
+            cursor = self._connection.execute(sql, parameters)
+            self._after_mutation(None)
+            return cursor.rowcount > 0
+
+    def insert_movie(self, title, year, rating, poster):
+        """
+        Adds a movie with a single INSERT, without printing anything.
+        """
+        return self._write(
+            "INSERT OR IGNORE INTO movies (title, rating, year, poster) VALUES (?, ?, ?, ?)",
+            (title, rating, year, poster))
+
+    def remove_movie(self, title):
+        """
+        Deletes a movie with a single DELETE, without printing anything.
+        """
+        return self._write("DELETE FROM movies WHERE title = ?", (title,))
+
+    def set_rating(self, title, rating):
+        """
+        Updates a movie's rating with a single UPDATE, without printing anything.
+        """
+        return self._write("UPDATE movies SET rating = ? WHERE title = ?", (rating, title))
+
+    def set_poster(self, title, poster):
+        """
+        Updates a movie's poster with a single UPDATE, without printing anything.
+        """
+        return self._write("UPDATE movies SET poster = ? WHERE title = ?", (poster, title))
+
+    def add_movies(self, movies):
+        """
+        Adds many movies with executemany in a single transaction.
+
+        Args:
+            movies (iterable): (title, year, rating, poster) tuples.
+
+        Returns:
+            int: The number of movies that were added (existing titles are skipped).
+        """
+        with self._locked():
+            before = self._connection.total_changes
+            self._connection.executemany(
+                "INSERT OR IGNORE INTO movies (title, rating, year, poster) VALUES (?, ?, ?, ?)",
+                ((title, rating, year, poster) for title, year, rating, poster in movies))
+            self._after_mutation(None)
+            return self._connection.total_changes - before
+
+    def _persist(self, entry):
+        """
+        Commits a single write.
+        """
+        self._connection.commit()
+
+    def _save_pending(self):
+        """
+        Commits the SQL transaction left open by transaction(), batch()
+        or the flush policy.
+        """
+        self._connection.commit()
+
+    def rollback(self):
+        """
+        Rolls back the SQL transaction opened by transaction().
+        """
+        with self._locked():
+            self._dirty = False
+            self._mutations += 1
+            self._connection.rollback()
+            # The signature doesn't move back, so drop the snapshot, which
+            # may hold the rolled back writes.
+            self._cache_signature = None
+
+    def search(self, query, limit=None, mode="substring"):
+        """
+        Finds movies by title using SQL LIKE.
+
+        LIKE is case-insensitive for ASCII. Prefix searches use the NOCASE
+        title index. A substring search can't, but the scan runs inside
+        SQLite instead of Python. Fuzzy searches use the in-memory trigram
+        index of the base class.
+        """
+        if mode == "fuzzy":
+            return super().search(query, limit, mode)
+        escaped = query.replace("\\", "\\\\").replace("%", "\\%").replace("_", "\\_")
+        if mode == "substring":
+            pattern, order = f"%{escaped}%", "rowid"
+        elif mode == "prefix":
+            pattern, order = f"{escaped}%", "title COLLATE NOCASE"
+        else:
+            raise ValueError(f"Unknown search mode: {mode}")
+        rows = self._connection.execute(
+            "SELECT title, rating, year, poster FROM movies "
+            f"WHERE title LIKE ? ESCAPE '\\' ORDER BY {order} LIMIT ?",
+            (pattern, -1 if limit is None else limit))
+        return self._rows_to_movies(rows)
+
+    def top_rated(self, n=None, offset=0):
+        """
+        Returns the movies ordered by rating, best first, walking the rating index.
+        """
+        rows = self._connection.execute(
+            "SELECT title, rating, year, poster FROM movies "
+            "ORDER BY rating DESC, rowid LIMIT ? OFFSET ?",
+            (-1 if n is None else n, offset))
+        return self._rows_to_movies(rows)
+
+    def _run_query(self, conditions, order, limit, offset, fields):
+        """
+        Runs a query as a single SELECT, so SQLite filters, sorts and pages
+        it with the rating and year indexes and only the requested columns
+        are read. Title conditions use LIKE, which is case-insensitive
+        for ASCII only.
+        """
+        clauses = []
+        parameters = []
+        if "title" in conditions:
+            title = conditions["title"]
+            escaped = title.replace("\\", "\\\\").replace("%", "\\%").replace("_", "\\_")
+            clauses.append("title LIKE ? ESCAPE '\\'")
+            parameters.append(f"%{escaped}%")
+        for field in ("rating", "year"):
+            low, high = conditions.get(field, (None, None))
+            if low is not None:
+                clauses.append(f"{field} >= ?")
+                parameters.append(low)
+            if high is not None:
+                clauses.append(f"{field} <= ?")
+                parameters.append(high)
+        where = f"WHERE {' AND '.join(clauses)} " if clauses else ""
+        if order is None:
+            order_by = "rowid"
+        else:
+            field, descending = order
+            column = "title COLLATE NOCASE" if field == "title" else field
+            order_by = f"{column}{' DESC' if descending else ''}, rowid"
+        columns = "".join(f", {field}" for field in fields)
+        rows = self._connection.execute(
+            f"SELECT title{columns} FROM movies {where}ORDER BY {order_by} LIMIT ? OFFSET ?",
+            parameters + [-1 if limit is None else limit, offset])
+        return [(row[0], dict(zip(fields, row[1:]))) for row in rows]
+
+    def rating_distribution(self, percents=PERCENTILES):
+        """
+        Calculates the standard deviation with SQL aggregates, and reads
+        every percentile's neighbouring ratings through the rating index.
+        """
+        count, mean, mean_squares = self._connection.execute(
+            "SELECT COUNT(*), AVG(rating), AVG(rating * rating) FROM movies").fetchone()
+        if not count:
+            return None
+        result = {"std": math.sqrt(max(mean_squares - mean * mean, 0.0))}
+        for percent in percents:
+            position = percent / 100 * (count - 1)
+            lower = math.floor(position)
+            rows = self._connection.execute(
+                "SELECT rating FROM movies ORDER BY rating LIMIT 2 OFFSET ?",
+                (lower,)).fetchall()
+            low = rows[0][0]
+            high = rows[-1][0]
+            result[f"p{percent}"] = low + (high - low) * (position - lower)
+        return result
+
+    def rating_stats(self):
+        """
+        Calculates the rating statistics with indexed SQL aggregates.
+
+        Returns:
+            dict: count, average, median, best and worst ((title, rating)
+            tuples) and the titles tied for best and worst, or None when
+            the database is empty.
+        """
+        count, average = self._connection.execute(
+            "SELECT COUNT(*), AVG(rating) FROM movies").fetchone()
+        if not count:
+            return None
+        middle = self._connection.execute(
+            "SELECT rating FROM movies ORDER BY rating LIMIT ? OFFSET ?",
+            (2 - count % 2, (count - 1) // 2)).fetchall()
+        best = self._connection.execute(
+            "SELECT title, rating FROM movies WHERE rating = "
+            "(SELECT MAX(rating) FROM movies) ORDER BY rowid").fetchall()
+        worst = self._connection.execute(
+            "SELECT title, rating FROM movies WHERE rating = "
+            "(SELECT MIN(rating) FROM movies) ORDER BY rowid").fetchall()
+        return {
+            "count": count,
+            "average": average,
+            "median": sum(row[0] for row in middle) / len(middle),
+            "best": best[0],
+            "worst": worst[0],
+            "best_ties": [title for title, _ in best],
+            "worst_ties": [title for title, _ in worst]
+        }
@@ -0,0 +1,43 @@
+import csv
+
+import pytest
+
+from storage_csv import FIELDNAMES, StorageCsv
+
+
+@pytest.fixture
+def catalog(tmp_path):
+    path = tmp_path / "movies.csv"
+    with open(path, "w", newline="") as file_obj:
+        writer = csv.writer(file_obj)
+        writer.writerow(FIELDNAMES)
+        writer.writerow(["Heat", 8.3, 1995, "heat.jpg"])
+    return str(path)
+
+
+def test_rollback_discards_add_movies(catalog):
+    storage = StorageCsv(catalog)
+    with pytest.raises(ValueError):
+        with storage.transaction():
+            assert storage.add_movies([("Alien", 1979, 8.5, "alien.jpg")]) == 1
+            raise ValueError
+    assert "Alien" not in storage.get_movies_data()
+    assert "Alien" not in StorageCsv(catalog).get_movies_data()
+
+
+def test_add_movies_in_batch_is_saved_when_the_batch_ends(catalog):
+    storage = StorageCsv(catalog)
+    with storage.batch():
+        storage.add_movies([("Alien", 1979, 8.5, "alien.jpg")])
+        assert "Alien" not in StorageCsv(catalog).get_movies_data()
+    assert "Alien" in StorageCsv(catalog).get_movies_data()
+
+
+def test_streaming_rating_stats_match_the_loaded_ones(catalog):
+    StorageCsv(catalog).add_movies([("Alien", 1979, 8.5, "alien.jpg"),
+                                    ("Ran", 1985, 8.5, "ran.jpg"),
+                                    ("Cats", 2019, 2.8, "cats.jpg")])
+    streamed = StorageCsv(catalog, streaming=True).rating_stats()
+    assert streamed == StorageCsv(catalog).rating_stats()
+    assert streamed["best_ties"] == ["Alien", "Ran"]
+    assert streamed["worst_ties"] == ["Cats"]